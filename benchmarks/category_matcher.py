@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Benchmark for --only / --keep category matchers.
+
+Times building a matcher from the LUT, loading it from the disk cache and
+from memory, then compares scan throughput of the default scanner with
+selective matchers on the same text.
+
+Usage:
+    python3 benchmarks/category_matcher.py [--megabytes N]
+"""
+
+import os
+import sys
+import re
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import CategoryMatcher, EmojiSubstitution, SubstitutionRules  # noqa: E402
+
+SAMPLE_LINES = (
+    "def handler(request):  # plain ASCII code makes up most of a repository\n" * 40
+    + "    log.info('deploy ✅ shipped 🚀 by 👨‍💻 in 🇩🇪 ⚠️ café 😀')\n"
+)
+
+
+def seconds(run) -> float:
+    """Wall time of one call."""
+    started = time.perf_counter()
+    run()
+    return time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark category-selective matchers.")
+    parser.add_argument("--megabytes", type=float, default=5, metavar="N",
+                        help="Size of the synthetic text in MB (default: 5)")
+    args = parser.parse_args()
+
+    keep_flags = CategoryMatcher.select(keep=["regional_indicator"])
+    with tempfile.TemporaryDirectory() as cache:
+        cache_dir = Path(cache)
+        print(f"{'matcher':<30} {'ms':>8}")
+        print(f"{'build from LUT':<30} {seconds(lambda: CategoryMatcher.compile(keep_flags, cache_dir)) * 1e3:>8.2f}")
+        CategoryMatcher.compile.cache_clear()
+        re.purge()  # as in a fresh process: the pattern must really be compiled again
+        print(f"{'load from disk cache':<30} {seconds(lambda: CategoryMatcher.compile(keep_flags, cache_dir)) * 1e3:>8.2f}")
+        print(f"{'load from memory':<30} {seconds(lambda: CategoryMatcher.compile(keep_flags, cache_dir)) * 1e3:>8.2f}")
+
+    text = SAMPLE_LINES * max(1, int(args.megabytes * 1e6 / len(SAMPLE_LINES.encode("utf-8"))))
+    size = len(text.encode("utf-8"))
+    print(f"\n{size / 1e6:.1f} MB of text")
+    print(f"{'selection':<30} {'seconds':>8} {'MB/s':>8}")
+    selections = [
+        ("default (all)", None),
+        ("--keep regional_indicator", keep_flags),
+        ("--only transport_map_symbols", CategoryMatcher.select(only=["transport_map_symbols"])),
+    ]
+    for label, selection in selections:
+        matcher = CategoryMatcher.compile(selection) if selection is not None else None
+        handler = EmojiSubstitution(rules=SubstitutionRules(matcher=matcher), quiet=True)
+        elapsed = seconds(lambda: handler.process_content(text, "bench"))
+        print(f"{label:<30} {elapsed:>8.3f} {size / elapsed / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
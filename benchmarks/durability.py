@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark for write-back durability levels.
+
+Builds a temporary tree where every file needs cleaning, runs the walk, read
+and scan stages, then times only the write stage (and commit, when batched)
+with each --durability level: in place without fsync, an atomic rename with
+fsync per file, and temporary files committed in batches. The tree is
+rebuilt before every run. Use --dir to benchmark on a particular filesystem,
+as the cost of fsync depends entirely on the device and mount options.
+
+Usage:
+    python3 benchmarks/durability.py [--files N] [--dir DIR]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import EmojiSubstitution, FileWriter, Pipeline, build_clean_pipeline  # noqa: E402
+
+CONTENT = "# status ✅ shipped 🚀\n" + "def handler(request):\n    return render(request, 'index.html')\n" * 40
+
+
+def make_tree(root: Path, files: int):
+    """Write files across 20 directories, all containing emojis."""
+    for i in range(files):
+        directory = root / f"pkg{i % 20}"
+        directory.mkdir(exist_ok=True)
+        (directory / f"module{i}.py").write_text(CONTENT, encoding="utf-8")
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark write-back durability levels.")
+    parser.add_argument("--files", type=int, default=1000, metavar="N", help="Files in the tree (default: 1000)")
+    parser.add_argument("--dir", type=str, default=None, metavar="DIR",
+                        help="Directory to build the tree in (default: the system temp directory)")
+    args = parser.parse_args()
+
+    levels = [("none", 64), ("atomic", 64), ("batched", 16), ("batched", 64), ("batched", 256)]
+    with tempfile.TemporaryDirectory(dir=args.dir) as temp:
+        root = Path(temp)
+        print(f"{args.files} files in {temp}")
+        print(f"{'durability':<16} {'seconds':>9} {'files/s':>10}")
+        for durability, batch_size in levels:
+            make_tree(root, args.files)
+            handler = EmojiSubstitution(writer=FileWriter(durability=durability, batch_size=batch_size), quiet=True)
+            stages = build_clean_pipeline(root, handler).stages
+            split = [name for name, _ in stages].index("write")
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                tasks = list(Pipeline(stages[:split])([root]))
+                started = time.perf_counter()
+                _, modified = Pipeline(stages[split:]).run(tasks)
+                seconds = time.perf_counter() - started
+            assert modified == args.files
+            label = f"batched ({batch_size})" if durability == "batched" else durability
+            print(f"{label:<16} {seconds:>9.3f} {args.files / seconds:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
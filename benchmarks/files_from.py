@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark for --files-from path lists.
+
+Cleans the same tree once with one emoji-nuker process per file, as
+`xargs -0 -n1 emoji-nuker` does, and once with a single process reading
+the list from stdin with --files-from -. Also times parsing a long
+NUL-delimited list on its own.
+
+Usage:
+    python3 benchmarks/files_from.py [--files N] [--list-entries N]
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from emoji_nuker import read_path_list  # noqa: E402
+
+SCRIPT = os.path.join(SRC, "emoji_nuker.py")
+CONTENT = "# status ✅ shipped 🚀\ndef handler(request):\n    return render(request, 'index.html')\n"
+
+
+def make_tree(root: Path, files: int) -> bytes:
+    """Write the files and return their NUL-delimited list, relative to root."""
+    names = []
+    for i in range(files):
+        path = root / f"pkg{i % 10}" / f"module{i}.py"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(CONTENT, encoding="utf-8")
+        names.append(os.fsencode(path.relative_to(root)))
+    return b"\0".join(names) + b"\0"
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark --files-from against one process per file.")
+    parser.add_argument("--files", type=int, default=100, metavar="N", help="Files in the tree (default: 100)")
+    parser.add_argument("--list-entries", type=int, default=1_000_000, metavar="N",
+                        help="Entries in the list parsed on its own (default: 1000000)")
+    args = parser.parse_args()
+
+    print(f"{args.files} files")
+    print(f"{'method':<26} {'seconds':>9} {'files/s':>10}")
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        runs = [
+            ("xargs -0 -n1 (per file)", ["xargs", "-0", "-n1", sys.executable, SCRIPT]),
+            ("--files-from -", [sys.executable, SCRIPT, "--files-from", "-"]),
+        ]
+        for label, command in runs:
+            listing = make_tree(root, args.files)
+            started = time.perf_counter()
+            subprocess.run(command, input=listing, cwd=temp, stdout=subprocess.DEVNULL, check=True)
+            seconds = time.perf_counter() - started
+            print(f"{label:<26} {seconds:>9.3f} {args.files / seconds:>10.0f}")
+
+    listing = b"\0".join(b"src/pkg%d/module%d.py" % (i % 100, i) for i in range(args.list_entries)) + b"\0"
+    started = time.perf_counter()
+    count = sum(1 for _ in read_path_list(io.BufferedReader(io.BytesIO(listing))))
+    seconds = time.perf_counter() - started
+    print(f"\nparsed {count} list entries ({len(listing) / 1e6:.1f} MB) in {seconds:.3f}s "
+          f"({count / seconds:,.0f} paths/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the --stats emoji histogram.
+
+Counts emojis by category in a synthetic text with the pure-Python path, the
+NumPy path (when installed) and a per-character categorize_emoji loop, and
+checks that every path gives the same counts.
+
+Usage:
+    python3 benchmarks/histogram.py [--megabytes N]
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import EMOJI_LUT, EmojiHistogram, is_emoji_for_replacement  # noqa: E402
+
+SAMPLE_LINES = (
+    "def handler(request):  # plain ASCII code makes up most of a repository\n" * 40
+    + "    log.info('deploy ✅ shipped 🚀 by 👨‍💻 in 🇩🇪 ⚠️ 1️⃣ café')\n"
+)
+
+
+def per_char(text: str) -> Counter:
+    """Reference: classify every character with the LUT's if-chain."""
+    counts = Counter()
+    for char in text:
+        if is_emoji_for_replacement(char):
+            counts[EMOJI_LUT.categorize_emoji(char)] += 1
+    return counts
+
+
+def timed(count, text: str):
+    """Return (counts, seconds) for one counting function."""
+    started = time.perf_counter()
+    counts = count(text)
+    return counts, time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark the emoji histogram engines.")
+    parser.add_argument("--megabytes", type=float, default=20, metavar="N",
+                        help="Size of the synthetic text in MB (default: 20)")
+    args = parser.parse_args()
+
+    repeats = max(1, int(args.megabytes * 1e6 / len(SAMPLE_LINES.encode("utf-8"))))
+    text = SAMPLE_LINES * repeats
+    size = len(text.encode("utf-8"))
+
+    engines = [("per-char", per_char), ("python", EmojiHistogram(use_numpy=False).count)]
+    numpy_histogram = EmojiHistogram()
+    if numpy_histogram.engine == "numpy":
+        engines.append(("numpy", numpy_histogram.count))
+    else:
+        print("NumPy is not installed; skipping the NumPy path")
+
+    print(f"{size / 1e6:.1f} MB of text")
+    print(f"{'engine':<10} {'seconds':>9} {'MB/s':>9}")
+    expected = None
+    for name, count in engines:
+        counts, seconds = timed(count, text)
+        if expected is None:
+            expected = counts
+        elif counts != expected:
+            raise AssertionError(f"{name} counts differ from the per-character reference")
+        print(f"{name:<10} {seconds:>9.3f} {size / seconds / 1e6:>9.1f}")
+    print(f"✓ {len(engines)} engines agree on {sum(expected.values())} emoji codepoints")
+
+
+if __name__ == "__main__":
+    main()
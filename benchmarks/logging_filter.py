@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the emoji logging filter.
+
+Measures the per-record cost of EmojiFilter for typical log messages and
+what it adds up to at 1M records per minute, as a share of one CPU core.
+
+Usage:
+    python3 benchmarks/logging_filter.py [--records N]
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_logging import EmojiFilter  # noqa: E402
+from emoji_nuker import SubstitutionRules  # noqa: E402
+
+RECORDS_PER_MINUTE = 1_000_000
+
+CASES = [
+    ("ascii", "GET /api/v1/users/%s returned %d in %.1fms", ("4821", 200, 12.5)),
+    ("non-ascii, no emoji", "Benutzer %s hat sich angemeldet (Größe %d)", ("José Müller", 42)),
+    ("emoji in msg", "Deploy finished ✅ on %s", ("prod-eu-1",)),
+    ("emoji in args", "Comment from %s: %s", ("alice", "love it 😍🔥 thanks!")),
+]
+
+
+def per_record_seconds(emoji_filter: EmojiFilter, msg: str, args: tuple, records: int) -> float:
+    """Average seconds spent in filter() per record, excluding record creation."""
+    batch = [logging.LogRecord("bench", logging.INFO, __file__, 1, msg, args, None) for _ in range(records)]
+    started = time.perf_counter()
+    for record in batch:
+        emoji_filter.filter(record)
+    return (time.perf_counter() - started) / records
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark the emoji logging filter.")
+    parser.add_argument("--records", type=int, default=100_000, metavar="N",
+                        help="Records per case (default: 100000)")
+    args = parser.parse_args()
+
+    rate = RECORDS_PER_MINUTE / 60
+    print(f"{'case':<22} {'mode':<11} {'us/record':>10} {'core % at 1M/min':>17}")
+    for mode, rules in (("remove", SubstitutionRules()), ("substitute", SubstitutionRules(substitute=True))):
+        emoji_filter = EmojiFilter(rules)
+        for name, msg, record_args in CASES:
+            seconds = per_record_seconds(emoji_filter, msg, record_args, args.records)
+            print(f"{name:<22} {mode:<11} {seconds * 1e6:>10.2f} {100 * seconds * rate:>16.2f}%")
+
+
+if __name__ == "__main__":
+    main()
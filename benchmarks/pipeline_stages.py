@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the stages of the cleaning pipeline.
+
+Builds a temporary tree and runs each stage of build_clean_pipeline on its
+own over the materialized output of the stage before it (walk, read, scan,
+write), then the whole pipeline sequentially and with thread pools for
+reading and writing. Stage messages are discarded while timing.
+
+Usage:
+    python3 benchmarks/pipeline_stages.py [--files N] [--threads N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import EmojiSubstitution, PipelinedCleaner, build_clean_pipeline  # noqa: E402
+
+PLAIN = "def handler(request):\n    return render(request, 'index.html', {'items': items})\n" * 40
+EMOJI = "# status ✅ shipped 🚀\n" + PLAIN
+
+
+def make_tree(root: Path, files: int):
+    """Write files across 20 directories; every fifth file contains emojis."""
+    for i in range(files):
+        directory = root / f"pkg{i % 20}"
+        directory.mkdir(exist_ok=True)
+        (directory / f"module{i}.py").write_text(EMOJI if i % 5 == 0 else PLAIN, encoding="utf-8")
+
+
+def timed(run):
+    """Return (result, seconds) with stdout discarded."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        result = run()
+        return result, time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the cleaning pipeline.")
+    parser.add_argument("--files", type=int, default=2000, metavar="N", help="Files in the tree (default: 2000)")
+    parser.add_argument("--threads", type=int, default=8, metavar="N",
+                        help="Read threads for the parallel run (default: 8)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        make_tree(root, args.files)
+        handler = EmojiSubstitution(quiet=True)
+        stages = dict(build_clean_pipeline(root, handler).stages)
+
+        print(f"{args.files} files")
+        print(f"{'stage':<22} {'seconds':>9} {'files/s':>10}")
+        items = [root]
+        for name in ("walk", "read", "scan", "write"):
+            items, seconds = timed(lambda: list(stages[name](items)))
+            print(f"{name:<22} {seconds:>9.3f} {len(items) / seconds:>10.0f}")
+
+        for label, engine in (("pipeline (sequential)", None),
+                              (f"pipeline ({args.threads} threads)",
+                               PipelinedCleaner(handler, args.threads, 2, 64))):
+            make_tree(root, args.files)
+            pipeline = build_clean_pipeline(root, EmojiSubstitution(quiet=True), engine)
+            (processed, modified), seconds = timed(lambda: pipeline.run([root]))
+            print(f"{label:<22} {seconds:>9.3f} {processed / seconds:>10.0f}  ({modified} modified)")
+
+
+if __name__ == "__main__":
+    main()
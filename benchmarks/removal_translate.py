@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the str.translate removal fast path.
+
+Removes emojis from a synthetic text with the run-based span scanner and with
+remove_emojis_fast, and checks that both give the same text. Then cleans a
+temporary tree through the cleaning pipeline with the handler the command
+line builds by default, against the same handler forced onto the scanner.
+
+Usage:
+    python3 benchmarks/removal_translate.py [--megabytes N] [--files N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import (EmojiSubstitution, apply_changes, build_clean_pipeline,  # noqa: E402
+                         remove_emojis_fast, removal_table)
+
+SAMPLE_LINES = (
+    "def handler(request):  # plain ASCII code makes up most of a repository\n" * 40
+    + "    log.info('deploy ✅ shipped 🚀 by 👨‍💻 in 🇩🇪 ⚠️ 1️⃣ café 火')\n"
+)
+
+
+class SpanRemoval(EmojiSubstitution):
+    """The command line's default handler, as it was before it used the fast path."""
+    plain_removal = False
+
+
+def clean_tree(root: Path, files: int, handler: EmojiSubstitution) -> float:
+    """Write a fresh tree and clean it through the pipeline; returns seconds."""
+    for i in range(files):
+        (root / f"module{i}.py").write_text(SAMPLE_LINES * 10, encoding="utf-8")
+    pipeline = build_clean_pipeline(root, handler)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        pipeline.run([root])
+        return time.perf_counter() - started
+
+
+def timed(remove, text: str):
+    """Return (cleaned, seconds) for one removal function."""
+    started = time.perf_counter()
+    cleaned = remove(text)
+    return cleaned, time.perf_counter() - started
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark emoji removal engines.")
+    parser.add_argument("--megabytes", type=float, default=5, metavar="N",
+                        help="Size of the synthetic text in MB (default: 5)")
+    parser.add_argument("--files", type=int, default=300, metavar="N",
+                        help="Files in the tree for the pipeline comparison (default: 300)")
+    args = parser.parse_args()
+
+    repeats = max(1, int(args.megabytes * 1e6 / len(SAMPLE_LINES.encode("utf-8"))))
+    text = SAMPLE_LINES * repeats
+    size = len(text.encode("utf-8"))
+    handler = EmojiSubstitution(quiet=True)
+    removal_table()  # built once per process, not per call
+
+    engines = [
+        ("span scanner", lambda content: apply_changes(content, handler.find_changes(content, "bench"))),
+        ("str.translate", remove_emojis_fast),
+        ("str.translate (no ASCII line)", None),
+    ]
+    print(f"{size / 1e6:.1f} MB of text")
+    print(f"{'engine':<28} {'seconds':>9} {'MB/s':>9}")
+    expected = None
+    for name, remove in engines:
+        if remove is None:
+            # Worst case for translate: no line can be skipped, every character is looked up
+            sample = text.replace("e", "é")
+            _, seconds = timed(remove_emojis_fast, sample)
+            print(f"{name:<28} {seconds:>9.3f} {len(sample.encode('utf-8')) / seconds / 1e6:>9.1f}")
+            continue
+        cleaned, seconds = timed(remove, text)
+        if expected is None:
+            expected = cleaned
+        elif cleaned != expected:
+            raise AssertionError(f"{name} output differs from the span scanner")
+        print(f"{name:<28} {seconds:>9.3f} {size / seconds / 1e6:>9.1f}")
+    print("✓ engines produce identical text")
+
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        tree_size = args.files * len((SAMPLE_LINES * 10).encode("utf-8"))
+        print(f"\n{args.files} files, {tree_size / 1e6:.1f} MB, through the cleaning pipeline")
+        print(f"{'handler':<28} {'seconds':>9} {'MB/s':>9}")
+        for name, handler in (("default (span scanner)", SpanRemoval()), ("default (str.translate)", EmojiSubstitution())):
+            seconds = clean_tree(root, args.files, handler)
+            print(f"{name:<28} {seconds:>9.3f} {tree_size / seconds / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
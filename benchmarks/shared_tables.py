@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the shared tables used by --processes workers.
+
+Spawns N workers that each substitute every emoji character the scanner
+knows, once building the LUT inside each worker and once attached to the
+published memory-mapped tables, and reports the mean time a worker spends
+getting through that text, its memory (private pages and proportional set
+size, from /proc/self/smaps_rollup, so Linux only) and whether it built the
+LUT at all.
+
+Usage:
+    python3 benchmarks/shared_tables.py [--workers 1,2,4,8]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import (EMOJI_LUT, EmojiSubstitution, SharedTables, SubstitutionRules,  # noqa: E402
+                         replacement_char_categories)
+
+
+def memory_kb() -> dict:
+    """Private and proportional resident memory of this process in KB."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in ("Pss", "Private_Clean", "Private_Dirty"):
+                values[name] = int(rest.split()[0])
+    return {"private": values["Private_Clean"] + values["Private_Dirty"], "pss": values["Pss"]}
+
+
+def worker(job: tuple) -> tuple:
+    """Substitute text once; returns (seconds, memory, whether the LUT was built)."""
+    tables_path, text = job
+    started = time.perf_counter()
+    tables = SharedTables(tables_path) if tables_path else None
+    handler = EmojiSubstitution(rules=SubstitutionRules(substitute=True, tables=tables), quiet=True)
+    handler.process_content(text, "bench")
+    return time.perf_counter() - started, memory_kb(), "_emoji_chars" in vars(EMOJI_LUT)
+
+
+def run(workers: int, tables_path, text: str) -> tuple:
+    """Mean seconds and memory per worker, and how many built the LUT, across spawned processes."""
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        results = pool.map(worker, [(tables_path, text)] * workers, chunksize=1)
+    seconds = sum(result[0] for result in results) / workers
+    private = sum(result[1]["private"] for result in results) / workers
+    pss = sum(result[1]["pss"] for result in results) / workers
+    return seconds, private, pss, sum(result[2] for result in results)
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark per-worker tables against shared tables.")
+    parser.add_argument("--workers", default="1,2,4,8", metavar="LIST",
+                        help="Comma-separated worker counts (default: 1,2,4,8)")
+    args = parser.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("This benchmark reads /proc/self/smaps_rollup and needs Linux")
+
+    with tempfile.TemporaryDirectory() as cache:
+        started = time.perf_counter()
+        tables_path = SharedTables.publish(Path(cache))
+        print(f"publish tables: {(time.perf_counter() - started) * 1e3:.1f} ms, "
+              f"{tables_path.stat().st_size / 1e6:.2f} MB")
+        text = " ".join(replacement_char_categories())
+        print(f"{'workers':>7} {'tables':<8} {'ms/worker':>10} {'private MB':>11} {'PSS MB':>8} {'built LUT':>10}")
+        for count in (int(value) for value in args.workers.split(",")):
+            for label, path in (("built", None), ("shared", tables_path)):
+                seconds, private, pss, built = run(count, path, text)
+                print(f"{count:>7} {label:<8} {seconds * 1e3:>10.1f} {private / 1024:>11.1f} {pss / 1024:>8.1f} "
+                      f"{built:>6}/{count}")
+
+
+if __name__ == "__main__":
+    main()
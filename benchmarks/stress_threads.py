@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Thread stress test for the emoji substitution engine.
+
+Cleans the same text from an increasing number of threads and checks that
+every result matches a single-threaded run, both with one handler per task
+(sharing SubstitutionRules) and with one handler shared by all threads. Prints
+throughput per thread count; it only scales on free-threaded CPython builds,
+where the GIL is disabled.
+
+Usage:
+    python3 benchmarks/stress_threads.py [--quick] [--max-threads N]
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import EmojiSubstitution, SubstitutionRules  # noqa: E402
+
+SAMPLE_LINE = "status ✅ done 🚀 shipped ❌ failed 😀 happy 🔥 hot 🧪 tested plain ascii text follows here\n"
+
+
+def run(threads: int, tasks: int, text: str, rules: SubstitutionRules, expected: str,
+        shared: EmojiSubstitution = None) -> float:
+    """Clean text `tasks` times on `threads` threads; returns elapsed seconds."""
+    def clean(_):
+        handler = shared if shared is not None else EmojiSubstitution(rules=rules, quiet=True)
+        return handler.process_content(text, "stress")
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(clean, range(tasks)))
+    elapsed = time.perf_counter() - started
+    if any(result != expected for result in results):
+        raise AssertionError(f"results differ from the single-threaded run with {threads} threads")
+    return elapsed
+
+
+def main():
+    """Run the stress test and print a throughput table."""
+    parser = argparse.ArgumentParser(description="Stress the emoji engine from multiple threads.")
+    parser.add_argument("--quick", action="store_true", help="Small run that only checks correctness")
+    parser.add_argument("--max-threads", type=int, default=max(4, os.cpu_count() or 1), metavar="N",
+                        help="Largest thread count to try (default: CPU count, at least 4)")
+    args = parser.parse_args()
+
+    lines, tasks = (50, 16) if args.quick else (2000, 64)
+    text = SAMPLE_LINE * lines
+    rules = SubstitutionRules(substitute=True, label=True)
+    reference = EmojiSubstitution(rules=rules, quiet=True)
+    expected = reference.process_content(text, "stress")
+    per_task = reference.summary.total
+
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+    print(f"{tasks} tasks of {len(text.encode('utf-8'))} bytes each")
+    print(f"{'threads':>8} {'seconds':>9} {'MB/s':>8} {'speedup':>8}")
+
+    threads = 1
+    baseline = None
+    total_bytes = len(text.encode("utf-8")) * tasks
+    while threads <= max(1, args.max_threads):
+        elapsed = run(threads, tasks, text, rules, expected)
+        baseline = baseline or elapsed
+        print(f"{threads:>8} {elapsed:>9.3f} {total_bytes / elapsed / 1e6:>8.2f} {baseline / elapsed:>7.2f}x")
+        threads *= 2
+
+    # One handler shared by every thread must still count every substitution exactly once
+    shared = EmojiSubstitution(rules=rules, quiet=True)
+    run(max(1, args.max_threads), tasks, text, rules, expected, shared)
+    if shared.summary.total != per_task * tasks:
+        raise AssertionError(f"shared handler counted {shared.summary.total} substitutions, "
+                             f"expected {per_task * tasks}")
+    print(f"✓ {tasks} results identical; shared handler counted {shared.summary.total} substitutions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark for run throttling.
+
+Cleans a temporary tree unthrottled and under each kind of limit, and
+reports the wall time, the achieved byte, file and CPU rates, and how long
+the run slept. Then simulates a disk that slows down for two seconds
+(reads take ten times longer) and counts the reads issued while it is slow,
+with and without --backoff, which should cut the read rate and recover once
+latency is back to normal.
+
+Usage:
+    python3 benchmarks/throttle.py [--files N]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import emoji_nuker  # noqa: E402
+from emoji_nuker import EmojiSubstitution, Throttle, build_clean_pipeline  # noqa: E402
+
+CONTENT = "def handler(request):\n    return render(request, 'index.html')\n" * 200 + "# shipped ✅\n"
+
+
+def make_tree(root: Path, files: int):
+    """Write files that all contain an emoji, so every file is read and written."""
+    for i in range(files):
+        (root / f"module{i}.py").write_text(CONTENT, encoding="utf-8")
+
+
+def run(root: Path, files: int, throttle) -> tuple:
+    """Clean a fresh tree; returns (seconds, cpu seconds, throttle)."""
+    make_tree(root, files)
+    pipeline = build_clean_pipeline(root, EmojiSubstitution(quiet=True, throttle=throttle))
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started, cpu = time.perf_counter(), time.process_time()
+        pipeline.run([root])
+        return time.perf_counter() - started, time.process_time() - cpu, throttle
+
+
+@contextlib.contextmanager
+def slow_disk(slow_from: float, slow_until: float, delay: float, slow_reads: list):
+    """Make reads sleep for delay seconds between slow_from and slow_until seconds from now, counting them."""
+    original = Path.read_bytes
+    started = time.perf_counter()
+
+    def read_bytes(path):
+        if slow_from <= time.perf_counter() - started < slow_until:
+            slow_reads.append(path)
+            time.sleep(delay)
+        else:
+            time.sleep(delay / 10)
+        return original(path)
+
+    Path.read_bytes = read_bytes
+    try:
+        yield
+    finally:
+        Path.read_bytes = original
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark token-bucket throttling.")
+    parser.add_argument("--files", type=int, default=400, metavar="N", help="Files in the tree (default: 400)")
+    args = parser.parse_args()
+
+    size = len(CONTENT.encode("utf-8"))
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        print(f"{args.files} files, {args.files * size / 1e6:.1f} MB read and about as much written")
+        print(f"{'limit':<28} {'seconds':>8} {'MB/s':>7} {'files/s':>8} {'CPU':>6} {'slept':>7}")
+        configurations = [
+            ("none", None),
+            ("--max-bytes-per-second 2M", Throttle(bytes_per_second=2 << 20)),
+            ("--max-files-per-second 200", Throttle(files_per_second=200)),
+            ("--cpu-limit 0.25", Throttle(cpu_fraction=0.25)),
+        ]
+        for label, throttle in configurations:
+            seconds, cpu, _ = run(root, args.files, throttle)
+            slept = throttle.waited if throttle is not None else 0.0
+            print(f"{label:<28} {seconds:>8.2f} {2 * args.files * size / seconds / 2 ** 20:>7.2f} "
+                  f"{args.files / seconds:>8.0f} {cpu / seconds:>6.0%} {slept:>7.2f}")
+
+        print("\nReads slow down tenfold (1 ms -> 10 ms) from 1 s to 3 s into the run:")
+        print(f"{'backoff':<10} {'seconds':>8} {'slow reads':>11} {'lowest share':>13} {'share at end':>13}")
+        for backoff in (False, True):
+            throttle = Throttle(files_per_second=500, backoff=backoff)
+            slow_reads = []
+            with slow_disk(1.0, 3.0, 0.01, slow_reads):
+                seconds, _, _ = run(root, max(args.files, 2000), throttle)
+            print(f"{str(backoff):<10} {seconds:>8.2f} {len(slow_reads):>11} "
+                  f"{throttle.min_scale:>13.0%} {throttle.scale:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
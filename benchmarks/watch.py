@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for --watch.
+
+Builds a tree of clean files, then for each backend (inotify when available,
+and mtime polling) measures: the time to start watching, the CPU used while
+the tree is idle, the cost of one polling scan, and the latency from writing
+a file with an emoji to the cleaned file on disk.
+
+Usage:
+    python3 benchmarks/watch.py [--files N] [--idle SECONDS]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emoji_nuker import EmojiSubstitution, InotifyWatcher, PollingWatcher, TreeWatcher  # noqa: E402
+
+CONTENT = "def handler(request):\n    return render(request, 'index.html')\n"
+
+
+def make_tree(root: Path, files: int):
+    """Write clean files, 100 per directory."""
+    for i in range(files):
+        directory = root / f"pkg{i // 1000}" / f"mod{i // 100 % 10}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / f"module{i}.py").write_text(CONTENT, encoding="utf-8")
+
+
+def measure(root: Path, use_inotify: bool, idle: float):
+    """Return (setup seconds, idle CPU %, latency seconds) for one backend."""
+    watcher = TreeWatcher(root, EmojiSubstitution(quiet=True), debounce=0.05, poll_interval=1.0,
+                          use_inotify=use_inotify)
+    stop = threading.Event()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        thread = threading.Thread(target=watcher.run, args=(stop,))
+        thread.start()
+        # The full pass counts files as it goes; wait until it reports all of them
+        total = sum(1 for _ in root.rglob("*.py"))
+        while watcher.files_processed < total:
+            time.sleep(0.01)
+        setup = time.perf_counter() - started
+        time.sleep(1)  # let the pass finish recording file states
+
+        cpu = time.process_time()
+        time.sleep(idle)
+        idle_cpu = (time.process_time() - cpu) / idle * 100
+
+        target = root / "pkg0" / "mod0" / "module0.py"
+        started = time.perf_counter()
+        target.write_text("x = '✅'\n", encoding="utf-8")
+        while "✅" in target.read_text(encoding="utf-8"):
+            time.sleep(0.005)
+        latency = time.perf_counter() - started
+        target.write_text(CONTENT, encoding="utf-8")
+        stop.set()
+        thread.join()
+    return setup, idle_cpu, latency
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description="Benchmark the --watch backends.")
+    parser.add_argument("--files", type=int, default=20000, metavar="N", help="Files in the tree (default: 20000)")
+    parser.add_argument("--idle", type=float, default=3.0, metavar="SECONDS",
+                        help="How long to measure idle CPU use (default: 3)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp:
+        root = Path(temp)
+        make_tree(root, args.files)
+        poller = PollingWatcher(root)
+        started = time.perf_counter()
+        poller.poll()
+        print(f"{args.files} files; one polling scan takes {(time.perf_counter() - started) * 1e3:.0f} ms")
+
+        backends = [("polling (1s)", False)]
+        if InotifyWatcher.available():
+            backends.insert(0, ("inotify", True))
+        else:
+            print("inotify is not available; skipping it")
+        print(f"{'backend':<14} {'setup s':>9} {'idle CPU %':>11} {'latency ms':>11}")
+        for label, use_inotify in backends:
+            setup, idle_cpu, latency = measure(root, use_inotify, args.idle)
+            print(f"{label:<14} {setup:>9.2f} {idle_cpu:>11.2f} {latency * 1e3:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,8 +26,11 @@ setup(
     license="MIT",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
-    py_modules=["emoji_lut"],
+    py_modules=["emoji_lut", "emoji_nuker", "emoji_middleware", "emoji_logging"],
     python_requires=">=3.6",
+    extras_require={
+        "analytics": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "emoji-nuker=emoji_nuker:main",
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Emoji Nuker Logging Integration
+===============================
+
+A logging.Filter and a handler wrapper that remove or substitute emojis in
+log records before they are formatted, using the same engine as the
+emoji-nuker command.
+
+Most log records are plain ASCII, so every string is first checked with
+str.isascii(), and non-ASCII strings with a single character-class search for
+the lowest emoji codepoint and above; only the rest of the string from the
+first candidate character is scanned.
+
+Usage:
+    import logging
+    from emoji_logging import EmojiFilter, EmojiSanitizingHandler
+    from emoji_nuker import SubstitutionRules
+
+    logging.getLogger().addFilter(EmojiFilter())                    # every handler sees clean records
+    handler = EmojiSanitizingHandler(logging.FileHandler("app.log"),
+                                     SubstitutionRules(substitute=True))  # only this destination
+"""
+
+import copy
+import logging
+from typing import Optional
+
+from emoji_nuker import EMOJI_CANDIDATE, KEYCAP_BASES, EmojiSubstitution, SubstitutionRules
+
+
+class EmojiFilter(logging.Filter):
+    """
+    Filter that cleans emojis from a record's msg and string args in place.
+
+    Records are never dropped. If a name is given, only records from that
+    logger and its children are cleaned; the rest pass through untouched.
+    Non-string args are left as they are, since they are only converted to
+    text when the message is formatted.
+    """
+
+    def __init__(self, rules: Optional[SubstitutionRules] = None, name: str = ""):
+        super().__init__(name)
+        # One quiet handler per filter; its summary counts substitutions made in logs
+        self.handler = EmojiSubstitution(rules=rules, quiet=True)
+
+    def clean(self, text: str) -> str:
+        """Return text with emojis removed or substituted."""
+        if text.isascii():
+            return text
+        # Nothing before the first candidate character can be part of an emoji, bar a keycap base
+        match = EMOJI_CANDIDATE.search(text)
+        if match is None:
+            return text
+        start = match.start()
+        if start and text[start - 1] in KEYCAP_BASES:
+            start -= 1
+        return text[:start] + self.handler.process_content(text[start:], "<log>")
+
+    def _clean_arg(self, value):
+        return self.clean(value) if type(value) is str else value
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Clean the record and let it through."""
+        if self.nlen and not super().filter(record):
+            return True
+        if type(record.msg) is str and not record.msg.isascii():
+            record.msg = self.clean(record.msg)
+        args = record.args
+        if args:
+            values = args.values() if isinstance(args, dict) else args
+            # Only rebuild args when a string among them could hold an emoji
+            for value in values:
+                if type(value) is str and not value.isascii() and EMOJI_CANDIDATE.search(value):
+                    break
+            else:
+                return True
+            if isinstance(args, tuple):
+                record.args = tuple(self._clean_arg(value) for value in args)
+            elif isinstance(args, dict):
+                record.args = {key: self._clean_arg(value) for key, value in args.items()}
+        return True
+
+
+class EmojiSanitizingHandler(logging.Handler):
+    """
+    Wrap a handler so that only it receives cleaned records.
+
+    The record is copied before cleaning, so other handlers of the same logger
+    still see the original text.
+    """
+
+    def __init__(self, handler: logging.Handler, rules: Optional[SubstitutionRules] = None):
+        super().__init__(handler.level)
+        self.handler = handler
+        self.emoji_filter = EmojiFilter(rules)
+
+    def emit(self, record: logging.LogRecord):
+        """Clean a copy of the record and pass it to the wrapped handler."""
+        record = copy.copy(record)
+        self.emoji_filter.filter(record)
+        self.handler.handle(record)
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]):
+        """Set the formatter of the wrapped handler."""
+        self.handler.setFormatter(fmt)
+
+    def flush(self):
+        """Flush the wrapped handler."""
+        self.handler.flush()
+
+    def close(self):
+        """Close the wrapped handler and this one."""
+        self.handler.close()
+        super().close()
@@ -166,11 +166,21 @@ class EmojiLUT:
     2. Generate comprehensive emoji patterns
     3. Validate emoji sequences
     4. Categorize emoji types
+    
+    Lookup tables are built on first use and never modified afterwards, so a
+    single instance can be shared by any number of threads; threads racing on
+    the first lookup build identical tables. Importing the module builds
+    nothing, so processes that never consult the LUT (workers reading shared
+    tables) do not pay for it.
     """
     
-    def __init__(self):
-        self._emoji_chars = self._build_emoji_set()
+    def __getattr__(self, name: str):
+        # Only called while the tables are missing; afterwards they are plain attributes
+        if name not in ("_emoji_chars", "_emoji_pattern"):
+            raise AttributeError(name)
+        self._emoji_chars = frozenset(self._build_emoji_set())
         self._emoji_pattern = self._build_emoji_pattern()
+        return self.__dict__[name]
     
     def _build_emoji_set(self) -> Set[int]:
         """Build a comprehensive set of all emoji character codepoints."""
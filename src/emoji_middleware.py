@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Emoji Nuker Middleware
+======================
+
+WSGI and ASGI middleware that removes or substitutes emojis in response bodies
+as they stream out, using the same engine as the emoji-nuker command.
+
+Only text responses are touched (text/*, JSON, JavaScript, XML and friends),
+and never compressed ones. Bodies are processed chunk by chunk: a trailing run
+of emoji characters is held back until the next chunk shows whether the
+sequence continues, so results are identical to cleaning the whole body at
+once while everything else is passed on immediately. Content-Length is
+recomputed when the whole body arrives in one piece and dropped otherwise.
+
+Usage:
+    from emoji_middleware import EmojiWSGIMiddleware, EmojiASGIMiddleware
+    from emoji_nuker import SubstitutionRules
+
+    app = EmojiWSGIMiddleware(app)                                   # remove emojis
+    app = EmojiASGIMiddleware(app, SubstitutionRules(substitute=True))  # substitute them
+"""
+
+import codecs
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from emoji_nuker import (EMOJI_CANDIDATE, KEYCAP_BASES, EmojiSubstitution, SubstitutionRules,
+                         is_emoji_for_replacement)
+
+# Content types that are text even though they are not text/*
+TEXT_CONTENT_TYPES = {
+    "application/json",
+    "application/javascript",
+    "application/ecmascript",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/x-ndjson",
+    "application/ld+json",
+    "application/manifest+json",
+    "image/svg+xml",
+}
+
+# Longest run of emoji characters held back between chunks before it is flushed anyway
+MAX_CARRY = 1024
+
+
+def text_charset(content_type: Optional[str], content_encoding: Optional[str] = None) -> Optional[str]:
+    """
+    Return the charset to decode a response with, or None if it must not be touched.
+
+    Args:
+        content_type: Value of the Content-Type header
+        content_encoding: Value of the Content-Encoding header, if any
+    """
+    if not content_type or (content_encoding and content_encoding.strip().lower() != "identity"):
+        return None
+    media_type, _, params = content_type.partition(";")
+    media_type = media_type.strip().lower()
+    if not (media_type.startswith("text/") or media_type in TEXT_CONTENT_TYPES
+            or media_type.endswith("+json") or media_type.endswith("+xml")):
+        return None
+
+    charset = "utf-8"
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "charset" and value.strip():
+            charset = value.strip().strip('"')
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+
+class StreamSanitizer:
+    """
+    Clean a byte stream incrementally.
+
+    Each call to feed() returns the cleaned bytes that are safe to send. The
+    scanner works on maximal runs of emoji characters, so only a run that
+    reaches the end of the chunk, with a keycap base before it, can still
+    change and is carried over.
+    """
+
+    def __init__(self, rules: Optional[SubstitutionRules] = None, encoding: str = "utf-8",
+                 label: str = "<response>"):
+        self.handler = EmojiSubstitution(rules=rules, quiet=True)
+        self.encoding = encoding
+        self.label = label
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="surrogateescape")
+        self._carry = ""
+
+    def feed(self, data: bytes) -> bytes:
+        """Clean the next chunk; returns the bytes ready to be sent."""
+        text = self._carry + self._decoder.decode(data)
+        cut = len(text)
+        while cut > 0 and is_emoji_for_replacement(text[cut - 1]):
+            cut -= 1
+        if cut > 0 and text[cut - 1] in KEYCAP_BASES:
+            cut -= 1  # may start a keycap completed by the next chunk
+        if len(text) - cut > MAX_CARRY:
+            cut = len(text)
+        self._carry = text[cut:]
+        return self._clean(text[:cut])
+
+    def flush(self) -> bytes:
+        """Clean whatever is left at the end of the stream."""
+        text = self._carry + self._decoder.decode(b"", final=True)
+        self._carry = ""
+        return self._clean(text)
+
+    def _clean(self, text: str) -> bytes:
+        if not text:
+            return b""
+        # Nothing before the first candidate character can be part of an emoji, bar a keycap base
+        match = EMOJI_CANDIDATE.search(text)
+        if match is not None:
+            start = match.start()
+            if start and text[start - 1] in KEYCAP_BASES:
+                start -= 1
+            text = text[:start] + self.handler.process_content(text[start:], self.label)
+        return text.encode(self.encoding, "surrogateescape")
+
+
+def _has_body(status_code: int, method: str) -> bool:
+    """Whether a response can carry a body that should be cleaned."""
+    return method != "HEAD" and status_code >= 200 and status_code not in (204, 304)
+
+
+class EmojiWSGIMiddleware:
+    """WSGI middleware that cleans emojis from text response bodies."""
+
+    def __init__(self, app: Callable, rules: Optional[SubstitutionRules] = None):
+        self.app = app
+        self.rules = rules if rules is not None else SubstitutionRules()
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        response = _WSGIResponse(self.rules, environ, start_response)
+        result = self.app(environ, response.start_response)
+        return response.wrap(result)
+
+
+class _WSGIResponse:
+    """State of one WSGI response passing through EmojiWSGIMiddleware."""
+
+    def __init__(self, rules: SubstitutionRules, environ: dict, start_response: Callable):
+        self.rules = rules
+        self.method = environ.get("REQUEST_METHOD", "GET").upper()
+        self.server_start_response = start_response
+        self.status: Optional[str] = None
+        self.headers: List[Tuple[str, str]] = []
+        self.exc_info = None
+        self.sanitizer: Optional[StreamSanitizer] = None
+        self.server_write: Optional[Callable] = None
+        self.started = False
+
+    def start_response(self, status: str, headers: List[Tuple[str, str]], exc_info=None) -> Callable:
+        """start_response passed to the wrapped app; the real call is deferred until the body is known."""
+        if self.started:
+            # Error after headers went out: let the server re-raise
+            return self.server_start_response(status, headers, exc_info)
+        self.status, self.headers, self.exc_info = status, list(headers), exc_info
+
+        values = {name.lower(): value for name, value in headers}
+        charset = None
+        if _has_body(int(status.split(None, 1)[0]), self.method):
+            charset = text_charset(values.get("content-type"), values.get("content-encoding"))
+        self.sanitizer = StreamSanitizer(self.rules, charset) if charset else None
+        if self.sanitizer is None:
+            self._start(self.headers)
+        return self.write
+
+    def _start(self, headers: List[Tuple[str, str]]):
+        if not self.started:
+            self.started = True
+            self.server_write = self.server_start_response(self.status, headers, self.exc_info)
+
+    def _streaming_headers(self) -> List[Tuple[str, str]]:
+        return [(name, value) for name, value in self.headers if name.lower() != "content-length"]
+
+    def write(self, data: bytes):
+        """Legacy write() callable returned by start_response."""
+        if self.sanitizer is not None:
+            self._start(self._streaming_headers())
+            data = self.sanitizer.feed(data)
+        else:
+            self._start(self.headers)
+        if data:
+            self.server_write(data)
+
+    def wrap(self, result: Iterable[bytes]) -> Iterable[bytes]:
+        """Return the body iterable to hand to the server."""
+        if self.started and self.sanitizer is None:
+            return result
+        if (isinstance(result, (list, tuple)) and len(result) <= 1
+                and self.sanitizer is not None and not self.started):
+            # The whole body is already here: clean it and send an exact Content-Length
+            body = self.sanitizer.feed(result[0] if result else b"") + self.sanitizer.flush()
+            self._start(self._streaming_headers() + [("Content-Length", str(len(body)))])
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+            return [body]
+        return self._stream(result)
+
+    def _stream(self, result: Iterable[bytes]) -> Iterator[bytes]:
+        try:
+            for chunk in result:
+                # Generator apps may call start_response only on their first iteration
+                if self.sanitizer is None:
+                    self._start(self.headers)
+                    yield chunk
+                    continue
+                self._start(self._streaming_headers())
+                cleaned = self.sanitizer.feed(chunk)
+                if cleaned:
+                    yield cleaned
+            if self.sanitizer is not None:
+                self._start(self._streaming_headers())
+                tail = self.sanitizer.flush()
+                if tail:
+                    yield tail
+            else:
+                self._start(self.headers)
+        finally:
+            close = getattr(result, "close", None)
+            if close is not None:
+                close()
+
+
+class EmojiASGIMiddleware:
+    """ASGI middleware that cleans emojis from text response bodies of HTTP requests."""
+
+    def __init__(self, app: Callable, rules: Optional[SubstitutionRules] = None):
+        self.app = app
+        self.rules = rules if rules is not None else SubstitutionRules()
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable):
+        if scope.get("type") != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "GET").upper()
+        state: Dict[str, object] = {"start": None, "sanitizer": None}
+
+        async def send_wrapper(message: dict):
+            message_type = message.get("type")
+            if message_type == "http.response.start":
+                headers = list(message.get("headers", []))
+                values = {bytes(name).lower(): bytes(value).decode("latin-1") for name, value in headers}
+                charset = None
+                if _has_body(int(message.get("status", 200)), method):
+                    charset = text_charset(values.get(b"content-type"), values.get(b"content-encoding"))
+                if charset is None:
+                    await send(message)
+                    return
+                # Hold the headers until the first body message shows whether Content-Length can be kept exact
+                state["sanitizer"] = StreamSanitizer(self.rules, charset)
+                state["start"] = dict(message, headers=[(name, value) for name, value in headers
+                                                        if bytes(name).lower() != b"content-length"])
+                return
+
+            sanitizer = state["sanitizer"]
+            if message_type != "http.response.body" or sanitizer is None:
+                await send(message)
+                return
+
+            more_body = message.get("more_body", False)
+            body = sanitizer.feed(message.get("body", b""))
+            if not more_body:
+                body += sanitizer.flush()
+            start = state["start"]
+            if start is not None:
+                state["start"] = None
+                if not more_body:
+                    start["headers"].append((b"content-length", str(len(body)).encode("latin-1")))
+                await send(start)
+            await send(dict(message, body=body))
+
+        await self.app(scope, receive, send_wrapper)
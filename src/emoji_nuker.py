@@ -13,13 +13,42 @@ Author: Jim Ecker
 License: MIT
 """
 
+import io
 import os
 import re
 import sys
+import copy
+import json
+import mmap
+import marshal
+import hashlib
+import time
+import heapq
+import bisect
+import struct
+import select
+import signal
+import ctypes
+import ctypes.util
+import tarfile
+import zipfile
+import random
+import shutil
+import sqlite3
+import subprocess
 import argparse
+import tempfile
+import threading
+import contextlib
+import multiprocessing
+import functools
 import unicodedata
+import http.server
+from array import array
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Set, Pattern, Dict, List, Tuple, Optional
+from typing import Set, Pattern, Dict, List, Tuple, Optional, TextIO, BinaryIO, Iterable, Iterator, Callable
 
 # Handle module import for both Python package and Unix-style installations
 def setup_module_path():
@@ -68,8 +97,22 @@ CODE_EXTENSIONS: Set[str] = {
     ".html", ".css", ".json", ".yml", ".yaml", ".sh", ".md", ".txt"
 }
 
-# Use the comprehensive emoji pattern from the LUT (covers all popular emoji tools)
-EMOJI_PATTERN: Pattern = get_emoji_pattern()
+# Archive formats that can be cleaned in place of a file or directory
+ARCHIVE_SUFFIXES: Tuple[str, ...] = (".tar.gz", ".tgz", ".tar", ".zip")
+
+
+def __getattr__(name: str):
+    # EMOJI_PATTERN, the comprehensive pattern from the LUT (covers all popular emoji tools),
+    # is resolved on first use so that importing this module does not build the LUT
+    if name == "EMOJI_PATTERN":
+        return get_emoji_pattern()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Every character replaced as an emoji is U+200D or above, so text without such a
+# character, or UTF-8 data without a lead byte in E2-F4, cannot contain one
+EMOJI_CANDIDATE: Pattern = re.compile("[\u200d-\U0010ffff]")
+EMOJI_LEAD_BYTES: Pattern = re.compile(rb"[\xe2-\xf4]")
 
 # Emoticon to emoji mapping for smileys
 EMOTICON_MAPPING: Dict[str, str] = {
@@ -265,15 +308,27 @@ BASE_SUBSTITUTIONS: Dict[str, str] = {
 
 
 class SmartSubstitutionBuilder:
-    """Intelligent substitution builder that creates substitutions based on Unicode properties."""
+    """
+    Intelligent substitution builder that creates substitutions based on Unicode properties.
+    
+    Substitutions are pure functions of the emoji and the color setting, so the
+    cache can be shared between threads: lookups need no lock, and concurrent
+    misses for the same emoji compute the same value, of which the first one
+    stored wins.
+    """
     
     def __init__(self):
         self.cache: Dict[str, Optional[str]] = {}
         self.color_enabled = False
+        self._lock = threading.Lock()
         
     def enable_color(self, enabled: bool = True):
         """Enable or disable color output."""
-        self.color_enabled = enabled
+        with self._lock:
+            if enabled != self.color_enabled:
+                # Cached substitutions were built for the other setting
+                self.cache.clear()
+            self.color_enabled = enabled
         
     def get_unicode_name(self, char: str) -> str:
         """Get the Unicode name for a character."""
@@ -499,19 +554,23 @@ class SmartSubstitutionBuilder:
     
     def build_substitution(self, emoji: str) -> Optional[str]:
         """Build a smart substitution for an emoji character."""
-        if emoji in self.cache:
+        try:
             return self.cache[emoji]
-        
+        except KeyError:
+            pass
+        substitution = self._build_substitution(emoji)
+        with self._lock:
+            return self.cache.setdefault(emoji, substitution)
+    
+    def _build_substitution(self, emoji: str) -> Optional[str]:
+        """Compute the substitution for an emoji without consulting the cache."""
         # Check for emoticon mapping first
         if emoji in EMOTICON_MAPPING:
-            substitution = EMOTICON_MAPPING[emoji]
-            self.cache[emoji] = substitution
-            return substitution
+            return EMOTICON_MAPPING[emoji]
         
         # Get Unicode name
         name = self.get_unicode_name(emoji)
         if not name:
-            self.cache[emoji] = None
             return None
         
         # Get base symbol
@@ -527,263 +586,3846 @@ class SmartSubstitutionBuilder:
         else:
             substitution = base_symbol
         
-        self.cache[emoji] = substitution
         return substitution
 
 
-class EmojiSubstitution:
-    """Handles emoji detection and substitution with Unicode alternatives."""
+def builtin_substitutions() -> Dict[str, str]:
+    """
+    The built-in keys the trie needs: multi-codepoint sequences such as keycaps.
     
-    def __init__(self, substitute: bool = False, interactive: bool = False, label: bool = False, color: bool = False):
-        self.substitute = substitute
-        self.interactive = interactive
-        self.label = label
-        self.color = color
-        self.substitutions_made: List[Tuple[str, str, str]] = []  # (emoji, unicode, file_path)
-        self.emojis_found: Dict[str, List[str]] = {}  # emoji -> list of files
-        
-        # Initialize smart substitution builder
-        self.builder = SmartSubstitutionBuilder()
-        self.builder.enable_color(color)
+    Single characters of the built-in tables are left to the builder, which also
+    applies color, so output for them is the same with or without mapping files.
+    """
+    merged = {**BASE_SUBSTITUTIONS, **EMOTICON_MAPPING}
+    return {key: value for key, value in merged.items() if len(key) > 1}
+
+
+def parse_mapping(data: bytes, source: Path) -> Dict[str, str]:
+    """
+    Parse a JSON or TOML substitution map.
     
-    def find_emoji_substitution(self, emoji: str) -> Optional[str]:
-        """Find a Unicode substitution for an emoji using smart builder."""
-        return self.builder.build_substitution(emoji)
+    The file is either a flat table of emoji to replacement, or has such a
+    table under a "substitutions" key. An empty replacement removes the emoji.
+    """
+    if source.suffix.lower() == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError(f"{source}: reading TOML needs Python 3.11+ or the tomli package")
+        table = tomllib.loads(data.decode("utf-8"))
+    else:
+        table = json.loads(data.decode("utf-8"))
+    if isinstance(table, dict) and isinstance(table.get("substitutions"), dict):
+        table = table["substitutions"]
+    if not isinstance(table, dict):
+        raise ValueError(f"{source}: expected a table of emoji to replacement")
+    for key, value in table.items():
+        if not key or not isinstance(value, str):
+            raise ValueError(f"{source}: invalid entry {key!r}: replacements must be strings")
+    return table
+
+
+class SubstitutionTrie:
+    """
+    Longest-match lookup over a substitution map, in one pass over the text.
     
-    def process_content(self, content: str, file_path: str) -> str:
-        """Process content and either substitute, collect, or remove emojis."""
-        if self.substitute:
-            return self._substitute_emojis(content, file_path)
-        elif self.interactive:
-            return self._collect_emojis(content, file_path)
-        else:
-            # Default behavior: remove emojis
-            return self._remove_emojis(content, file_path)
+    The map is compiled into nested dicts keyed by character, with the
+    replacement for a complete key stored under the empty string (which is
+    never a character). Multi-codepoint keys such as keycaps and ZWJ
+    sequences match wherever they occur, not only as a whole emoji run.
+    """
     
-    def _find_emojis_for_replacement(self, content: str) -> List[str]:
-        """Find all emojis in content that should be replaced using historical precedence."""
-        emojis = []
-        i = 0
-        while i < len(content):
-            char = content[i]
-            if is_emoji_for_replacement(char):
-                # Check for multi-character emoji sequences
-                emoji_seq = char
-                j = i + 1
-                while j < len(content) and is_emoji_for_replacement(content[j]):
-                    emoji_seq += content[j]
-                    j += 1
-                emojis.append(emoji_seq)
-                i = j
-            else:
-                i += 1
-        return emojis
-
-    def _substitute_emojis(self, content: str, file_path: str) -> str:
-        """Replace emojis with Unicode alternatives or label/remove."""
-        new_content = content
-        
-        # Find all emojis in the content using historical precedence
-        emojis = self._find_emojis_for_replacement(content)
+    END = ""
+    CACHE_VERSION = 1
+    
+    def __init__(self, root: dict, size: int):
+        self.root = root
+        self.size = size
+    
+    @classmethod
+    def build(cls, mapping: Dict[str, str]) -> "SubstitutionTrie":
+        """Compile a map of key to replacement."""
+        root: dict = {}
+        for key, replacement in mapping.items():
+            node = root
+            for char in key:
+                node = node.setdefault(char, {})
+            node[cls.END] = replacement
+        return cls(root, len(mapping))
+    
+    @classmethod
+    def load(cls, paths: List[Path], cache_dir: Optional[Path] = None) -> "SubstitutionTrie":
+        """
+        Merge mapping files over the built-in tables and compile them, using an on-disk cache.
         
-        # Sort by length (longest first) to avoid partial replacements
-        emojis.sort(key=len, reverse=True)
+        The cache is keyed by a hash of the built-in tables and the bytes of every
+        file, so editing any of them compiles a fresh trie on the next run.
+        """
+        builtins = builtin_substitutions()
+        sources = [(path, path.read_bytes()) for path in paths]
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{cls.CACHE_VERSION}:{sys.implementation.cache_tag}".encode())
+        digest.update(json.dumps(builtins, sort_keys=True).encode("utf-8"))
+        for _, data in sources:
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = cache_dir / f"mapping-{digest.hexdigest()}.marshal"
+            try:
+                root, size = marshal.loads(cache_path.read_bytes())
+                return cls(root, size)
+            except (OSError, EOFError, ValueError, TypeError):
+                pass
         
-        for emoji in emojis:
-            substitution = self.find_emoji_substitution(emoji)
-            if substitution and substitution != emoji:
-                new_content = new_content.replace(emoji, substitution)
-                self.substitutions_made.append((emoji, substitution, file_path))
-                print(f"\033[32m✓ Replaced '{emoji}' with '{substitution}' in {file_path}\033[0m")
-            elif self.label:
-                # Create label using Unicode codepoint
-                if len(emoji) == 1:
-                    label = f"[emoji:U+{ord(emoji):04X}]"
-                else:
-                    # For multi-character emojis, use first character's codepoint
-                    label = f"[emoji:U+{ord(emoji[0]):04X}]"
-                new_content = new_content.replace(emoji, label)
-                self.substitutions_made.append((emoji, label, file_path))
-                print(f"\033[36mℹ Labeled '{emoji}' as '{label}' in {file_path}\033[0m")
-            else:
-                new_content = new_content.replace(emoji, "")
-                print(f"\033[33m⚠ Removed '{emoji}' (no substitution/label) from {file_path}\033[0m")
+        mapping = builtins
+        for path, data in sources:
+            mapping.update(parse_mapping(data, path))
+        trie = cls.build(mapping)
         
-        return new_content
+        if cache_path is not None:
+            try:
+                cache_dir.mkdir(parents=True, exist_ok=True)
+                write_file_atomic(cache_path, marshal.dumps((trie.root, trie.size)))
+            except OSError:
+                pass  # the cache is only an optimization
+        return trie
     
-    def _remove_emojis(self, content: str, file_path: str) -> str:
-        """Remove emojis from content (default behavior)."""
-        emojis = self._find_emojis_for_replacement(content)
+    def match(self, text: str, start: int) -> Optional[Tuple[int, str]]:
+        """
+        Return (end, replacement) for the longest key starting at start, or None.
         
-        # Sort by length (longest first) to avoid partial replacements
-        emojis.sort(key=len, reverse=True)
+        Variation selectors and skin tone modifiers right after a key belong to it.
+        """
+        node = self.root
+        best = None
+        i = start
+        n = len(text)
+        while i < n:
+            node = node.get(text[i])
+            if node is None:
+                break
+            i += 1
+            replacement = node.get(self.END)
+            if replacement is not None:
+                best = (i, replacement)
+        if best is not None:
+            end = best[0]
+            while end < n and (text[end] in "\ufe0e\ufe0f" or "\U0001f3fb" <= text[end] <= "\U0001f3ff"):
+                end += 1
+            best = (end, best[1])
+        return best
+    
+    def get(self, key: str) -> Optional[str]:
+        """Exact lookup of a key."""
+        node = self.root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node.get(self.END)
+
+
+def user_cache_dir() -> Path:
+    """Directory for compiled mapping and matcher caches ($XDG_CACHE_HOME/emoji-nuker)."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "emoji-nuker"
+
+
+# Characters that attach to the emoji before them: variation selectors and skin tone modifiers
+EMOJI_EXTENDERS = frozenset(chr(c) for c in (*range(0xFE00, 0xFE10), *range(0x1F3FB, 0x1F400)))
+ZWJ_CHAR = "\u200d"
+
+
+@functools.lru_cache(maxsize=1)
+def replacement_char_categories() -> Dict[str, str]:
+    """EmojiLUT.categorize_emoji category of every character the scanner replaces."""
+    categories = {}
+    for codepoint in sorted(EMOJI_LUT._emoji_chars):
+        char = chr(codepoint)
+        if is_emoji_for_replacement(char):
+            categories[char] = EMOJI_LUT.categorize_emoji(char)
+    return categories
+
+
+def emoji_categories() -> List[str]:
+    """Names of the categories the scanner can find, for --only and --keep."""
+    return sorted(set(replacement_char_categories().values()))
+
+
+def char_class(chars: Iterable[str]) -> str:
+    """Body of a regex character class for chars, with consecutive codepoints as ranges."""
+    codepoints = sorted(ord(char) for char in chars)
+    parts = []
+    i = 0
+    while i < len(codepoints):
+        j = i
+        while j + 1 < len(codepoints) and codepoints[j + 1] == codepoints[j] + 1:
+            j += 1
+        parts.append(f"\\U{codepoints[i]:08X}-\\U{codepoints[j]:08X}" if j > i else f"\\U{codepoints[i]:08X}")
+        i = j + 1
+    return "".join(parts)
+
+
+# Keycaps: removal drops "1️⃣" whole rather than leaving the base and U+20E3 behind
+KEYCAP_BASES = "0123456789#*"
+KEYCAP_MARK = "\u20e3"
+# Only a real keycap (base, optional U+FE0F, U+20E3); a base before any other emoji is ordinary text
+KEYCAP_PATTERN: Pattern = re.compile("[0-9#*]\ufe0f?\u20e3")
+
+
+@functools.lru_cache(maxsize=1)
+def removal_table() -> Dict[int, None]:
+    """str.translate table deleting every character the scanner replaces."""
+    return dict.fromkeys(map(ord, replacement_char_categories()))
+
+
+def remove_emojis_fast(content: str, tables: Optional["SharedTables"] = None) -> str:
+    """
+    Remove keycaps, then every other emoji with str.translate.
+    
+    Gives the same text as the run-based scanner in removal mode, without a
+    per-character Python loop, but reports no spans. Keycaps are removed from
+    the original text, so deleting other emojis can never join a base and a
+    U+20E3 into one. Translation looks every character up in the table, so
+    ASCII lines are passed through untouched. With shared tables the
+    translation table comes from them instead of the LUT.
+    """
+    if not EMOJI_CANDIDATE.search(content):
+        return content
+    if KEYCAP_MARK in content:
+        content = KEYCAP_PATTERN.sub("", content)
+    table = tables.removal_table() if tables is not None else removal_table()
+    return "".join(line if line.isascii() else line.translate(table)
+                   for line in content.splitlines(keepends=True))
+
+
+class CategoryMatcher:
+    """
+    Regex that finds only the emojis of selected EmojiLUT categories.
+    
+    A sequence is decided by its base character: a selected base takes its
+    variation selectors, skin tones and ZWJ continuations with it, and a kept
+    base keeps them. Selectors and joiners that follow no emoji at all are
+    decided by their own category. Runs of selected sequences are matched
+    whole, so nothing is filtered in Python after the match.
+    
+    Compiled patterns are cached per selection in memory and their source on
+    disk, keyed by a hash of the LUT, so a selective run costs one regex
+    compile at most.
+    """
+    
+    CACHE_VERSION = 1
+    
+    @staticmethod
+    def source(categories: frozenset) -> str:
+        """Build the pattern source for a category selection."""
+        char_categories = replacement_char_categories()
+        selected = {char for char, category in char_categories.items() if category in categories}
+        attached = EMOJI_EXTENDERS.union(ZWJ_CHAR)
+        bases = selected - attached
+        standalone = selected & attached
+        any_emoji = char_class(char_categories)
+        joinable = char_class(set(char_categories) - {ZWJ_CHAR})
+        extenders = char_class(attached & set(char_categories) - {ZWJ_CHAR})
+        any_base = char_class(set(char_categories) - attached)
+        alternatives = []
+        if bases:
+            # A base joined by ZWJ to an earlier base (with up to two extenders between) belongs to
+            # that sequence, so it is never matched on its own; lookbehinds must be fixed width
+            joined = "".join(f"(?<![{any_base}]{f'[{extenders}]' * n}\\u200d)" for n in range(3))
+            sequence = f"{joined}[{char_class(bases)}](?:[{extenders}]|\\u200d[{joinable}]?)*"
+            alternatives.append(f"(?:{sequence})+")
+        if standalone:
+            alternatives.append(f"(?<![{any_emoji}])[{char_class(standalone)}]+")
+        return "|".join(alternatives) or "(?!)"
+    
+    @staticmethod
+    def _cache_key(categories: frozenset) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(f"{CategoryMatcher.CACHE_VERSION}:{sys.implementation.cache_tag}".encode())
+        # The LUT's own pattern and categorize_emoji's code cover every table the source is built from
+        digest.update(EMOJI_LUT.get_emoji_pattern().pattern.encode("utf-8", "surrogatepass"))
+        digest.update(marshal.dumps(EMOJI_LUT.categorize_emoji.__code__))
+        digest.update(",".join(sorted(categories)).encode())
+        return digest.hexdigest()
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def compile(categories: frozenset, cache_dir: Optional[Path] = None) -> Pattern:
+        """Return the compiled matcher for a selection, from memory, disk or freshly built."""
+        source = None
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = cache_dir / f"matcher-{CategoryMatcher._cache_key(categories)}.re"
+            try:
+                source = cache_path.read_text(encoding="utf-8")
+            except (OSError, UnicodeDecodeError):
+                pass
+        if source is None:
+            source = CategoryMatcher.source(categories)
+            if cache_path is not None:
+                try:
+                    cache_dir.mkdir(parents=True, exist_ok=True)
+                    write_file_atomic(cache_path, source.encode("utf-8"))
+                except OSError:
+                    pass  # the cache is only an optimization
+        return re.compile(source)
+    
+    @staticmethod
+    def select(only: Optional[Iterable[str]] = None, keep: Optional[Iterable[str]] = None) -> frozenset:
+        """
+        Turn --only / --keep category names into the selection to strip.
         
-        new_content = content
-        for emoji in emojis:
-            new_content = new_content.replace(emoji, "")
-            print(f"\033[33m⚠ Removed '{emoji}' from {file_path}\033[0m")
+        Raises:
+            ValueError: for an unknown category name
+        """
+        known = emoji_categories()
+        names = [name for name in (only or ()) if name] + [name for name in (keep or ()) if name]
+        unknown = sorted(set(names) - set(known))
+        if unknown:
+            raise ValueError(f"unknown categor{'y' if len(unknown) == 1 else 'ies'} {', '.join(unknown)} "
+                             f"(choose from {', '.join(known)})")
+        if only:
+            return frozenset(only)
+        return frozenset(known) - frozenset(keep or ())
+
+
+class SharedTables:
+    """
+    Read-only scanner and substitution tables in one memory-mapped file.
+    
+    Worker processes would otherwise each classify the emoji set and warm their
+    own substitution cache. Instead the parent builds the tables once and
+    publishes them to the cache directory; workers map the file read-only, so
+    every process shares the same page-cache pages and attaching costs an
+    mmap, not a rebuild. Instances pickle as their path, so they can be passed
+    to workers directly.
+    
+    Layout: magic, header length and a JSON header, then one class byte per
+    codepoint (0 if the scanner leaves it alone, else 1 + category index), the
+    sorted codepoints that have a substitution entry, the offsets of their
+    values in a UTF-8 blob (one more than entries) and the blob itself. An
+    empty value means there is no substitution.
+    """
+    
+    MAGIC = b"ENTB"
+    VERSION = 1
+    CODEPOINTS = 0x110000
+    
+    @staticmethod
+    def build(color: bool = False) -> bytes:
+        """Build the table file contents for a color setting."""
+        char_categories = replacement_char_categories()
+        categories = emoji_categories()
+        index = {category: i + 1 for i, category in enumerate(categories)}
+        classes = bytearray(SharedTables.CODEPOINTS)
+        builder = SmartSubstitutionBuilder()
+        builder.enable_color(color)
+        keys = array("I")
+        offsets = array("I", [0])
+        blob = bytearray()
+        for char, category in char_categories.items():
+            classes[ord(char)] = index[category]
+            keys.append(ord(char))
+            blob += (builder.build_substitution(char) or "").encode("utf-8")
+            offsets.append(len(blob))
+        header = json.dumps({"version": SharedTables.VERSION, "color": color, "categories": categories,
+                             "entries": len(keys), "byteorder": sys.byteorder}).encode()
+        header += b" " * (-(len(SharedTables.MAGIC) + 4 + len(header)) % 4)  # keep the uint32 arrays aligned
+        return b"".join((SharedTables.MAGIC, struct.pack("<I", len(header)), header, classes,
+                         keys.tobytes(), offsets.tobytes(), blob))
+    
+    @staticmethod
+    def publish(cache_dir: Path, color: bool = False) -> Path:
+        """Write the tables to cache_dir unless an identical file is already there; returns its path."""
+        data = SharedTables.build(color)
+        path = cache_dir / f"tables-{hashlib.blake2b(data, digest_size=16).hexdigest()}.bin"
+        if not path.exists():
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            write_file_atomic(path, data)
+        return path
+    
+    def __init__(self, path: Path):
+        """
+        Attach to a published table file.
         
-        return new_content
+        Raises:
+            OSError: if the file cannot be mapped
+            ValueError: if it is not a table file this version can read
+        """
+        self.path = Path(path)
+        with self.path.open("rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic_length = len(self.MAGIC)
+        if bytes(view[:magic_length]) != self.MAGIC:
+            raise ValueError(f"{self.path} is not an emoji table file")
+        header_length = struct.unpack_from("<I", view, magic_length)[0]
+        offset = magic_length + 4 + header_length
+        header = json.loads(bytes(view[magic_length + 4:offset]))
+        if header["version"] != self.VERSION or header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{self.path} was written by another version or platform")
+        self.color = header["color"]
+        self.categories = header["categories"]
+        entries = header["entries"]
+        self.classes = view[offset:offset + self.CODEPOINTS]
+        offset += self.CODEPOINTS
+        self._keys = view[offset:offset + 4 * entries].cast("I")
+        offset += 4 * entries
+        self._offsets = view[offset:offset + 4 * (entries + 1)].cast("I")
+        self._values = view[offset + 4 * (entries + 1):]
+        self._removal_table: Optional[Dict[int, None]] = None
     
-    def _collect_emojis(self, content: str, file_path: str) -> str:
-        """Collect emojis for later review without modifying content."""
-        emojis = self._find_emojis_for_replacement(content)
+    def __reduce__(self):
+        return SharedTables, (self.path,)
+    
+    def removal_table(self) -> Dict[int, None]:
+        """str.translate table deleting every character the scanner replaces, like removal_table()."""
+        if self._removal_table is None:
+            self._removal_table = dict.fromkeys(self._keys)
+        return self._removal_table
+    
+    def is_replacement(self, char: str) -> bool:
+        """Whether the scanner replaces char; the same answer as is_emoji_for_replacement."""
+        return self.classes[ord(char)] != 0
+    
+    def category(self, char: str) -> Optional[str]:
+        """EmojiLUT category of a character the scanner replaces, or None."""
+        value = self.classes[ord(char)]
+        return self.categories[value - 1] if value else None
+    
+    def substitution(self, char: str) -> Tuple[bool, Optional[str]]:
+        """
+        Look up the built-in substitution of a single character.
         
-        for emoji in emojis:
-            if emoji not in self.emojis_found:
-                self.emojis_found[emoji] = []
-            if file_path not in self.emojis_found[emoji]:
-                self.emojis_found[emoji].append(file_path)
+        Returns:
+            Tuple of (found, substitution); found is False for characters the tables do not cover
+        """
+        if len(char) != 1:
+            return False, None
+        codepoint = ord(char)
+        keys = self._keys
+        i = bisect.bisect_left(keys, codepoint)
+        if i == len(keys) or keys[i] != codepoint:
+            return False, None
+        value = bytes(self._values[self._offsets[i]:self._offsets[i + 1]])
+        return True, value.decode("utf-8") if value else None
+
+
+class SubstitutionRules:
+    """
+    Compiled, read-only substitution settings.
+    
+    Rules hold no per-run state and cannot be changed after construction, so one
+    instance can be shared by any number of EmojiSubstitution handlers running
+    on different threads; each handler keeps its own counters and findings.
+    """
+    
+    __slots__ = ("substitute", "label", "color", "builder", "mapping", "matcher", "tables")
+    
+    def __init__(self, substitute: bool = False, label: bool = False, color: bool = False,
+                 mapping: Optional[SubstitutionTrie] = None, matcher: Optional[Pattern] = None,
+                 tables: Optional[SharedTables] = None):
+        if tables is not None and tables.color != color:
+            raise ValueError("shared tables were built for a different color setting")
+        builder = SmartSubstitutionBuilder()
+        builder.enable_color(color)
+        for name, value in (("substitute", substitute), ("label", label), ("color", color), ("builder", builder),
+                            ("mapping", mapping), ("matcher", matcher), ("tables", tables)):
+            object.__setattr__(self, name, value)
+    
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+    
+    def __reduce__(self):
+        # Rebuilt from the settings in worker processes; the builder cache starts empty there
+        return SubstitutionRules, (self.substitute, self.label, self.color, self.mapping, self.matcher, self.tables)
+    
+    def substitution_for(self, emoji: str) -> Optional[str]:
+        """Smart substitution for an emoji, or None if there is none."""
+        if self.mapping is not None:
+            substitution = self.mapping.get(emoji)
+            if substitution is not None:
+                return substitution
+        if self.tables is not None:
+            found, substitution = self.tables.substitution(emoji)
+            if found:
+                return substitution
+        return self.builder.build_substitution(emoji)
+    
+    def replacement_for(self, emoji: str) -> Tuple[str, str]:
+        """
+        Decide what replaces an emoji in substitution mode.
         
+        Returns:
+            Tuple of (replacement, action) where action is "replaced", "labeled" or "removed"
+        """
+        substitution = self.substitution_for(emoji)
+        if substitution and substitution != emoji:
+            return substitution, "replaced"
+        if self.label:
+            # Create label using Unicode codepoint (first character for multi-character emojis)
+            return f"[emoji:U+{ord(emoji[0]):04X}]", "labeled"
+        return "", "removed"
+
+
+# A planned edit: (start offset, end offset, replacement text)
+Change = Tuple[int, int, str]
+
+
+def apply_changes(content: str, changes: List[Change]) -> str:
+    """Apply non-overlapping (start, end, replacement) spans to content in a single pass."""
+    if not changes:
         return content
     
-    def show_substitution_summary(self):
-        """Show summary of substitutions made."""
-        if self.substitutions_made:
-            print(f"\n\033[34m■ Substitution Summary:\033[0m")
-            for emoji, substitution, file_path in self.substitutions_made:
-                print(f"   '{emoji}' → '{substitution}' in {file_path}")
+    parts = []
+    position = 0
+    for start, end, replacement in changes:
+        parts.append(content[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(content[position:])
+    return "".join(parts)
+
+
+def _format_hunk(content: str, first_offset: int, first_line: int, stop_offset: int,
+                 changed: Dict[int, List[Change]]) -> List[str]:
+    """Format one hunk covering the lines from first_offset up to stop_offset."""
+    body = []
+    removed = []
+    added = []
+    line_count = 0
+    new_count = 0
+    line_no = first_line
+    position = first_offset
     
-    def show_emoji_suggestions(self):
-        """Show emojis found with potential substitutions."""
-        if not self.emojis_found:
-            return
+    def flush():
+        body.extend(removed)
+        body.extend(added)
+        removed.clear()
+        added.clear()
+    
+    while position < stop_offset:
+        line_end = content.find("\n", position)
+        line_end = len(content) if line_end == -1 else line_end + 1
+        line = content[position:line_end]
+        eof_marker = "" if line.endswith("\n") else "\n\\ No newline at end of file\n"
         
-        print(f"\n\033[34m■ Emojis Found (Smart Substitutions):\033[0m")
-        for emoji, files in self.emojis_found.items():
-            substitution = self.find_emoji_substitution(emoji)
-            if substitution:
-                print(f"\n\033[32m✓ '{emoji}' → '{substitution}'\033[0m")
+        if line_no in changed:
+            new_line = apply_changes(line, [(start - position, end - position, text)
+                                            for start, end, text in changed[line_no]])
+            removed.append(f"-{line}{eof_marker}")
+            if new_line:
+                added.append(f"+{new_line}{eof_marker}")
             else:
-                print(f"\n\033[33m⚠ '{emoji}' → (no substitution available)\033[0m")
-            
-            for file_path in files:
-                print(f"   □ {file_path}")
+                # The unterminated last line was emptied, so it disappears entirely
+                new_count -= 1
+        else:
+            flush()
+            body.append(f" {line}{eof_marker}")
+        
+        line_count += 1
+        line_no += 1
+        position = line_end
+    flush()
+    
+    # Emoji are never line breaks, so line numbers match on both sides of a hunk
+    new_count += line_count
+    new_first_line = first_line if new_count else first_line - 1
+    header = f"@@ -{first_line},{line_count} +{new_first_line},{new_count} @@\n"
+    return [header] + body
 
 
-def remove_emojis_from_file(file_path: Path, substitution_handler: EmojiSubstitution) -> bool:
+def format_unified_diff(content: str, changes: List[Change], file_path: str, context: int = 3) -> str:
     """
-    Remove emojis from a single file.
+    Build a unified diff directly from planned change spans.
+    
+    Only the lines around each change are visited, so the cost is proportional
+    to the changes rather than to a full line-by-line comparison of the file.
     
     Args:
-        file_path: Path to the file to process
-        substitution_handler: Handler for emoji substitution logic
+        content: Original file content
+        changes: Sorted (start, end, replacement) spans from EmojiSubstitution.find_changes
+        file_path: Path shown in the diff headers
+        context: Number of unchanged context lines around each change
         
     Returns:
-        True if the file was modified, False otherwise
+        Unified diff text, or an empty string if nothing changes
     """
-    try:
-        # Read file content
-        with file_path.open("r", encoding="utf-8") as f:
-            content = f.read()
-        
-        # Process content based on substitution mode
-        new_content = substitution_handler.process_content(content, str(file_path))
-        
-        # Only write if content changed
-        if content != new_content:
-            with file_path.open("w", encoding="utf-8") as f:
-                f.write(new_content)
-            print(f"\033[32m✓ Cleaned: {file_path}\033[0m")
-            return True
+    # Group changes by 1-based line number, counting newlines only up to each change
+    changed: Dict[int, List[Change]] = {}
+    line_starts: Dict[int, int] = {}
+    line_no = 1
+    position = 0
+    for change in changes:
+        start, end, replacement = change
+        if content[start:end] == replacement:
+            continue
+        line_no += content.count("\n", position, start)
+        position = start
+        if line_no not in changed:
+            changed[line_no] = []
+            line_starts[line_no] = content.rfind("\n", 0, start) + 1
+        changed[line_no].append(change)
+    
+    if not changed:
+        return ""
+    
+    # Merge changed lines whose context windows touch into hunks
+    groups: List[List[int]] = []
+    for line in changed:
+        if groups and line - groups[-1][-1] <= 2 * context:
+            groups[-1].append(line)
         else:
-            print(f"\033[34mℹ No emojis found: {file_path}\033[0m")
-            return False
-            
-    except UnicodeDecodeError:
-        print(f"\033[33m⚠ Skipping binary file: {file_path}\033[0m")
-        return False
-    except PermissionError:
-        print(f"\033[31m✗ Permission denied: {file_path}\033[0m")
-        return False
-    except Exception as e:
-        print(f"\033[31m✗ Failed to process {file_path}: {e}\033[0m")
-        return False
+            groups.append([line])
+    
+    output = [f"--- {file_path}\n", f"+++ {file_path}\n"]
+    for group in groups:
+        # Walk back up to `context` lines before the first change
+        first_line = group[0]
+        first_offset = line_starts[first_line]
+        while first_line > 1 and group[0] - first_line < context:
+            first_offset = content.rfind("\n", 0, first_offset - 1) + 1
+            first_line -= 1
+        
+        # Walk forward up to `context` lines after the last change
+        stop_offset = line_starts[group[-1]]
+        for _ in range(context + 1):
+            if stop_offset >= len(content):
+                break
+            next_break = content.find("\n", stop_offset)
+            stop_offset = len(content) if next_break == -1 else next_break + 1
+        
+        output.extend(_format_hunk(content, first_offset, first_line, stop_offset, changed))
+    
+    return "".join(output)
 
 
-def clean_directory(root: Path, verbose: bool = False, substitution_handler: Optional[EmojiSubstitution] = None) -> tuple[int, int]:
+class SubstitutionSummary:
     """
-    Recursively clean all code files in a directory.
+    Aggregate substitution statistics for a run.
     
-    Args:
-        root: Root directory to scan
-        verbose: Enable verbose output
-        substitution_handler: Handler for emoji substitution logic
-        
-    Returns:
-        Tuple of (files_processed, files_modified)
+    Memory grows with the number of distinct emojis, substitutions and files,
+    not with the number of replacements. Individual occurrences can be streamed
+    to an NDJSON sink instead of being kept in memory.
     """
-    if substitution_handler is None:
-        substitution_handler = EmojiSubstitution()
     
-    files_processed = 0
-    files_modified = 0
+    def __init__(self, sink: Optional[TextIO] = None):
+        self.by_emoji: Counter = Counter()
+        self.by_substitution: Counter = Counter()
+        self.by_file: Counter = Counter()
+        self.replacements: Dict[str, str] = {}  # emoji -> most recent substitution
+        self.sink = sink
+        self._lock = threading.Lock()
     
-    if verbose:
-        print(f"Scanning directory: {root}")
-        print(f"Supported extensions: {', '.join(sorted(CODE_EXTENSIONS))}")
+    @property
+    def total(self) -> int:
+        """Total number of substitutions recorded."""
+        return sum(self.by_emoji.values())
     
-    for path in root.rglob("*"):
-        if path.is_file() and path.suffix in CODE_EXTENSIONS:
-            files_processed += 1
-            if remove_emojis_from_file(path, substitution_handler):
-                files_modified += 1
+    def record(self, emoji: str, substitution: str, file_path: str):
+        """Count one substitution and stream it to the sink if one is configured."""
+        with self._lock:
+            self.by_emoji[emoji] += 1
+            self.by_substitution[substitution] += 1
+            self.by_file[file_path] += 1
+            self.replacements[emoji] = substitution
+            if self.sink is not None:
+                self.sink.write(json.dumps({"emoji": emoji, "substitution": substitution, "file": file_path},
+                                           ensure_ascii=False) + "\n")
     
-    return files_processed, files_modified
+    def to_dict(self) -> Dict[str, Dict[str, object]]:
+        """Return the aggregates as plain dictionaries for a JSON report."""
+        return {
+            "by_emoji": dict(self.by_emoji),
+            "by_substitution": dict(self.by_substitution),
+            "by_file": dict(self.by_file),
+            "replacements": dict(self.replacements),
+        }
+    
+    def merge_dict(self, data: Dict[str, Dict[str, object]]):
+        """Add aggregates produced by to_dict() (e.g. from another shard)."""
+        with self._lock:
+            self.by_emoji.update(data.get("by_emoji", {}))
+            self.by_substitution.update(data.get("by_substitution", {}))
+            self.by_file.update(data.get("by_file", {}))
+            self.replacements.update(data.get("replacements", {}))
+    
+    @staticmethod
+    def _ranked(counter: Counter, top: Optional[int]) -> List[Tuple[str, int]]:
+        """Entries by descending count, ties broken by key so merged shard reports print identically."""
+        def order(item):
+            return (-item[1], item[0])
+        if top is None:
+            return sorted(counter.items(), key=order)
+        return heapq.nsmallest(top, counter.items(), key=order)
+    
+    def show(self, top: Optional[int] = None):
+        """Print the aggregated summary, limiting each section to the top entries if requested."""
+        if not self.by_emoji:
+            return
+        
+        print(f"\n\033[34m■ Substitution Summary:\033[0m")
+        print(f"   Total substitutions: {self.total} in {len(self.by_file)} files")
+        
+        print("   By emoji:")
+        for emoji, count in self._ranked(self.by_emoji, top):
+            print(f"      '{emoji}' → '{self.replacements[emoji]}': {count}")
+        
+        print("   By substitution:")
+        for substitution, count in self._ranked(self.by_substitution, top):
+            print(f"      '{substitution}': {count}")
+        
+        print("   By file:")
+        for file_path, count in self._ranked(self.by_file, top):
+            print(f"      {file_path}: {count}")
+        
+        if top is not None:
+            hidden = max(len(self.by_emoji), len(self.by_substitution), len(self.by_file)) - top
+            if hidden > 0:
+                print(f"   (showing top {top} entries per section)")
 
 
-def validate_no_emoji_in_substitutions():
-    """Validate that no emoji characters are used in any substitutions."""
-    violations = []
+class LatencyHistogram:
+    """Cumulative latency histogram in the Prometheus bucket layout."""
     
-    # Check BASE_SUBSTITUTIONS
-    for emoji, substitution in BASE_SUBSTITUTIONS.items():
-        # Check each character in the substitution
-        for char in substitution:
-            if is_emoji_for_replacement(char):
-                violations.append(f"BASE_SUBSTITUTIONS['{emoji}'] = '{substitution}' contains emoji character '{char}'")
-                break
+    BUCKETS: Tuple[float, ...] = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
     
-    # Check EMOTICON_MAPPING
-    for emoji, substitution in EMOTICON_MAPPING.items():
-        # Check each character in the substitution
-        for char in substitution:
-            if is_emoji_for_replacement(char):
-                violations.append(f"EMOTICON_MAPPING['{emoji}'] = '{substitution}' contains emoji character '{char}'")
-                break
+    def __init__(self):
+        self.bucket_counts = [0] * len(self.BUCKETS)
+        self.sum = 0.0
+        self.count = 0
     
-    if violations:
-        print("VALIDATION FAILED: Emoji characters found in substitutions:")
-        for violation in violations:
-            print(f"  - {violation}")
-        return False
-    else:
-        print("VALIDATION PASSED: No emoji characters found in substitutions")
-        return True
+    def observe(self, seconds: float):
+        """Record one observation."""
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        if index < len(self.BUCKETS):
+            self.bucket_counts[index] += 1
+        self.sum += seconds
+        self.count += 1
+    
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Return (le, cumulative count) pairs including the +Inf bucket."""
+        pairs = []
+        running = 0
+        for bound, count in zip(self.BUCKETS, self.bucket_counts):
+            running += count
+            pairs.append((repr(bound), running))
+        pairs.append(("+Inf", self.count))
+        return pairs
 
 
-def main():
-    """Main entry point."""
-    parser = argparse.ArgumentParser(
-        description="Remove emojis from code files in a project directory.",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  emoji-nuker /path/to/project           # Remove all emojis from directory
-  emoji-nuker myfile.py                  # Remove emojis from single file
-  emoji-nuker .                          # Clean current directory
-  emoji-nuker --verbose /path            # Verbose output
-  emoji-nuker --substitute /path         # Replace emojis with smart Unicode alternatives
-  emoji-nuker --substitute --color /path # Replace with colored Unicode alternatives
-  emoji-nuker --interactive /path        # Show emoji suggestions without modifying files
-  emoji-nuker --label /path              # Replace emojis with a label like [emoji:U+XXXX] if no substitution exists
-        """
-    )
+class RunMetrics:
+    """
+    Run statistics exported in the Prometheus text exposition format.
+    
+    Updates happen once per file (never per character), so collecting metrics
+    stays off the hot scanning loop. All updates are thread-safe.
+    """
+    
+    PREFIX = "emoji_nuker"
+    COUNTERS: Dict[str, str] = {
+        "files_walked": "Files seen while walking the tree",
+        "files_skipped": "Files skipped (unsupported extension or not UTF-8 text)",
+        "files_processed": "Files scanned for emojis",
+        "files_modified": "Files modified (or that would be, with --diff)",
+        "bytes_read": "Bytes read from processed files",
+        "bytes_written": "Bytes written back to modified files",
+        "files_failed": "Files that could not be read, written or committed",
+    }
+    
+    def __init__(self):
+        self.counters: Dict[str, int] = dict.fromkeys(self.COUNTERS, 0)
+        self.phases: Dict[str, LatencyHistogram] = {}
+        self.emoji_categories: Counter = Counter()
+        self._category_cache: Dict[str, str] = {}
+        self._captures = threading.local()
+        self._lock = threading.Lock()
+    
+    def inc(self, name: str, amount: int = 1):
+        """Increment a counter."""
+        with self._lock:
+            self.counters[name] += amount
+    
+    def observe(self, phase: str, seconds: float):
+        """Record the latency of one phase (read, scan, write) for one file."""
+        with self._lock:
+            if phase not in self.phases:
+                self.phases[phase] = LatencyHistogram()
+            self.phases[phase].observe(seconds)
+    
+    @contextlib.contextmanager
+    def timed(self, phase: str):
+        """Context manager that records the latency of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(phase, time.perf_counter() - start)
+    
+    def record_emojis(self, content: str, spans: List[Tuple[int, int]]):
+        """Count the emojis found in one file by EmojiLUT.categorize_emoji category."""
+        if not spans:
+            return
+        runs = Counter(content[start:end] for start, end in spans)
+        categories: Counter = Counter()
+        for run, count in runs.items():
+            for char in run:
+                category = self._category_cache.get(char)
+                if category is None:
+                    category = self._category_cache[char] = EMOJI_LUT.categorize_emoji(char)
+                categories[category] += count
+        capture = getattr(self._captures, "categories", None)
+        if capture is not None:
+            capture.update(categories)
+        self.record_categories(categories)
+    
+    def record_categories(self, categories: Counter):
+        """Add emoji counts by category, e.g. the ones captured for content seen before."""
+        with self._lock:
+            self.emoji_categories.update(categories)
+    
+    @contextlib.contextmanager
+    def capture_emojis(self) -> Iterator[Counter]:
+        """Context manager yielding a Counter of the emoji categories this thread records inside the block."""
+        previous = getattr(self._captures, "categories", None)
+        self._captures.categories = categories = Counter()
+        try:
+            yield categories
+        finally:
+            self._captures.categories = previous
+            if previous is not None:
+                previous.update(categories)
+    
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, help_text in self.COUNTERS.items():
+                metric = f"{self.PREFIX}_{name}_total"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {self.counters[name]}")
+            
+            metric = f"{self.PREFIX}_phase_duration_seconds"
+            lines.append(f"# HELP {metric} Per-file latency of each processing phase")
+            lines.append(f"# TYPE {metric} histogram")
+            for phase, histogram in sorted(self.phases.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{metric}_bucket{{phase="{phase}",le="{bound}"}} {count}')
+                lines.append(f'{metric}_sum{{phase="{phase}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{phase="{phase}"}} {histogram.count}')
+            
+            metric = f"{self.PREFIX}_emojis_total"
+            lines.append(f"# HELP {metric} Emoji codepoints found, by EmojiLUT category")
+            lines.append(f"# TYPE {metric} counter")
+            for category, count in sorted(self.emoji_categories.items()):
+                lines.append(f'{metric}{{category="{category}"}} {count}')
+        return "\n".join(lines) + "\n"
+    
+    def write(self, path: Path):
+        """Write the metrics to a file atomically (e.g. for the node_exporter textfile collector)."""
+        write_file_atomic(path, self.render().encode("utf-8"))
+    
+    def serve(self, port: int, host: str = "127.0.0.1") -> http.server.HTTPServer:
+        """Serve the metrics at http://host:port/metrics from a background thread."""
+        metrics = self
+        
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def _timed(metrics: Optional[RunMetrics], phase: str):
+    """Time a phase if metrics are being collected."""
+    return metrics.timed(phase) if metrics is not None else contextlib.nullcontext()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that callers may overdraw.
+    
+    consume() takes the tokens at once and returns how long the caller has to
+    sleep until the balance is paid back. Amounts that are only known after
+    the fact (CPU time used) can be charged like ones known in advance, and
+    concurrent callers queue up behind each other instead of racing.
+    """
+    
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, amount: float) -> float:
+        """Take amount tokens; returns the seconds to wait before going ahead."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class Throttle:
+    """
+    I/O and CPU limits for running on hosts that also serve traffic.
+    
+    Bytes read and written share one token bucket, files another, and CPU time
+    a third that refills at the allowed fraction of a core, so a run can be
+    held to a duty cycle. The pipeline stages charge each file as it passes
+    and sleep off any debt.
+    
+    With backoff, read latency (per 64 KB) is tracked as a moving average
+    against the lowest average seen. When it climbs past BACKOFF_FACTOR times
+    that baseline, the share of time the run spends reading is cut
+    multiplicatively, by pausing after each read for a multiple of how long
+    it took; once latency settles it recovers additively. Pacing by observed
+    read time slows the run down even when it is below its byte and file
+    limits, which is when a busy disk usually shows up.
+    """
+    
+    BACKOFF_FACTOR = 2.0
+    RECOVER_FACTOR = 1.25
+    DECREASE = 0.5
+    INCREASE = 0.1
+    MIN_SCALE = 0.05
+    ADJUST_INTERVAL = 0.5  # seconds between rate adjustments
+    BASELINE_DRIFT = 1.002  # per adjustment, so a lasting change of storage becomes the new normal
+    CPU_BURST = 0.1  # CPU seconds that may be used at full speed before pausing
+    
+    def __init__(self, bytes_per_second: Optional[float] = None, files_per_second: Optional[float] = None,
+                 cpu_fraction: Optional[float] = None, backoff: bool = False):
+        self.limits = (bytes_per_second, files_per_second, cpu_fraction, backoff)
+        self.bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.files = TokenBucket(files_per_second, max(1.0, files_per_second)) if files_per_second else None
+        self.cpu = TokenBucket(cpu_fraction, self.CPU_BURST) if cpu_fraction else None
+        self.backoff = backoff
+        self.scale = 1.0
+        self.min_scale = 1.0
+        self.waited = 0.0  # seconds slept, summed over threads
+        self.latency: Optional[float] = None
+        self.baseline: Optional[float] = None
+        self._adjusted = time.monotonic()
+        self._cpu_mark: Optional[float] = None  # set by the first charge, so earlier CPU time is free
+        self._lock = threading.Lock()
+    
+    def _sleep(self, seconds: float):
+        if seconds > 0:
+            with self._lock:
+                self.waited += seconds
+            time.sleep(seconds)
+    
+    def before_read(self):
+        """Wait for a file token."""
+        if self.files is not None:
+            self._sleep(self.files.consume(1))
+    
+    def after_read(self, size: int, seconds: float):
+        """Charge the bytes of a read that took seconds, and adapt to its latency."""
+        if self.backoff:
+            self._observe_latency(seconds / max(1.0, size / 65536))
+            if self.scale < 1.0:
+                self._sleep(seconds * (1.0 / self.scale - 1.0))
+        if self.bytes is not None:
+            self._sleep(self.bytes.consume(size))
+    
+    def before_write(self, size: int):
+        """Wait until size bytes may be written."""
+        if self.bytes is not None:
+            self._sleep(self.bytes.consume(size))
+    
+    def after_scan(self):
+        """Charge the CPU time the process used since the last charge."""
+        if self.cpu is None:
+            return
+        with self._lock:
+            now = time.process_time()
+            used = now - self._cpu_mark if self._cpu_mark is not None else 0.0
+            self._cpu_mark = now
+        self._sleep(self.cpu.consume(used))
+    
+    def _observe_latency(self, latency: float):
+        with self._lock:
+            self.latency = latency if self.latency is None else self.latency + 0.2 * (latency - self.latency)
+            now = time.monotonic()
+            if now - self._adjusted < self.ADJUST_INTERVAL:
+                return
+            self._adjusted = now
+            if self.baseline is None:
+                self.baseline = self.latency
+            self.baseline = min(self.baseline * self.BASELINE_DRIFT, self.latency)
+            if self.latency > self.baseline * self.BACKOFF_FACTOR:
+                self.scale = max(self.MIN_SCALE, self.scale * self.DECREASE)
+            elif self.latency < self.baseline * self.RECOVER_FACTOR:
+                self.scale = min(1.0, self.scale + self.INCREASE)
+            self.min_scale = min(self.min_scale, self.scale)
+    
+    def split(self, workers: int) -> tuple:
+        """Constructor arguments giving each of workers processes an equal share of the limits."""
+        *rates, backoff = self.limits
+        return tuple(rate / workers if rate else None for rate in rates) + (backoff,)
+    
+    def show_summary(self):
+        """Print how long the run was held back."""
+        line = f"   Throttled: {_format_seconds(self.waited)} waiting"
+        if self.min_scale < 1.0:
+            line += f", reads backed off to {self.min_scale:.0%} of the time at most"
+        print(line)
+
+
+class EmojiSubstitution:
+    """
+    Handles emoji detection and substitution with Unicode alternatives.
+    
+    A handler carries the state of one run (substitution counts, emojis found)
+    on top of shared SubstitutionRules. Recording is locked, so one handler can
+    be used from several threads; for independent results per call or per
+    thread, create a handler for each from the same rules, which is cheap.
+    """
+    
+    def __init__(self, substitute: bool = False, interactive: bool = False, label: bool = False, color: bool = False,
+                 diff: bool = False, occurrence_sink: Optional[TextIO] = None, writer: Optional["FileWriter"] = None,
+                 metrics: Optional[RunMetrics] = None, dedup: Optional["FileDeduplicator"] = None,
+                 line_ranges: Optional["LineRangeSelector"] = None, rules: Optional[SubstitutionRules] = None,
+                 quiet: bool = False, throttle: Optional[Throttle] = None):
+        # Shared rules take precedence over the individual flags
+        self.rules = rules if rules is not None else SubstitutionRules(substitute, label, color)
+        self.substitute = self.rules.substitute
+        self.interactive = interactive
+        self.label = self.rules.label
+        self.color = self.rules.color
+        self.diff = diff
+        self.quiet = quiet  # suppress per-emoji and "no emojis" messages, e.g. when embedded in a service
+        self.diff_stream = sys.stdout  # where --diff output goes
+        self.writer = writer if writer is not None else FileWriter()
+        self.metrics = metrics
+        self.dedup = dedup
+        self.line_ranges = line_ranges
+        self.throttle = throttle
+        self.summary = SubstitutionSummary(occurrence_sink)
+        self.emojis_found: Dict[str, List[str]] = {}  # emoji -> list of files
+        self._lock = threading.Lock()
+        
+        # Smart substitution builder, shared through the rules
+        self.builder = self.rules.builder
+    
+    def find_emoji_substitution(self, emoji: str) -> Optional[str]:
+        """Find a Unicode substitution for an emoji using smart builder."""
+        return self.rules.substitution_for(emoji)
+    
+    @property
+    def plain_removal(self) -> bool:
+        """Whether removal needs no spans or per-emoji state, so str.translate can do it."""
+        return (not self.substitute and not self.interactive and not self.diff and self.metrics is None
+                and self.dedup is None and self.line_ranges is None and self.rules.matcher is None)
+    
+    def process_content(self, content: str, file_path: str) -> str:
+        """Process content and either substitute, collect, or remove emojis."""
+        if self.plain_removal:
+            return remove_emojis_fast(content, self.rules.tables)
+        return apply_changes(content, self.find_changes(content, file_path))
+    
+    def find_changes(self, content: str, file_path: str) -> List[Change]:
+        """
+        Plan the edits for content without applying them.
+        
+        Returns:
+            Sorted (start, end, replacement) spans; empty in interactive mode,
+            which only collects the emojis it finds
+        """
+        if self.substitute:
+            return self._substitution_changes(content, file_path)
+        elif self.interactive:
+            self._collect_emojis(content, file_path)
+            return []
+        else:
+            # Default behavior: remove emojis
+            return self._removal_changes(content, file_path)
+    
+    def _find_emoji_spans(self, content: str) -> List[Tuple[int, int]]:
+        """Find the (start, end) offsets of emoji runs that should be replaced using historical precedence."""
+        if self.rules.matcher is not None:
+            # Category selection: the compiled matcher finds exactly the runs to replace
+            spans = [match.span() for match in self.rules.matcher.finditer(content)]
+            if self.metrics is not None:
+                self.metrics.record_emojis(content, spans)
+            return spans
+        is_replacement = is_emoji_for_replacement
+        if self.rules.tables is not None:
+            is_replacement = self.rules.tables.is_replacement
+        spans = []
+        i = 0
+        while i < len(content):
+            if is_replacement(content[i]):
+                # Extend over multi-character emoji sequences
+                j = i + 1
+                while j < len(content) and is_replacement(content[j]):
+                    j += 1
+                spans.append((i, j))
+                i = j
+            else:
+                i += 1
+        if self.metrics is not None:
+            self.metrics.record_emojis(content, spans)
+        return spans
+    
+    def _find_emojis_for_replacement(self, content: str) -> List[str]:
+        """Find all emojis in content that should be replaced using historical precedence."""
+        return [content[start:end] for start, end in self._find_emoji_spans(content)]
+
+    def _find_mapped_spans(self, content: str) -> List[Tuple[int, int, Optional[str]]]:
+        """
+        Find (start, end, replacement) spans in one pass over the mapping trie.
+        
+        A key of the mapping starting at a position wins, longest first; other
+        emoji runs end where the next key starts and have no replacement yet.
+        """
+        trie = self.rules.mapping
+        root = trie.root
+        is_replacement = is_emoji_for_replacement
+        if self.rules.tables is not None:
+            is_replacement = self.rules.tables.is_replacement
+        spans = []
+        n = len(content)
+        i = 0
+        while i < n:
+            char = content[i]
+            match = trie.match(content, i) if char in root else None
+            if match is not None:
+                spans.append((i, match[0], match[1]))
+                i = match[0]
+            elif is_replacement(char):
+                j = i + 1
+                while (j < n and is_replacement(content[j])
+                       and not (content[j] in root and trie.match(content, j))):
+                    j += 1
+                spans.append((i, j, None))
+                i = j
+            else:
+                i += 1
+        if self.metrics is not None:
+            self.metrics.record_emojis(content, [(start, end) for start, end, _ in spans])
+        return spans
+    
+    def _substitution_changes(self, content: str, file_path: str) -> List[Change]:
+        """Plan replacements of emojis with Unicode alternatives or label/remove."""
+        changes = []
+        
+        if self.rules.mapping is not None:
+            spans = self._find_mapped_spans(content)
+        else:
+            spans = [(start, end, None) for start, end in self._find_emoji_spans(content)]
+        for start, end, mapped in spans:
+            emoji = content[start:end]
+            if mapped is not None:
+                replacement, action = mapped, ("replaced" if mapped else "removed")
+            else:
+                replacement, action = self.rules.replacement_for(emoji)
+            changes.append((start, end, replacement))
+            if action != "removed":
+                self.summary.record(emoji, replacement, file_path)
+            if self.quiet:
+                continue
+            if action == "replaced":
+                print(f"\033[32m✓ Replaced '{emoji}' with '{replacement}' in {file_path}\033[0m")
+            elif action == "labeled":
+                print(f"\033[36mℹ Labeled '{emoji}' as '{replacement}' in {file_path}\033[0m")
+            else:
+                print(f"\033[33m⚠ Removed '{emoji}' (no substitution/label) from {file_path}\033[0m")
+        
+        return changes
+    
+    def _substitute_emojis(self, content: str, file_path: str) -> str:
+        """Replace emojis with Unicode alternatives or label/remove."""
+        return apply_changes(content, self._substitution_changes(content, file_path))
+    
+    def _removal_changes(self, content: str, file_path: str) -> List[Change]:
+        """Plan removal of every emoji run, and of keycap sequences as a whole."""
+        spans = self._find_emoji_spans(content)
+        if self.rules.matcher is None and KEYCAP_MARK in content:
+            spans = self._with_keycaps(content, spans)
+        changes = []
+        for start, end in spans:
+            changes.append((start, end, ""))
+            if not self.quiet:
+                print(f"\033[33m⚠ Removed '{content[start:end]}' from {file_path}\033[0m")
+        return changes
+    
+    @staticmethod
+    def _with_keycaps(content: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Merge keycap sequences into the emoji runs; a keycap contains any run it overlaps."""
+        keycaps = [match.span() for match in KEYCAP_PATTERN.finditer(content)]
+        if not keycaps:
+            return spans
+        merged: List[Tuple[int, int]] = []
+        for start, end in sorted(spans + keycaps):
+            if merged and start < merged[-1][1]:
+                continue
+            merged.append((start, end))
+        return merged
+    
+    def _remove_emojis(self, content: str, file_path: str) -> str:
+        """Remove emojis from content (default behavior)."""
+        return apply_changes(content, self._removal_changes(content, file_path))
+    
+    def _collect_emojis(self, content: str, file_path: str) -> str:
+        """Collect emojis for later review without modifying content."""
+        self.record_found(self._find_emojis_for_replacement(content), file_path)
+        return content
+    
+    def record_found(self, emojis: List[str], file_path: str):
+        """Record the emojis found in a file for the interactive summary."""
+        with self._lock:
+            for emoji in emojis:
+                if emoji not in self.emojis_found:
+                    self.emojis_found[emoji] = []
+                if file_path not in self.emojis_found[emoji]:
+                    self.emojis_found[emoji].append(file_path)
+    
+    def replay_changes(self, content: str, changes: List[Change], file_path: str):
+        """Record planned changes reused from an identical file in the substitution summary."""
+        if not self.substitute:
+            return
+        for start, end, replacement in changes:
+            if replacement:
+                self.summary.record(content[start:end], replacement, file_path)
+    
+    def write_diff(self, content: str, changes: List[Change], file_path: str):
+        """Write the unified diff for planned changes to the diff stream."""
+        self.diff_stream.write(format_unified_diff(content, changes, file_path))
+        self.diff_stream.flush()
+    
+    def show_substitution_summary(self, top: Optional[int] = None):
+        """Show summary of substitutions made."""
+        self.summary.show(top)
+    
+    def show_emoji_suggestions(self):
+        """Show emojis found with potential substitutions."""
+        if not self.emojis_found:
+            return
+        
+        print(f"\n\033[34m■ Emojis Found (Smart Substitutions):\033[0m")
+        for emoji, files in self.emojis_found.items():
+            substitution = self.find_emoji_substitution(emoji)
+            if substitution:
+                print(f"\n\033[32m✓ '{emoji}' → '{substitution}'\033[0m")
+            else:
+                print(f"\n\033[33m⚠ '{emoji}' → (no substitution available)\033[0m")
+            
+            for file_path in files:
+                print(f"   □ {file_path}")
+
+
+class FileDeduplicator:
+    """
+    Avoid redundant work on duplicated files.
+    
+    Paths that share an inode (hard links) are collapsed before they are read,
+    since cleaning one link cleans them all. Every file that is read is hashed,
+    and each unique blob is scanned only once; identical copies reuse the
+    planned changes and, with metrics, the emoji counts of the scan. Only the
+    changes are cached, not the file contents, so memory stays proportional
+    to the number of unique blobs and emojis.
+    
+    Note that hard links are split if a file is replaced by an atomic rename
+    (e.g. the tail write strategy's fallback); skipped links then keep the old content.
+    """
+    
+    def __init__(self):
+        self._inodes: Set[Tuple[int, int]] = set()
+        self._results: Dict[bytes, Tuple[List[Change], List[str], Optional[Counter]]] = {}
+        self.hard_links_skipped = 0
+        self.content_duplicates = 0
+    
+    @property
+    def duplicates_skipped(self) -> int:
+        """Total duplicates that were not scanned."""
+        return self.hard_links_skipped + self.content_duplicates
+    
+    def unique_files(self, paths: Iterable[Path], quiet: bool = False) -> Iterator[Path]:
+        """Yield paths, dropping any whose inode has already been seen."""
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                yield path
+                continue
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in self._inodes:
+                self.hard_links_skipped += 1
+                if not quiet:
+                    print(f"\033[34mℹ Skipping hard link to an already processed file: {path}\033[0m")
+                continue
+            self._inodes.add(inode)
+            yield path
+    
+    def find_changes(self, content: str, file_path: str, substitution_handler: EmojiSubstitution) -> List[Change]:
+        """Plan changes for content, scanning it only if identical content has not been seen."""
+        key = hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=20).digest()
+        cached = self._results.get(key)
+        
+        metrics = substitution_handler.metrics
+        
+        if cached is not None:
+            self.content_duplicates += 1
+            changes, emojis, categories = cached
+            substitution_handler.replay_changes(content, changes, file_path)
+            substitution_handler.record_found(emojis, file_path)
+            if categories is not None:
+                # The copy holds the same emojis as the scanned original
+                metrics.record_categories(categories)
+            if not substitution_handler.quiet:
+                print(f"\033[34mℹ Reusing scan of identical content: {file_path}\033[0m")
+            return changes
+        
+        with metrics.capture_emojis() if metrics is not None else contextlib.nullcontext() as categories:
+            if substitution_handler.interactive and not substitution_handler.substitute:
+                # Interactive mode plans no changes; remember the emojis found instead
+                emojis = substitution_handler._find_emojis_for_replacement(content)
+                substitution_handler.record_found(emojis, file_path)
+                changes = []
+            else:
+                emojis = []
+                changes = substitution_handler.find_changes(content, file_path)
+        self._results[key] = (changes, emojis, categories)
+        return changes
+    
+    def show_summary(self):
+        """Print how many duplicates were skipped."""
+        print(f"   Duplicates skipped: {self.duplicates_skipped} "
+              f"({self.hard_links_skipped} hard links, {self.content_duplicates} identical contents)")
+
+
+LineRange = Tuple[int, int]  # 1-based, inclusive
+
+
+def merge_line_ranges(ranges: Iterable[LineRange]) -> List[LineRange]:
+    """Sort ranges and merge any that overlap or touch."""
+    merged: List[LineRange] = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def parse_line_ranges(value: str) -> List[LineRange]:
+    """Parse a line range spec like "10-20,35" into merged (first, last) ranges."""
+    ranges = []
+    for part in value.split(","):
+        try:
+            first, _, last = part.partition("-")
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid line range '{part}', expected N or N-M (e.g. 10-20,35)")
+        if first < 1 or last < first:
+            raise argparse.ArgumentTypeError(f"invalid line range '{part}', lines start at 1 and N must not exceed M")
+        ranges.append((first, last))
+    return merge_line_ranges(ranges)
+
+
+class LineRangeSelector:
+    """
+    Restrict cleaning to selected lines of each file.
+
+    Ranges either apply to every file (given explicitly) or are looked up per
+    file (derived from a diff). Only the text inside the ranges is scanned, and
+    edits never reach outside them, so the rest of the file stays byte-identical
+    and the work done is proportional to the size of the change.
+
+    Identical-content deduplication is bypassed for files with ranges, since
+    the same content can have different ranges in different files.
+    """
+
+    HUNK_HEADER: Pattern = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+    def __init__(self, ranges: Optional[List[LineRange]] = None,
+                 files: Optional[Dict[Path, List[LineRange]]] = None):
+        self.ranges = ranges
+        self.files = files
+
+    @classmethod
+    def from_diff(cls, lines: Iterable[str], root: Path) -> "LineRangeSelector":
+        """Collect the added or changed lines of each file from a unified diff relative to root."""
+        files: Dict[Path, List[LineRange]] = {}
+        current = None
+        for line in lines:
+            if line.startswith("+++ "):
+                name = line[4:].rstrip("\n").split("\t")[0]
+                current = None if name == "/dev/null" else (root / name[2:]).resolve()
+                continue
+            match = cls.HUNK_HEADER.match(line)
+            if match and current is not None:
+                first = int(match.group(1))
+                count = int(match.group(2)) if match.group(2) is not None else 1
+                # Pure deletions leave no lines behind to clean
+                if count > 0:
+                    files.setdefault(current, []).append((first, first + count - 1))
+        return cls(files={path: merge_line_ranges(ranges) for path, ranges in files.items()})
+
+    @classmethod
+    def from_git(cls, path: Path, revision: str) -> "LineRangeSelector":
+        """Derive ranges from the local changes since revision (`git diff -U0 <revision>`)."""
+        cwd = path if path.is_dir() else path.parent
+        toplevel = subprocess.run(["git", "-C", str(cwd), "rev-parse", "--show-toplevel"],
+                                  stdout=subprocess.PIPE, check=True, text=True).stdout.strip()
+        diff = subprocess.run(
+            ["git", "-C", str(cwd), "-c", "core.quotePath=false", "diff", "--unified=0", "--no-color",
+             "--no-ext-diff", "--src-prefix=a/", "--dst-prefix=b/", revision, "--", str(path.resolve())],
+            stdout=subprocess.PIPE, check=True)
+        lines = diff.stdout.decode("utf-8", "surrogateescape").splitlines()
+        return cls.from_diff(lines, Path(toplevel))
+
+    def ranges_for(self, file_path: Path) -> List[LineRange]:
+        """Ranges to clean in a file; empty if none of its lines are selected."""
+        if self.files is None:
+            return self.ranges or []
+        return self.files.get(Path(file_path).resolve(), [])
+
+    def select(self, paths: Iterable[Path]) -> Iterator[Path]:
+        """Yield only the paths that have lines selected."""
+        for path in paths:
+            if self.files is None or path.resolve() in self.files:
+                yield path
+
+    @staticmethod
+    def char_spans(content: str, ranges: List[LineRange]) -> List[Tuple[int, int]]:
+        """
+        Map sorted line ranges to (start, end) character offsets in one pass over content.
+
+        Each span includes the line terminator of its last line; scanning stops
+        after the last selected line.
+        """
+        spans = []
+        line, pos = 1, 0
+        for first, last in ranges:
+            while line < first:
+                newline = content.find("\n", pos)
+                if newline < 0:
+                    return spans
+                pos, line = newline + 1, line + 1
+            start = pos
+            while line <= last:
+                newline = content.find("\n", pos)
+                if newline < 0:
+                    pos = len(content)
+                    break
+                pos, line = newline + 1, line + 1
+            if pos > start:
+                spans.append((start, pos))
+        return spans
+
+    def find_changes(self, content: str, file_path: str, substitution_handler: EmojiSubstitution) -> List[Change]:
+        """Plan changes for the selected lines only, with offsets relative to the whole content."""
+        changes = []
+        for start, end in self.char_spans(content, self.ranges_for(Path(file_path))):
+            for span_start, span_end, replacement in substitution_handler.find_changes(content[start:end], file_path):
+                changes.append((start + span_start, start + span_end, replacement))
+        return changes
+
+
+def read_file_content(file_path: Path, metrics: Optional[RunMetrics] = None,
+                      throttle: Optional[Throttle] = None) -> str:
+    """Read a file as UTF-8 text, keeping its line endings as they are."""
+    if throttle is not None:
+        throttle.before_read()
+    start = time.perf_counter()
+    with _timed(metrics, "read"):
+        data = file_path.read_bytes()
+    if throttle is not None:
+        throttle.after_read(len(data), time.perf_counter() - start)
+    if metrics is not None:
+        metrics.inc("bytes_read", len(data))
+    return data.decode("utf-8")
+
+
+def write_file_content(file_path: Path, content: str):
+    """Write cleaned text back over a file."""
+    with file_path.open("w", encoding="utf-8", newline="") as f:
+        f.write(content)
+
+
+def write_temp_file(file_path: Path, data: bytes, sync: bool = True) -> str:
+    """
+    Write data to a new temporary file next to file_path, with file_path's mode.
+    
+    Returns:
+        Path of the temporary file, ready to be renamed over file_path
+    """
+    fd, temp_path = tempfile.mkstemp(dir=str(file_path.parent), prefix=f".{file_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        if file_path.exists():
+            shutil.copymode(str(file_path), temp_path)
+        else:
+            # mkstemp creates 0600 files; give new files the usual umask-based mode
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(temp_path, 0o666 & ~umask)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return temp_path
+
+
+def fsync_path(path: str):
+    """fsync a file or directory by path; directories that cannot be opened (Windows) are skipped."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except IsADirectoryError:
+        return
+    except PermissionError:
+        if os.path.isdir(path):
+            return
+        raise
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomic(file_path: Path, data: bytes, sync_directory: bool = False):
+    """
+    Write a file via a temporary file in the same directory and an atomic rename.
+    
+    With sync_directory the rename itself is flushed too, so the new content
+    survives a crash once this returns.
+    """
+    temp_path = write_temp_file(file_path, data)
+    try:
+        os.replace(temp_path, str(file_path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    if sync_directory:
+        fsync_path(str(file_path.parent))
+
+
+def common_prefix_length(a: str, b: str) -> int:
+    """Length of the longest common prefix of two strings, using C-level slice comparisons."""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[low:middle] == b[low:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class FileWriter:
+    """
+    Writes cleaned content back to disk.
+    
+    Strategies:
+        overwrite: rewrite the whole file in place (default)
+        tail: rewrite only the bytes from the first change onward and truncate,
+              falling back to an atomic temporary file plus rename when the tail
+              is larger than max_tail_fraction of the file
+    
+    Durability (crash safety of whole-file rewrites):
+        none: write in place; a crash can leave a file half written (default)
+        atomic: temporary file, fsync, rename and fsync of the directory for
+                every file
+        batched: write temporary files and commit them batch_size at a time:
+                 fsync the data of the whole batch, rename, then fsync each
+                 directory once. Until commit() runs, written files keep their
+                 old content; files whose commit failed are kept in failed.
+    """
+    
+    STRATEGIES = ("overwrite", "tail")
+    DURABILITY = ("none", "atomic", "batched")
+    SYNC_THREADS = 16  # concurrent fsyncs per batch commit
+    
+    def __init__(self, strategy: str = "overwrite", max_tail_fraction: float = 0.25,
+                 durability: str = "none", batch_size: int = 64):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown write strategy: {strategy}")
+        if durability not in self.DURABILITY:
+            raise ValueError(f"Unknown durability: {durability}")
+        if strategy == "tail" and durability != "none":
+            raise ValueError("The tail strategy rewrites files in place and cannot be made crash-safe")
+        self.strategy = strategy
+        self.max_tail_fraction = max_tail_fraction
+        self.durability = durability
+        self.batch_size = max(1, batch_size)
+        self._pending: List[Tuple[str, Path]] = []  # (temporary file, target) awaiting commit
+        self.failed: Dict[Path, OSError] = {}  # targets whose batch commit failed, until collected
+        self._committing = 0  # files in commits that have started but not finished
+        self._lock = threading.Lock()
+    
+    def write(self, file_path: Path, new_content: str, original: Optional[str] = None) -> int:
+        """
+        Write new_content over file_path; original is the content that was read, if known.
+        
+        Returns:
+            Number of bytes written
+        """
+        if self.durability == "atomic":
+            data = new_content.encode("utf-8")
+            write_file_atomic(file_path, data, sync_directory=True)
+            return len(data)
+        if self.durability == "batched":
+            data = new_content.encode("utf-8")
+            temp_path = write_temp_file(file_path, data, sync=False)
+            with self._lock:
+                self._pending.append((temp_path, file_path))
+                full = len(self._pending) >= self.batch_size
+            if full:
+                self.commit()
+            return len(data)
+        
+        if self.strategy == "overwrite" or original is None:
+            write_file_content(file_path, new_content)
+            return len(new_content.encode("utf-8"))
+        
+        # Everything before the first changed character is already on disk
+        prefix = common_prefix_length(original, new_content)
+        offset = len(original[:prefix].encode("utf-8"))
+        tail = new_content[prefix:].encode("utf-8")
+        file_size = file_path.stat().st_size
+        
+        if len(tail) > self.max_tail_fraction * file_size:
+            data = new_content.encode("utf-8")
+            write_file_atomic(file_path, data)
+            return len(data)
+        
+        with file_path.open("r+b") as f:
+            f.seek(offset)
+            f.write(tail)
+            f.truncate()
+        return len(tail)
+    
+    @property
+    def pending(self) -> int:
+        """Number of written files not settled yet: waiting for commit() or still being committed."""
+        with self._lock:
+            return len(self._pending) + self._committing
+    
+    @staticmethod
+    def _sync(path: str) -> Optional[OSError]:
+        try:
+            fsync_path(path)
+        except OSError as e:
+            return e
+        return None
+    
+    def commit(self) -> int:
+        """
+        Make the pending batch durable and move it into place.
+        
+        File data is flushed for the whole batch before any rename, so after a
+        crash every file holds either its old or its new content. A file that
+        fails is reported and left untouched.
+        
+        Returns:
+            Number of files committed
+        """
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._committing += len(batch)
+        if not batch:
+            return 0
+        try:
+            return self._commit_batch(batch)
+        finally:
+            # Only now are the batch's failures recorded, so it counts as pending until here
+            with self._lock:
+                self._committing -= len(batch)
+    
+    def _commit_batch(self, batch: List[Tuple[str, Path]]) -> int:
+        # Concurrent fsyncs let journaling filesystems flush them in shared commits
+        committed = 0
+        directories = set()
+        with ThreadPoolExecutor(max_workers=min(self.SYNC_THREADS, len(batch))) as pool:
+            failures = list(pool.map(self._sync, [temp_path for temp_path, _ in batch]))
+            for (temp_path, file_path), error in zip(batch, failures):
+                if error is None:
+                    try:
+                        os.replace(temp_path, str(file_path))
+                        directories.add(str(file_path.parent))
+                        committed += 1
+                        continue
+                    except OSError as e:
+                        error = e
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                with self._lock:
+                    self.failed[file_path] = error
+                report_file_error(file_path, error)
+            list(pool.map(fsync_path, directories))
+        return committed
+
+
+def report_file_error(file_path: Path, error: Exception, metrics: Optional[RunMetrics] = None):
+    """Print the message for a file that could not be read or written."""
+    if isinstance(error, UnicodeDecodeError):
+        if metrics is not None:
+            metrics.inc("files_skipped")
+        print(f"\033[33m⚠ Skipping binary file: {file_path}\033[0m")
+        return
+    if metrics is not None:
+        metrics.inc("files_failed")
+    if isinstance(error, PermissionError):
+        print(f"\033[31m✗ Permission denied: {file_path}\033[0m")
+    else:
+        print(f"\033[31m✗ Failed to process {file_path}: {error}\033[0m")
+
+
+def process_file_content(file_path: Path, content: str, substitution_handler: EmojiSubstitution) -> Tuple[bool, Optional[str]]:
+    """
+    Run a file's content through the substitution handler.
+    
+    Returns:
+        Tuple of (modified, content_to_write); content_to_write is None when
+        nothing needs to be written back (no emojis, or --diff dry run)
+    """
+    # Plan edits based on substitution mode
+    with _timed(substitution_handler.metrics, "scan"):
+        changes: List[Change] = []
+        if substitution_handler.plain_removal:
+            # Nothing needs the spans: remove in bulk, without a message per emoji
+            new_content = remove_emojis_fast(content, substitution_handler.rules.tables)
+        else:
+            if substitution_handler.line_ranges is not None:
+                changes = substitution_handler.line_ranges.find_changes(content, str(file_path), substitution_handler)
+            elif substitution_handler.dedup is not None:
+                changes = substitution_handler.dedup.find_changes(content, str(file_path), substitution_handler)
+            else:
+                changes = substitution_handler.find_changes(content, str(file_path))
+            new_content = apply_changes(content, changes)
+    
+    if content == new_content:
+        if not substitution_handler.quiet:
+            print(f"\033[34mℹ No emojis found: {file_path}\033[0m")
+        return False, None
+    
+    if substitution_handler.diff:
+        # Dry run: report the edits as a diff and leave the file untouched
+        substitution_handler.write_diff(content, changes, str(file_path))
+        print(f"\033[32m✓ Would clean: {file_path}\033[0m")
+        if substitution_handler.metrics is not None:
+            substitution_handler.metrics.inc("files_modified")
+        return True, None
+    
+    return True, new_content
+
+
+def write_back(file_path: Path, new_content: str, content: str, substitution_handler: EmojiSubstitution):
+    """Write a cleaned file with the handler's writer and record it."""
+    metrics = substitution_handler.metrics
+    with _timed(metrics, "write"):
+        written = substitution_handler.writer.write(file_path, new_content, content)
+    if metrics is not None:
+        metrics.inc("bytes_written", written)
+    # A batched write only counts once CommitStage has seen its batch commit
+    if substitution_handler.writer.durability != "batched":
+        record_cleaned(file_path, metrics)
+
+
+def record_cleaned(file_path: Path, metrics: Optional[RunMetrics] = None):
+    """Count and announce a file whose cleaned content is in place."""
+    if metrics is not None:
+        metrics.inc("files_modified")
+    print(f"\033[32m✓ Cleaned: {file_path}\033[0m")
+
+
+class FileTask:
+    """
+    One file moving through the cleaning pipeline.
+    
+    Stages fill in the fields as the file moves along. A task whose error is
+    set has already been reported and is passed through untouched by later
+    stages.
+    """
+    
+    __slots__ = ("path", "content", "new_content", "modified", "error")
+    
+    def __init__(self, path: Path):
+        self.path = path
+        self.content: Optional[str] = None
+        self.new_content: Optional[str] = None  # set when the file has to be written back
+        self.modified = False
+        self.error: Optional[Exception] = None
+
+
+class Stage:
+    """
+    A lazy pipeline stage.
+    
+    A stage is any callable that takes an iterable of items and returns an
+    iterator, pulling from its input only as its output is consumed, so a
+    pipeline holds only the items in flight and a slow stage applies
+    backpressure to everything upstream. Path selectors such as
+    ShardSelector.select and FileDeduplicator.unique_files are stages as they
+    are. Per-item stages subclass this class and implement process(), which
+    lets ParallelStage run them on a thread pool.
+    """
+    
+    def process(self, item):
+        """Transform one item."""
+        raise NotImplementedError
+    
+    def is_noop(self, item) -> bool:
+        """Whether process() would return the item unchanged (lets ParallelStage skip the pool)."""
+        return False
+    
+    def __call__(self, items: Iterable) -> Iterator:
+        for item in items:
+            yield self.process(item)
+
+
+class WalkStage(Stage):
+    """
+    Source stage: expand root paths into the code files to clean.
+    
+    A root that is a file with an unsupported extension is reported, unless
+    warn_unsupported is off (for long path lists), and then only counted like
+    the files skipped while walking a directory.
+    """
+    
+    def __init__(self, metrics: Optional[RunMetrics] = None, warn_unsupported: bool = True):
+        self.metrics = metrics
+        self.warn_unsupported = warn_unsupported
+    
+    def __call__(self, roots: Iterable[Path]) -> Iterator[Path]:
+        for root in roots:
+            if not root.is_file():
+                if root.is_dir():
+                    yield from iter_code_files(root, self.metrics)
+                else:
+                    print(f"\033[31m✗ Path does not exist: {root}\033[0m")
+                    if self.metrics is not None:
+                        self.metrics.inc("files_skipped")
+                continue
+            if self.metrics is not None:
+                self.metrics.inc("files_walked")
+            if root.suffix in CODE_EXTENSIONS:
+                yield root
+            else:
+                if self.warn_unsupported:
+                    print(f"\033[33m⚠ Skipping unsupported file type: {root}\033[0m")
+                if self.metrics is not None:
+                    self.metrics.inc("files_skipped")
+
+
+class ReadStage(Stage):
+    """Read each path into a FileTask; files that cannot be read are reported and flagged."""
+    
+    def __init__(self, metrics: Optional[RunMetrics] = None, throttle: Optional[Throttle] = None):
+        self.metrics = metrics
+        self.throttle = throttle
+    
+    def process(self, path: Path) -> FileTask:
+        task = FileTask(path)
+        if self.metrics is not None:
+            self.metrics.inc("files_processed")
+        try:
+            task.content = read_file_content(path, self.metrics, self.throttle)
+        except Exception as e:
+            report_file_error(path, e, self.metrics)
+            task.error = e
+        return task
+
+
+class ScanStage(Stage):
+    """Plan and apply the substitution handler's edits to each task's content."""
+    
+    def __init__(self, substitution_handler: EmojiSubstitution):
+        self.substitution_handler = substitution_handler
+    
+    def process(self, task: FileTask) -> FileTask:
+        if task.error is not None:
+            return task
+        try:
+            task.modified, task.new_content = process_file_content(task.path, task.content, self.substitution_handler)
+        except Exception as e:
+            report_file_error(task.path, e, self.substitution_handler.metrics)
+            task.error = e
+        if self.substitution_handler.throttle is not None:
+            self.substitution_handler.throttle.after_scan()
+        return task
+
+
+class WriteStage(Stage):
+    """Write cleaned tasks back with the handler's writer, then release their contents."""
+    
+    def __init__(self, substitution_handler: EmojiSubstitution):
+        self.substitution_handler = substitution_handler
+    
+    def is_noop(self, task: FileTask) -> bool:
+        return task.new_content is None or task.error is not None
+    
+    def process(self, task: FileTask) -> FileTask:
+        if not self.is_noop(task):
+            try:
+                if self.substitution_handler.throttle is not None:
+                    self.substitution_handler.throttle.before_write(len(task.new_content.encode("utf-8")))
+                write_back(task.path, task.new_content, task.content, self.substitution_handler)
+            except Exception as e:
+                report_file_error(task.path, e, self.substitution_handler.metrics)
+                task.error = e
+        task.content = task.new_content = None
+        return task
+
+
+class CommitStage(Stage):
+    """
+    Pass tasks on once their batch is committed, and commit the last batch.
+    
+    Tasks are held while the writer has files pending, so a file whose fsync
+    or rename failed leaves with its error set and is never counted as
+    modified.
+    """
+    
+    def __init__(self, substitution_handler: EmojiSubstitution):
+        self.substitution_handler = substitution_handler
+        self.writer = substitution_handler.writer
+    
+    def _settle(self, tasks: List[FileTask]) -> Iterator[FileTask]:
+        metrics = self.substitution_handler.metrics
+        for task in tasks:
+            if task.modified and task.error is None and not self.substitution_handler.diff:
+                error = self.writer.failed.pop(task.path, None)
+                if error is not None:
+                    # Already reported by the writer
+                    task.error = error
+                    if metrics is not None:
+                        metrics.inc("files_failed")
+                else:
+                    record_cleaned(task.path, metrics)
+            yield task
+    
+    def __call__(self, tasks: Iterable[FileTask]) -> Iterator[FileTask]:
+        held: List[FileTask] = []
+        try:
+            for task in tasks:
+                held.append(task)
+                if not self.writer.pending:
+                    yield from self._settle(held)
+                    held = []
+        finally:
+            # Also on early exit: every pending file was written completely
+            self.writer.commit()
+        yield from self._settle(held)
+
+
+class ParallelStage(Stage):
+    """
+    Run a per-item stage on a thread pool, keeping the output in input order.
+    
+    At most queue_size items are in flight: the input is only pulled further
+    as results are consumed, so backpressure still reaches upstream stages.
+    Items the stage would not change are passed through without a thread.
+    """
+    
+    def __init__(self, stage: Stage, threads: int = 8, queue_size: int = 64):
+        self.stage = stage
+        self.threads = max(1, threads)
+        self.queue_size = max(1, queue_size)
+    
+    def __call__(self, items: Iterable) -> Iterator:
+        pending: "deque[Future]" = deque()
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            try:
+                for item in items:
+                    if self.stage.is_noop(item):
+                        future = Future()
+                        future.set_result(self.stage.process(item))
+                    else:
+                        future = pool.submit(self.stage.process, item)
+                    pending.append(future)
+                    if len(pending) >= self.queue_size:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                # On early exit (e.g. Ctrl-C), drop queued work; only running items are waited for
+                for future in pending:
+                    future.cancel()
+
+
+class Pipeline:
+    """
+    An ordered list of named stages composed into one lazy iterator.
+    
+    Stages can be replaced or inserted by name, so an optimization (a cache, a
+    prefilter, a parallel variant) is a drop-in change to one stage, and each
+    stage can be run and timed on its own.
+    """
+    
+    def __init__(self, stages: Optional[List[Tuple[str, Callable[[Iterable], Iterator]]]] = None):
+        self.stages: List[Tuple[str, Callable[[Iterable], Iterator]]] = list(stages or [])
+    
+    @property
+    def names(self) -> List[str]:
+        """Stage names in order."""
+        return [name for name, _ in self.stages]
+    
+    def add(self, name: str, stage: Callable[[Iterable], Iterator]) -> "Pipeline":
+        """Append a stage; returns the pipeline for chaining."""
+        self.stages.append((name, stage))
+        return self
+    
+    def replace(self, name: str, stage: Callable[[Iterable], Iterator]) -> "Pipeline":
+        """Swap the stage with the given name for another."""
+        self.stages[self.names.index(name)] = (name, stage)
+        return self
+    
+    def insert_before(self, name: str, new_name: str, stage: Callable[[Iterable], Iterator]) -> "Pipeline":
+        """Insert a stage in front of the stage with the given name."""
+        self.stages.insert(self.names.index(name), (new_name, stage))
+        return self
+    
+    def __call__(self, source: Iterable) -> Iterator:
+        items = iter(source)
+        for _, stage in self.stages:
+            items = stage(items)
+        return items
+    
+    def run(self, source: Iterable) -> Tuple[int, int]:
+        """
+        Drain the pipeline over source.
+        
+        Returns:
+            Tuple of (files_processed, files_modified)
+        """
+        files_processed = 0
+        files_modified = 0
+        for task in self(source):
+            files_processed += 1
+            if task.modified and task.error is None:
+                files_modified += 1
+        return files_processed, files_modified
+
+
+def cleaning_stages(substitution_handler: EmojiSubstitution,
+                    engine: Optional["PipelinedCleaner"] = None) -> List[Tuple[str, Stage]]:
+    """The read, scan and write stages (plus commit for batched writes), sequential or with the engine's thread pools."""
+    read: Stage = ReadStage(substitution_handler.metrics, substitution_handler.throttle)
+    write: Stage = WriteStage(substitution_handler)
+    if engine is not None:
+        read = ParallelStage(read, engine.read_threads, engine.queue_size)
+        write = ParallelStage(write, engine.write_threads, engine.queue_size)
+    stages = [("read", read), ("scan", ScanStage(substitution_handler)), ("write", write)]
+    if substitution_handler.writer.durability == "batched":
+        stages.append(("commit", CommitStage(substitution_handler)))
+    return stages
+
+
+def remove_emojis_from_file(file_path: Path, substitution_handler: EmojiSubstitution) -> bool:
+    """
+    Remove emojis from a single file.
+    
+    Args:
+        file_path: Path to the file to process
+        substitution_handler: Handler for emoji substitution logic
+        
+    Returns:
+        True if the file was modified, False otherwise
+    """
+    _, files_modified = Pipeline(cleaning_stages(substitution_handler)).run([file_path])
+    return files_modified == 1
+
+
+class PipelinedCleaner:
+    """
+    Clean files with reading, scanning and writing overlapped.
+    
+    The read and write stages run on thread pools (ParallelStage) while the
+    calling thread scans and substitutes files in order with the shared
+    EmojiSubstitution handler. At most queue_size files are in flight per
+    pool, so a slow stage applies backpressure instead of buffering the whole
+    tree in memory. This mainly helps on high-latency filesystems (NFS, FUSE)
+    where each open, read and write blocks for a round trip.
+    """
+    
+    def __init__(self, substitution_handler: EmojiSubstitution, read_threads: int = 8,
+                 write_threads: int = 2, queue_size: int = 64):
+        self.substitution_handler = substitution_handler
+        self.read_threads = max(1, read_threads)
+        self.write_threads = max(1, write_threads)
+        self.queue_size = max(1, queue_size)
+    
+    def run(self, paths: Iterable[Path]) -> Tuple[int, int]:
+        """
+        Clean every file in paths.
+        
+        Returns:
+            Tuple of (files_processed, files_modified)
+        """
+        return Pipeline(cleaning_stages(self.substitution_handler, self)).run(paths)
+
+
+def read_path_list(stream: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[Path]:
+    """
+    Yield the paths of a NUL- or newline-delimited list as it is read.
+    
+    The first delimiter in the stream decides which one the list uses: NUL
+    lists (git ls-files -z, find -print0) can hold any path, newline lists may
+    end lines with CRLF. Empty entries are skipped. Reads return whatever is
+    available, so paths reach the pipeline while the producer is still
+    writing, and bytes are decoded like command line arguments.
+    """
+    read = getattr(stream, "read1", stream.read)
+    delimiter = None
+    buffer = b""
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        buffer += chunk
+        if delimiter is None:
+            nul, newline = buffer.find(b"\0"), buffer.find(b"\n")
+            if nul < 0 and newline < 0:
+                continue
+            delimiter = b"\0" if newline < 0 or 0 <= nul < newline else b"\n"
+        *entries, buffer = buffer.split(delimiter)
+        for entry in entries:
+            if delimiter == b"\n":
+                entry = entry.rstrip(b"\r")
+            if entry:
+                yield Path(os.fsdecode(entry))
+    if delimiter == b"\n":
+        buffer = buffer.rstrip(b"\r")
+    if buffer:
+        yield Path(os.fsdecode(buffer))
+
+
+def iter_code_files(root: Path, metrics: Optional[RunMetrics] = None) -> Iterator[Path]:
+    """Yield every file under root with a supported extension."""
+    for path in root.rglob("*"):
+        if not path.is_file():
+            continue
+        if metrics is not None:
+            metrics.inc("files_walked")
+        if path.suffix in CODE_EXTENSIONS:
+            yield path
+        elif metrics is not None:
+            metrics.inc("files_skipped")
+
+
+def build_clean_pipeline(root: Path, substitution_handler: EmojiSubstitution,
+                         engine: Optional[PipelinedCleaner] = None,
+                         shard: Optional["ShardSelector"] = None) -> Pipeline:
+    """
+    Compose the stages of a cleaning run over a directory.
+    
+    walk -> [shard] -> [lines] -> [dedup] -> read -> scan -> write -> [commit];
+    the bracketed stages are only present when enabled.
+    """
+    pipeline = Pipeline().add("walk", WalkStage(substitution_handler.metrics))
+    if shard is not None:
+        pipeline.add("shard", lambda paths: shard.select(paths, root))
+    if substitution_handler.line_ranges is not None:
+        pipeline.add("lines", substitution_handler.line_ranges.select)
+    if substitution_handler.dedup is not None:
+        pipeline.add("dedup", lambda paths: substitution_handler.dedup.unique_files(paths, substitution_handler.quiet))
+    for name, stage in cleaning_stages(substitution_handler, engine):
+        pipeline.add(name, stage)
+    return pipeline
+
+
+def clean_directory(root: Path, verbose: bool = False, substitution_handler: Optional[EmojiSubstitution] = None,
+                    engine: Optional[PipelinedCleaner] = None, shard: Optional["ShardSelector"] = None) -> tuple[int, int]:
+    """
+    Recursively clean all code files in a directory.
+    
+    Args:
+        root: Root directory to scan
+        verbose: Enable verbose output
+        substitution_handler: Handler for emoji substitution logic
+        engine: Pipelined engine to overlap I/O with scanning (sequential if None)
+        shard: Only process the files belonging to this shard (all files if None)
+        
+    Returns:
+        Tuple of (files_processed, files_modified)
+    """
+    if substitution_handler is None:
+        substitution_handler = EmojiSubstitution()
+    
+    if verbose:
+        print(f"Scanning directory: {root}")
+        print(f"Supported extensions: {', '.join(sorted(CODE_EXTENSIONS))}")
+        if shard is not None:
+            print(f"Processing shard {shard}{' (weighted by file size)' if shard.by_size else ''}")
+    
+    return build_clean_pipeline(root, substitution_handler, engine, shard).run([root])
+
+
+def file_state(path: Path) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, size) of a file, or None if it cannot be stat'ed."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class InotifyWatcher:
+    """
+    Report changed paths under a directory with Linux inotify.
+    
+    Every directory gets a watch; files count as changed when they are
+    closed after writing or renamed into place (editors saving atomically).
+    A directory that appears, or the root after the kernel queue overflowed,
+    is reported itself and has to be walked. Directories that are moved out
+    or deleted lose their watches. The thread blocks in select() between
+    events, so an idle tree costs no CPU.
+    
+    wait() raises OSError when a new directory cannot be watched (ENOSPC
+    once fs.inotify.max_user_watches is used up); events may have been lost
+    by then, so the caller has to rescan.
+    """
+    
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_ONLYDIR
+    EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+    
+    backend = "inotify"
+    
+    def __init__(self, root: Path):
+        libc = self._libc()
+        if libc is None:
+            raise OSError("inotify is not available on this system")
+        self._libc_handle = libc
+        self.root = root
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._dirs: Dict[int, str] = {}  # watch descriptor -> directory
+        try:
+            self._watch_tree(str(root))
+        except OSError:
+            os.close(self.fd)
+            raise
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _libc():
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        except (OSError, AttributeError):
+            return None
+        return libc
+    
+    @classmethod
+    def available(cls) -> bool:
+        """Whether inotify can be used on this system."""
+        return cls._libc() is not None
+    
+    def _watch_tree(self, top: str):
+        """Watch top and every directory below it, without following symlinks."""
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            wd = self._libc_handle.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                if errno in (2, 20):  # ENOENT, ENOTDIR: gone or replaced meanwhile
+                    continue
+                # ENOSPC: out of watches (fs.inotify.max_user_watches)
+                raise OSError(errno, f"{os.strerror(errno)} while watching {directory}")
+            self._dirs[wd] = directory
+            try:
+                with os.scandir(directory) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+    
+    def _unwatch_tree(self, top: str):
+        """Drop the watches on top and every directory below it (moved out of the tree)."""
+        prefix = os.path.join(top, "")
+        for wd, directory in list(self._dirs.items()):
+            if directory == top or directory.startswith(prefix):
+                del self._dirs[wd]
+                # The directory still exists elsewhere, so the kernel would keep the watch
+                self._libc_handle.inotify_rm_watch(self.fd, wd)
+    
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Block until paths change (or timeout seconds pass) and return them."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            ready, _, _ = select.select([self.fd], [], [], remaining)
+            if not ready:
+                return set()
+            # Events of no interest (files being created) must not end a debounce early
+            changed = self._read_events()
+            if changed:
+                return changed
+    
+    def _read_events(self) -> Set[Path]:
+        changed: Set[Path] = set()
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                if mask & self.IN_Q_OVERFLOW:
+                    changed.add(self.root)
+                    continue
+                if mask & (self.IN_IGNORED | self.IN_DELETE_SELF):
+                    self._dirs.pop(wd, None)
+                    continue
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & self.IN_ISDIR:
+                    if mask & self.IN_MOVED_FROM:
+                        # Renamed within the tree, it is watched again on IN_MOVED_TO
+                        self._unwatch_tree(path)
+                    elif mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                        # Files may have landed in it before the watch was added
+                        self._watch_tree(path)
+                        changed.add(Path(path))
+                elif mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                    changed.add(Path(path))
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """
+    Report changed code files by comparing mtimes and sizes every interval.
+    
+    Directories are only listed again when their own mtime changed (an entry
+    was added, removed or renamed); otherwise a poll costs one stat per
+    directory and per code file. Polls are spaced out further than interval
+    when they would otherwise keep a CPU busy more than MAX_DUTY of the time.
+    """
+    
+    backend = "polling"
+    MAX_DUTY = 0.05
+    
+    def __init__(self, root: Path, interval: float = 2.0):
+        self.root = root
+        self.interval = interval
+        self._dirs: Dict[str, Tuple[Optional[int], List[str]]] = {}  # directory -> (mtime_ns, subdirectories)
+        self._files: Dict[str, Dict[str, Optional[Tuple[int, int]]]] = {}  # directory -> code file -> state
+        self._list(str(root))
+        self._next_poll = time.monotonic() + interval
+    
+    def _list(self, directory: str, changed: Optional[Set[Path]] = None):
+        """(Re)list a directory, recursing into new subdirectories; new or changed files go to changed."""
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except OSError:
+            self._forget(directory)
+            return
+        previous = self._files.get(directory, {})
+        old_subdirs = set(self._dirs.get(directory, (None, []))[1])
+        files, subdirs = {}, []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif os.path.splitext(entry.name)[1] in CODE_EXTENSIONS:
+                state = previous.get(entry.path) if entry.path in previous else file_state(Path(entry.path))
+                files[entry.path] = state
+                if changed is not None and entry.path not in previous:
+                    changed.add(Path(entry.path))
+        self._dirs[directory] = (mtime, subdirs)
+        self._files[directory] = files
+        for subdir in old_subdirs.difference(subdirs):
+            self._forget(subdir)
+        for subdir in subdirs:
+            if subdir not in old_subdirs:
+                self._list(subdir, changed)
+    
+    def _forget(self, directory: str):
+        _, subdirs = self._dirs.pop(directory, (None, []))
+        self._files.pop(directory, None)
+        for subdir in subdirs:
+            self._forget(subdir)
+    
+    def poll(self) -> Set[Path]:
+        """Stat the tree once and return the code files that appeared or changed."""
+        changed: Set[Path] = set()
+        for directory in list(self._dirs):
+            if directory not in self._dirs:
+                continue  # forgotten while relisting its parent
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                self._forget(directory)
+                continue
+            if mtime != self._dirs[directory][0]:
+                self._list(directory, changed)
+        stat = os.stat
+        for files in self._files.values():
+            for path, state in files.items():
+                try:
+                    st = stat(path)
+                    current = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    current = None
+                if current != state:
+                    files[path] = current
+                    if current is not None:
+                        changed.add(Path(path))
+        return changed
+    
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        """Sleep until the next poll is due (or timeout seconds pass) and return what changed."""
+        while True:
+            delay = max(0.0, self._next_poll - time.monotonic())
+            if timeout is not None and timeout < delay:
+                time.sleep(timeout)
+                return set()
+            time.sleep(delay)
+            started = time.monotonic()
+            changed = self.poll()
+            # On huge trees, space scans out so they take at most MAX_DUTY of the time
+            elapsed = time.monotonic() - started
+            self._next_poll = time.monotonic() + max(self.interval, elapsed / self.MAX_DUTY)
+            if changed or timeout is not None:
+                return changed
+    
+    def close(self):
+        pass
+
+
+class TreeWatcher:
+    """
+    Keep a file or directory clean: one full pass, then re-clean files as they change.
+    
+    Changes are collected until no new event arrives for debounce seconds (or
+    max_delay passed), so a burst such as a branch checkout is handled as one
+    batch. The (mtime_ns, size) of every file is remembered when it is
+    cleaned; events that leave a file in that state, including the ones caused
+    by our own writes, are ignored. If inotify runs out of watches while
+    running, the watcher switches to polling and rescans the tree.
+    """
+    
+    def __init__(self, target: Path, substitution_handler: EmojiSubstitution, debounce: float = 0.2,
+                 poll_interval: float = 2.0, use_inotify: Optional[bool] = None, max_delay: float = 2.0):
+        self.target = target
+        self.root = target if target.is_dir() else target.parent
+        self.substitution_handler = substitution_handler
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = InotifyWatcher.available() if use_inotify is None else use_inotify
+        self.max_delay = max_delay
+        self.files_processed = 0
+        self.files_modified = 0
+        self._clean_states: Dict[Path, Optional[Tuple[int, int]]] = {}
+    
+    def open(self):
+        """Start watching; falls back to polling when inotify is unavailable or out of watches."""
+        if self.use_inotify:
+            try:
+                return InotifyWatcher(self.root)
+            except OSError as e:
+                print(f"\033[33m⚠ Could not use inotify ({e}); polling every {self.poll_interval:g}s instead\033[0m")
+        return PollingWatcher(self.root, self.poll_interval)
+    
+    def wait(self, watcher, timeout: Optional[float]) -> Tuple[object, Set[Path]]:
+        """Wait on watcher; returns the watcher to keep using and the changed paths."""
+        try:
+            return watcher, watcher.wait(timeout)
+        except OSError as e:
+            if isinstance(watcher, PollingWatcher):
+                raise
+            print(f"\033[33m⚠ Lost inotify ({e}); polling every {self.poll_interval:g}s instead\033[0m")
+            watcher.close()
+            # Events of the failed batch are gone: compare the whole tree with the last clean
+            return PollingWatcher(self.root, self.poll_interval), {self.root}
+    
+    def _record_states(self, paths: Iterable[Path]) -> Iterator[Path]:
+        """Pipeline stage: remember each file's state before it is read."""
+        for path in paths:
+            self._clean_states[path] = file_state(path)
+            yield path
+    
+    def initial_pass(self):
+        """Clean the whole target once and remember the state of every file."""
+        if self.target.is_dir():
+            pipeline = build_clean_pipeline(self.target, self.substitution_handler)
+        else:
+            pipeline = Pipeline([("walk", WalkStage(self.substitution_handler.metrics))]
+                                + cleaning_stages(self.substitution_handler))
+        pipeline.insert_before("read", "state", self._record_states)
+        rewritten = []
+        for task in pipeline([self.target]):
+            self.files_processed += 1
+            if task.modified and task.error is None:
+                self.files_modified += 1
+                rewritten.append(task.path)
+        # Batched writes only land once the pipeline is drained
+        for path in rewritten:
+            self._clean_states[path] = file_state(path)
+    
+    def affected(self, changed: Iterable[Path]) -> List[Path]:
+        """Code files among the changed paths whose state differs from when they were last cleaned."""
+        files = set()
+        for path in changed:
+            if path.is_dir():
+                files.update(iter_code_files(path))
+            elif path.suffix in CODE_EXTENSIONS:
+                files.add(path)
+        if not self.target.is_dir():
+            files &= {self.target}
+        stale = []
+        for path in sorted(files):
+            state = file_state(path)
+            if state is not None and state != self._clean_states.get(path):
+                stale.append(path)
+        return stale
+    
+    def clean(self, paths: List[Path]):
+        """
+        Re-clean changed files one by one and remember their state.
+        
+        The state is taken before reading, so a write racing with the read
+        shows up as a change; only files we rewrote take the state after our
+        own write.
+        """
+        for path in paths:
+            self.files_processed += 1
+            state = file_state(path)
+            if remove_emojis_from_file(path, self.substitution_handler):
+                self.files_modified += 1
+                state = file_state(path)
+            self._clean_states[path] = state
+    
+    def run(self, stop: Optional[threading.Event] = None):
+        """
+        Watch until interrupted (Ctrl-C) or until stop is set.
+        
+        Without a stop event the watcher blocks until the next change; with
+        one it wakes twice a second to check it.
+        """
+        watcher = self.open()
+        try:
+            # Watching starts before the full pass, so no change made during it is missed
+            self.initial_pass()
+            print(f"\033[34mℹ Watching {self.target} ({watcher.backend}); press Ctrl-C to stop\033[0m")
+            timeout = None if stop is None else 0.5
+            while stop is None or not stop.is_set():
+                watcher, changed = self.wait(watcher, timeout)
+                if not changed:
+                    continue
+                deadline = time.monotonic() + self.max_delay
+                while time.monotonic() < deadline:
+                    watcher, more = self.wait(watcher, self.debounce)
+                    if not more:
+                        break
+                    changed |= more
+                self.clean(self.affected(changed))
+        finally:
+            watcher.close()
+
+
+def archive_suffix(path: Path) -> Optional[str]:
+    """Return the archive suffix of a path, or None if it is not a supported archive."""
+    name = path.name.lower()
+    for suffix in ARCHIVE_SUFFIXES:
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def default_archive_output(path: Path) -> Path:
+    """Build the default output path for a cleaned archive (e.g. src.tar.gz -> src.cleaned.tar.gz)."""
+    suffix = archive_suffix(path)
+    stem = path.name[:-len(suffix)] if suffix else path.name
+    return path.with_name(f"{stem}.cleaned{suffix or ''}")
+
+
+def _clean_member_data(data: bytes, label: str, substitution_handler: EmojiSubstitution) -> Optional[bytes]:
+    """
+    Run archive member contents through the substitution pipeline.
+    
+    Returns:
+        The cleaned bytes if the member changed, None if it should be copied through
+    """
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        print(f"\033[33m⚠ Skipping binary file: {label}\033[0m")
+        return None
+    
+    changes = substitution_handler.find_changes(content, label)
+    new_content = apply_changes(content, changes)
+    if new_content == content:
+        if not substitution_handler.quiet:
+            print(f"\033[34mℹ No emojis found: {label}\033[0m")
+        return None
+    
+    # Quiet leaves the archive itself and the summary to report the change
+    if substitution_handler.diff:
+        substitution_handler.write_diff(content, changes, label)
+        if not substitution_handler.quiet:
+            print(f"\033[32m✓ Would clean: {label}\033[0m")
+    elif not substitution_handler.quiet:
+        print(f"\033[32m✓ Cleaned: {label}\033[0m")
+    return new_content.encode("utf-8")
+
+
+def _clean_tar_archive(source: Path, output: Optional[Path], suffix: str,
+                       substitution_handler: EmojiSubstitution) -> Tuple[int, int]:
+    """Stream a tar archive member by member, writing cleaned members to output."""
+    files_processed = 0
+    files_modified = 0
+    write_mode = "w|gz" if suffix in (".tar.gz", ".tgz") else "w|"
+    
+    # Stream mode ("r|*") reads members sequentially without seeking or extracting
+    with tarfile.open(str(source), "r|*") as src:
+        dest = tarfile.open(str(output), write_mode) if output else None
+        try:
+            for member in src:
+                is_code = member.isfile() and Path(member.name).suffix in CODE_EXTENSIONS
+                if not is_code:
+                    if dest:
+                        dest.addfile(member, src.extractfile(member) if member.isfile() else None)
+                    continue
+                
+                files_processed += 1
+                data = src.extractfile(member).read()
+                cleaned = _clean_member_data(data, f"{source}:{member.name}", substitution_handler)
+                if cleaned is not None:
+                    files_modified += 1
+                    member = copy.copy(member)
+                    member.size = len(cleaned)
+                    data = cleaned
+                if dest:
+                    dest.addfile(member, io.BytesIO(data))
+        finally:
+            if dest:
+                dest.close()
+    
+    return files_processed, files_modified
+
+
+def _copy_zip_member_raw(source_file: BinaryIO, dest: zipfile.ZipFile, dest_file: BinaryIO,
+                         info: zipfile.ZipInfo) -> None:
+    """Copy a zip member's compressed bytes through unchanged, without recompressing."""
+    if info.flag_bits & 0x01:
+        raise ValueError(f"Encrypted zip members are not supported: {info.filename}")
+    
+    # Locate the member's data after its local file header
+    source_file.seek(info.header_offset)
+    header = source_file.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    source_file.seek(name_length + extra_length, os.SEEK_CUR)
+    
+    # Written as a stored member, ZipFile passes the compressed bytes through as they are
+    zinfo = copy.copy(info)
+    zinfo.compress_type = zipfile.ZIP_STORED
+    zinfo.file_size = info.compress_size
+    zip64 = max(info.file_size, info.compress_size) * 1.05 > zipfile.ZIP64_LIMIT
+    with dest.open(zinfo, "w", force_zip64=zip64) as writer:
+        remaining = info.compress_size
+        while remaining:
+            chunk = source_file.read(min(remaining, 1 << 20))
+            if not chunk:
+                raise zipfile.BadZipFile(f"Truncated zip member: {info.filename}")
+            writer.write(chunk)
+            remaining -= len(chunk)
+    
+    # Then relabeled with its real method, CRC and size, in the central directory and the local header
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.file_size = info.file_size
+    zinfo.flag_bits |= info.flag_bits & 0x06
+    end = dest_file.tell()
+    dest_file.seek(zinfo.header_offset)
+    dest_file.write(zinfo.FileHeader(zip64))
+    dest_file.seek(end)
+
+
+def _clean_zip_archive(source: Path, output: Optional[Path],
+                       substitution_handler: EmojiSubstitution) -> Tuple[int, int]:
+    """Clean a zip archive member by member, writing cleaned members to output."""
+    files_processed = 0
+    files_modified = 0
+    
+    with open(source, "rb") as source_file, zipfile.ZipFile(source_file, "r") as src:
+        # The output file is ours, so copied members' local headers can be rewritten in place
+        dest_file = open(output, "w+b") if output else None
+        dest = zipfile.ZipFile(dest_file, "w") if dest_file else None
+        try:
+            for info in src.infolist():
+                cleaned = None
+                if not info.is_dir() and Path(info.filename).suffix in CODE_EXTENSIONS:
+                    files_processed += 1
+                    data = src.read(info)
+                    cleaned = _clean_member_data(data, f"{source}:{info.filename}", substitution_handler)
+                    if cleaned is not None:
+                        files_modified += 1
+                
+                if not dest:
+                    continue
+                if cleaned is not None:
+                    dest.writestr(copy.copy(info), cleaned, compress_type=info.compress_type)
+                    continue
+                _copy_zip_member_raw(source_file, dest, dest_file, info)
+        finally:
+            if dest:
+                try:
+                    dest.close()
+                finally:
+                    dest_file.close()
+    
+    return files_processed, files_modified
+
+
+def clean_archive(source: Path, output: Optional[Path] = None,
+                  substitution_handler: Optional[EmojiSubstitution] = None) -> Tuple[int, int]:
+    """
+    Clean the code files inside a tar or zip archive without extracting it to disk.
+    
+    Members are streamed through the same CODE_EXTENSIONS filter and substitution
+    pipeline as regular files. Unchanged zip members are copied without recompression.
+    
+    Args:
+        source: Archive to read (.tar, .tar.gz, .tgz or .zip)
+        output: Path of the cleaned archive to write, or None to only scan
+        substitution_handler: Handler for emoji substitution logic
+        
+    Returns:
+        Tuple of (files_processed, files_modified)
+    """
+    if substitution_handler is None:
+        substitution_handler = EmojiSubstitution()
+    
+    suffix = archive_suffix(source)
+    if suffix is None:
+        raise ValueError(f"Unsupported archive format: {source}")
+    
+    if suffix == ".zip":
+        return _clean_zip_archive(source, output, substitution_handler)
+    return _clean_tar_archive(source, output, suffix, substitution_handler)
+
+
+class GitHistoryAudit:
+    """
+    Find every emoji that was ever committed to a git repository.
+
+    The commit log is streamed once to list which blob each commit wrote for
+    every matching path, merges included (a conflict resolution can introduce
+    content no parent had). Each distinct blob is requested as soon as it first
+    appears, read exactly once through a single long-lived `git cat-file --batch`
+    process and scanned with the same core as a normal run, no matter how many
+    commits or paths share it. Neither the log nor the list of versions is held
+    in memory.
+    For every (emoji, file) pair the first and last commit that wrote a
+    version of the file containing the emoji is reported.
+    """
+
+    BATCH_WINDOW = 128  # blob requests in flight; 128 SHA-256 ids fit in the smallest pipe buffer (16 KiB)
+    WAITING_LIMIT = 4096  # versions held back behind a blob in flight before its response is awaited
+
+    def __init__(self, repo: Path, substitution_handler: Optional[EmojiSubstitution] = None, pathspec: str = "."):
+        self.repo = repo
+        self.pathspec = pathspec
+        self.substitution_handler = substitution_handler or EmojiSubstitution()
+        self.commits = 0
+        self.file_versions = 0
+        self.blobs_scanned = 0
+        self.blobs_skipped = 0
+        # (emoji, path) -> [first (commit, time), last (commit, time), count of versions]
+        self.occurrences: Dict[Tuple[str, str], list] = {}
+        self._blob_emojis: Dict[str, List[str]] = {}  # blob -> distinct emojis in it, once scanned
+
+    def _git(self, *args: str) -> List[str]:
+        return ["git", "-C", str(self.repo), *args]
+
+    def _log_tokens(self, stream: BinaryIO, chunk_size: int = 1 << 16) -> Iterator[bytes]:
+        """Yield the NUL-separated tokens of `git log -z` output as it is read."""
+        buffer = b""
+        while True:
+            chunk = stream.read1(chunk_size)
+            if not chunk:
+                break
+            *tokens, buffer = (buffer + chunk).split(b"\0")
+            yield from tokens
+        if buffer:
+            yield buffer
+
+    def _iter_file_versions(self) -> Iterator[Tuple[str, int, str, str]]:
+        """Yield (commit, commit_time, path, blob) for each matching file written, oldest commit first."""
+        # Without -m, --raw shows no diff at all for merge commits
+        log = subprocess.Popen(
+            self._git("log", "--all", "--reverse", "--date-order", "--raw", "-m", "--no-abbrev", "--no-renames",
+                      "-z", "--format=%x01%H %ct", "--", self.pathspec),
+            stdout=subprocess.PIPE)
+
+        finished = False
+        try:
+            commit, commit_time, blob = None, 0, None
+            written: Set[Tuple[str, str]] = set()  # (path, blob) already yielded for this commit
+            for token in self._log_tokens(log.stdout):
+                if blob is not None:
+                    # The token after a raw diff record is its path
+                    path = token.decode("utf-8", "surrogateescape")
+                    # An all-zero blob id means the file was deleted in this commit
+                    if blob.strip("0") and Path(path).suffix in CODE_EXTENSIONS and (path, blob) not in written:
+                        written.add((path, blob))
+                        yield commit, commit_time, path, blob
+                    blob = None
+                    continue
+                token = token.lstrip(b"\n")
+                if token.startswith(b"\x01"):
+                    sha, _, stamp = token[1:].decode("ascii").partition(" ")
+                    # -m repeats a merge once per parent, each time with the diff against that parent
+                    if sha != commit:
+                        commit, commit_time = sha, int(stamp)
+                        written = set()
+                        self.commits += 1
+                elif token.startswith(b":"):
+                    # ":old_mode new_mode old_blob new_blob status"
+                    blob = token.split()[3].decode("ascii")
+            finished = True
+        finally:
+            log.stdout.close()
+            if not finished:
+                log.kill()
+            returncode = log.wait()
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, log.args)
+
+    def _read_blob(self, reader: subprocess.Popen, blob: str):
+        """Read the batch reader's next response, for blob, and remember the emojis in it."""
+        metrics = self.substitution_handler.metrics
+        emojis: List[str] = []
+        header = reader.stdout.readline().split()
+        # "<oid> missing" (e.g. a shallow clone) has nothing after the header
+        if len(header) == 3:
+            data = reader.stdout.read(int(header[2]))
+            reader.stdout.read(1)
+            if metrics is not None:
+                metrics.inc("bytes_read", len(data))
+            try:
+                content = data.decode("utf-8")
+            except UnicodeDecodeError:
+                self.blobs_skipped += 1
+            else:
+                with _timed(metrics, "scan"):
+                    emojis = list(dict.fromkeys(self.substitution_handler._find_emojis_for_replacement(content)))
+                self.blobs_scanned += 1
+        self._blob_emojis[blob] = emojis
+
+    def _record_versions(self, waiting: "deque[Tuple[str, int, str, str]]"):
+        """Record the waiting versions, in log order, up to the first whose blob is not scanned yet."""
+        while waiting and waiting[0][3] in self._blob_emojis:
+            commit, commit_time, path, blob = waiting.popleft()
+            for emoji in self._blob_emojis[blob]:
+                entry = self.occurrences.get((emoji, path))
+                if entry is None:
+                    self.occurrences[(emoji, path)] = [(commit, commit_time), (commit, commit_time), 1]
+                else:
+                    entry[1] = (commit, commit_time)
+                    entry[2] += 1
+
+    def run(self) -> int:
+        """Audit the history; returns the number of (emoji, file) pairs found."""
+        # Versions are recorded in log order, so those behind a blob still in flight wait for it
+        requested: Set[str] = set()
+        in_flight: "deque[str]" = deque()
+        waiting: "deque[Tuple[str, int, str, str]]" = deque()
+
+        reader = subprocess.Popen(self._git("cat-file", "--batch"), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        try:
+            for version in self._iter_file_versions():
+                self.file_versions += 1
+                blob = version[3]
+                if blob not in requested:
+                    requested.add(blob)
+                    reader.stdin.write(blob.encode("ascii") + b"\n")
+                    in_flight.append(blob)
+                waiting.append(version)
+                # The requests in flight always fit in the pipe buffer, so writing them never blocks
+                # while the reader's responses are not read back
+                if len(in_flight) >= self.BATCH_WINDOW or len(waiting) >= self.WAITING_LIMIT:
+                    reader.stdin.flush()
+                    while in_flight and (len(in_flight) >= self.BATCH_WINDOW or len(waiting) >= self.WAITING_LIMIT):
+                        self._read_blob(reader, in_flight.popleft())
+                        self._record_versions(waiting)
+                self._record_versions(waiting)
+            reader.stdin.close()
+            while in_flight:
+                self._read_blob(reader, in_flight.popleft())
+            self._record_versions(waiting)
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                reader.stdin.close()
+            reader.stdout.close()
+            reader.kill()
+            reader.wait()
+        return len(self.occurrences)
+
+    def show(self, top: Optional[int] = None):
+        """Print every emoji found in history with where it first and last appeared."""
+        print(f"\nHistory audit:")
+        print(f"   Commits walked: {self.commits}")
+        print(f"   File versions: {self.file_versions}")
+        print(f"   Unique blobs scanned: {self.blobs_scanned}")
+        if self.blobs_skipped:
+            print(f"   Blobs skipped (not UTF-8): {self.blobs_skipped}")
+
+        if not self.occurrences:
+            print("\033[32m✓ No emojis found in history.\033[0m")
+            return
+
+        def stamp(commit: Tuple[str, int]) -> str:
+            return f"{commit[0][:10]} ({time.strftime('%Y-%m-%d', time.gmtime(commit[1]))})"
+
+        entries = sorted(self.occurrences.items(), key=lambda item: (item[1][0][1], item[0][1], item[0][0]))
+        shown = entries if top is None else entries[:top]
+        print(f"\n\033[36m■ Emojis in history ({len(entries)} emoji/file pairs):\033[0m")
+        for (emoji, path), (first, last, versions) in shown:
+            codepoints = " ".join(f"U+{ord(char):04X}" for char in emoji)
+            print(f"   '{emoji}' ({codepoints}) in {path}")
+            print(f"      first: {stamp(first)}  last: {stamp(last)}  versions: {versions}")
+        if len(shown) < len(entries):
+            print(f"   ... and {len(entries) - len(shown)} more")
+
+
+class EmojiIndex:
+    """
+    Persistent SQLite index of where emojis occur, for queries without rescanning.
+
+    Each emoji run found by the scanner is split into single emoji sequences,
+    which are stored with their file, 1-based line and column (in characters)
+    and the EmojiLUT.categorize_emoji category of their first character. Variation selectors are dropped from the stored
+    emoji, so "⚠" and "⚠️" are the same key. Files are only rescanned when
+    their mtime or size changes, and files that disappeared are dropped.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS occurrences (
+            file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+            emoji TEXT NOT NULL,
+            category TEXT NOT NULL,
+            line INTEGER NOT NULL,
+            col INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS occurrences_emoji ON occurrences(emoji);
+        CREATE INDEX IF NOT EXISTS occurrences_category ON occurrences(category);
+        CREATE INDEX IF NOT EXISTS occurrences_file ON occurrences(file_id);
+    """
+
+    VARIATION_SELECTORS = str.maketrans("", "", "\ufe0e\ufe0f")
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(self.SCHEMA)
+        self.files_scanned = 0
+        self.files_unchanged = 0
+        self.files_removed = 0
+
+    def close(self):
+        """Close the database connection."""
+        self.db.close()
+
+    @classmethod
+    def normalize(cls, emoji: str) -> str:
+        """Drop variation selectors so text and emoji presentations share a key."""
+        return emoji.translate(cls.VARIATION_SELECTORS)
+
+    @staticmethod
+    def _key(path: Path) -> str:
+        """Absolute path string under which a file is stored."""
+        return path.resolve().as_posix()
+
+    @staticmethod
+    def split_run(run: str) -> Iterator[Tuple[int, str]]:
+        """Split an emoji run into (offset, sequence), keeping ZWJ, modifier, selector, keycap and flag parts together."""
+        start = 0
+        for i in range(1, len(run) + 1):
+            if i < len(run):
+                codepoint, previous = ord(run[i]), ord(run[i - 1])
+                joined = (codepoint in (0x200D, 0x20E3, 0xFE0E, 0xFE0F) or 0x1F3FB <= codepoint <= 0x1F3FF
+                          or 0xE0020 <= codepoint <= 0xE007F or previous == 0x200D
+                          or (0x1F1E6 <= codepoint <= 0x1F1FF and i - start == 1 and 0x1F1E6 <= previous <= 0x1F1FF))
+                if joined:
+                    continue
+            yield start, run[start:i]
+            start = i
+
+    @staticmethod
+    def _prefix_clause(prefix: str) -> Tuple[str, List[str]]:
+        """Match a path or anything below it with range comparisons, so the path index is used."""
+        prefix = prefix.rstrip("/")
+        return "(f.path = ? OR (f.path > ? AND f.path < ?))", [prefix, prefix + "/", prefix + "0"]
+
+    def locate(self, content: str, substitution_handler: EmojiSubstitution) -> List[Tuple[str, str, int, int]]:
+        """Return (emoji, category, line, col) for every emoji run, counting lines in one pass."""
+        occurrences = []
+        line, line_start, pos = 1, 0, 0
+        for start, end in substitution_handler._find_emoji_spans(content):
+            newlines = content.count("\n", pos, start)
+            if newlines:
+                line += newlines
+                line_start = content.rfind("\n", pos, start) + 1
+            pos = start
+            for offset, sequence in self.split_run(content[start:end]):
+                emoji = self.normalize(sequence) or sequence
+                occurrences.append((emoji, EMOJI_LUT.categorize_emoji(emoji[0]), line,
+                                    start + offset - line_start + 1))
+        return occurrences
+
+    def update(self, root: Path, substitution_handler: Optional[EmojiSubstitution] = None):
+        """Bring the index up to date with every code file under root (or a single file)."""
+        if substitution_handler is None:
+            substitution_handler = EmojiSubstitution()
+        paths = [root] if root.is_file() else iter_code_files(root, substitution_handler.metrics)
+        root_key = self._key(root)
+        known = {}
+        clause, params = self._prefix_clause(root_key)
+        for file_id, path, mtime_ns, size in self.db.execute(
+                f"SELECT id, path, mtime_ns, size FROM files f WHERE {clause}", params):
+            known[path] = (file_id, mtime_ns, size)
+
+        with self.db:
+            for path in paths:
+                key = self._key(path)
+                try:
+                    stat = path.stat()
+                except OSError as e:
+                    report_file_error(path, e, substitution_handler.metrics)
+                    continue
+                entry = known.pop(key, None)
+                if entry is not None and entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                    self.files_unchanged += 1
+                    continue
+                try:
+                    content = read_file_content(path, substitution_handler.metrics)
+                except Exception as e:
+                    report_file_error(path, e, substitution_handler.metrics)
+                    continue
+                with _timed(substitution_handler.metrics, "scan"):
+                    occurrences = self.locate(content, substitution_handler)
+                if entry is not None:
+                    file_id = entry[0]
+                    self.db.execute("DELETE FROM occurrences WHERE file_id = ?", (file_id,))
+                    self.db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?",
+                                    (stat.st_mtime_ns, stat.st_size, file_id))
+                else:
+                    file_id = self.db.execute("INSERT INTO files (path, mtime_ns, size) VALUES (?, ?, ?)",
+                                              (key, stat.st_mtime_ns, stat.st_size)).lastrowid
+                self.db.executemany("INSERT INTO occurrences VALUES (?, ?, ?, ?, ?)",
+                                    [(file_id, *occurrence) for occurrence in occurrences])
+                self.files_scanned += 1
+
+            # Anything under root that was not seen again has been deleted or renamed
+            for file_id, _, _ in known.values():
+                self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+            self.files_removed = len(known)
+
+    def _where(self, emoji: Optional[str], category: Optional[str], under: Optional[Path]) -> Tuple[str, list]:
+        clauses, params = [], []
+        if emoji:
+            clauses.append("o.emoji = ?")
+            params.append(self.normalize(emoji))
+        if category:
+            clauses.append("o.category = ?")
+            params.append(category)
+        if under is not None:
+            clause, prefix_params = self._prefix_clause(self._key(under))
+            clauses.append(clause)
+            params.extend(prefix_params)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def find(self, emoji: Optional[str] = None, category: Optional[str] = None,
+             under: Optional[Path] = None, limit: Optional[int] = None) -> List[Tuple[str, int, int, str, str]]:
+        """Return (path, line, col, emoji, category) rows matching the filters, in file order."""
+        where, params = self._where(emoji, category, under)
+        sql = (f"SELECT f.path, o.line, o.col, o.emoji, o.category FROM occurrences o "
+               f"JOIN files f ON f.id = o.file_id{where} ORDER BY f.path, o.line, o.col")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.db.execute(sql, params).fetchall()
+
+    def counts(self, emoji: Optional[str] = None, category: Optional[str] = None,
+               under: Optional[Path] = None, limit: Optional[int] = None) -> List[Tuple[str, str, int, int]]:
+        """Return (emoji, category, occurrences, files) per emoji matching the filters, most frequent first."""
+        where, params = self._where(emoji, category, under)
+        sql = (f"SELECT o.emoji, o.category, COUNT(*), COUNT(DISTINCT o.file_id) FROM occurrences o "
+               f"JOIN files f ON f.id = o.file_id{where} GROUP BY o.emoji, o.category "
+               f"ORDER BY COUNT(*) DESC, o.emoji")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.db.execute(sql, params).fetchall()
+
+    def show_update(self):
+        """Print what the last update did."""
+        print(f"\nIndex updated: {self.path}")
+        print(f"   Files scanned: {self.files_scanned}")
+        print(f"   Files unchanged: {self.files_unchanged}")
+        print(f"   Files removed: {self.files_removed}")
+
+    def show_query(self, emoji: Optional[str] = None, category: Optional[str] = None,
+                   under: Optional[Path] = None, count: bool = False, top: Optional[int] = None):
+        """Print matching occurrences grep-style, or per-emoji counts."""
+        def display(path: str) -> str:
+            try:
+                return os.path.relpath(path)
+            except ValueError:
+                return path
+
+        if count:
+            rows = self.counts(emoji, category, under, top)
+            total = sum(row[2] for row in rows)
+            for emoji_found, category_found, occurrences, files in rows:
+                print(f"{emoji_found}\t{occurrences}\t{files} files\t{category_found}")
+            print(f"Total: {total}")
+            return
+        for path, line, col, emoji_found, category_found in self.find(emoji, category, under, top):
+            print(f"{display(path)}:{line}:{col}: {emoji_found} ({category_found})")
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse a 1-based shard spec like "2/4" into (index, count)."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', expected I/N (e.g. 1/4)")
+    if count < 1 or not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"invalid shard '{value}', I must be between 1 and N")
+    return index, count
+
+
+def parse_rate(value: str) -> float:
+    """Parse a byte rate like 512K or 20M (powers of 1024) into bytes per second."""
+    units = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+    number = value.strip().upper().rstrip("B")
+    unit = number[-1:] if number[-1:] in units else ""
+    try:
+        return float(number[:len(number) - len(unit)]) * units[unit]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid rate '{value}', expected a number with an optional K, M or G suffix")
+
+
+class ShardSelector:
+    """
+    Deterministically split a file set across N independent invocations.
+    
+    By default each file goes to the shard given by a stable hash of its path
+    relative to the root, so the split is the same on every machine and files
+    are assigned without looking at the rest of the tree. With weighting by
+    size, all candidate files are first listed and assigned largest-first to
+    the least loaded shard, which balances bytes rather than file counts.
+    """
+    
+    def __init__(self, index: int, count: int, by_size: bool = False):
+        self.index = index
+        self.count = count
+        self.by_size = by_size
+    
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+    
+    @staticmethod
+    def _key(path: Path, root: Path) -> str:
+        """Path key that is identical regardless of where the tree is checked out."""
+        try:
+            return path.relative_to(root).as_posix()
+        except ValueError:
+            return path.as_posix()
+    
+    def shard_of(self, path: Path, root: Path) -> int:
+        """Return the 1-based shard a path belongs to by hash."""
+        digest = hashlib.blake2b(self._key(path, root).encode("utf-8", "surrogateescape"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % self.count + 1
+    
+    def select(self, paths: Iterable[Path], root: Path) -> Iterator[Path]:
+        """Yield only the paths that belong to this shard."""
+        if not self.by_size:
+            for path in paths:
+                if self.shard_of(path, root) == self.index:
+                    yield path
+            return
+        
+        sized = []
+        for path in paths:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = 0
+            sized.append((size, self._key(path, root), path))
+        
+        # Longest-processing-time-first onto the least loaded shard; deterministic given the same tree
+        loads = [(0, shard) for shard in range(1, self.count + 1)]
+        sized.sort(key=lambda entry: (-entry[0], entry[1]))
+        mine = []
+        for size, key, path in sized:
+            load, shard = heapq.heappop(loads)
+            heapq.heappush(loads, (load + size, shard))
+            if shard == self.index:
+                mine.append((key, path))
+        for key, path in sorted(mine):
+            yield path
+
+
+def _format_bytes(size: float) -> str:
+    """Human-readable byte count."""
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(size) < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _format_seconds(seconds: float) -> str:
+    """Human-readable duration."""
+    seconds = max(seconds, 0.0)
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m" if hours else f"{minutes}m {seconds:02d}s"
+
+
+class TreeEstimator:
+    """
+    Estimate what a run would change from a stratified random sample of files.
+
+    Files are grouped into strata by top-level directory and extension, which
+    only needs directory listings, not stats or reads. Listing keeps a count
+    and a bounded reservoir of paths per stratum. Once LIST_BUDGET files are
+    listed (and again whenever that count doubles), only SUBTREE_KEEP of the
+    directories still waiting to be listed are walked, and their files count
+    1 / SUBTREE_KEEP times, so huge trees are not walked in full. A sample of
+    at most sample_size files is spread over the strata in proportion to their
+    size, two per stratum first where possible so each stratum's variance can
+    be estimated; the smallest strata are merged until those pairs take at
+    most half the sample. Only sampled files are read, decoded and scanned, exactly as a run
+    would. Totals use the stratified estimator with finite population
+    correction and a normal 95% confidence interval.
+    """
+
+    Z_95 = 1.96
+    METRICS = ("changed", "changed_bytes", "emojis", "bytes", "seconds")
+    LIST_BUDGET = 100_000
+    SUBTREE_KEEP = 0.25
+    MERGED = ("*", "*")
+
+    def __init__(self, root: Path, substitution_handler: Optional[EmojiSubstitution] = None,
+                 sample_size: int = 400, seed: Optional[int] = None):
+        self.root = root
+        self.substitution_handler = substitution_handler or EmojiSubstitution()
+        self.sample_size = sample_size
+        self.random = random.Random(seed)
+        self.strata: Dict[Tuple[str, str], float] = {}  # stratum -> (estimated) number of files
+        self.reservoirs: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}  # stratum -> heap of (key, path)
+        self.samples: Dict[Tuple[str, str], List[Tuple[float, ...]]] = {}
+        self.list_seconds = 0.0
+        self.listed = 0
+        self.thinned = False
+
+    @property
+    def population(self) -> int:
+        """Number of code files in the tree (estimated if the listing was thinned)."""
+        return round(sum(self.strata.values()))
+
+    @property
+    def sampled(self) -> int:
+        """Number of files read and scanned."""
+        return sum(len(values) for values in self.samples.values())
+
+    def _add(self, key: Tuple[str, str], path: str, weight: float):
+        """Count a listed file and offer it to its stratum's reservoir."""
+        self.strata[key] = self.strata.get(key, 0.0) + weight
+        # Weighted reservoir sampling (Efraimidis-Spirakis): keep the largest random() ** (1 / weight)
+        entry = (self.random.random() ** (1 / weight), path)
+        reservoir = self.reservoirs.setdefault(key, [])
+        if len(reservoir) < self.sample_size:
+            heapq.heappush(reservoir, entry)
+        elif entry > reservoir[0]:
+            heapq.heapreplace(reservoir, entry)
+
+    def _list(self):
+        """Count code files per stratum using directory listings only, thinning huge trees."""
+        started = time.perf_counter()
+        pending = [(str(self.root), None, 1.0)]  # directory, top-level directory, weight
+        next_thinning = self.LIST_BUDGET
+        while pending:
+            if self.listed >= next_thinning:
+                # Directories still waiting are disjoint subtrees: keep a random share, weighted up
+                pending = [(directory, top, weight / self.SUBTREE_KEEP) for directory, top, weight in pending
+                           if self.random.random() < self.SUBTREE_KEEP]
+                next_thinning *= 2
+                self.thinned = True
+                continue
+            directory, top, weight = pending.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    entries = list(entries)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        # Like os.walk, symlinked directories are not followed
+                        if not entry.is_symlink():
+                            pending.append((entry.path, top or entry.name, weight))
+                        continue
+                except OSError:
+                    continue
+                extension = os.path.splitext(entry.name)[1]
+                if extension in CODE_EXTENSIONS:
+                    self.listed += 1
+                    self._add((top or ".", extension), entry.path, weight)
+        self.list_seconds = time.perf_counter() - started
+
+    def _merge_small_strata(self):
+        """Merge the smallest strata into one until two files from each take at most half the sample."""
+        limit = max(1, self.sample_size // 4)
+        if len(self.strata) <= limit:
+            return
+        small = sorted(self.strata, key=lambda key: (self.strata[key], key))[:len(self.strata) - limit + 1]
+        merged = 0.0
+        reservoir: List[Tuple[float, str]] = []
+        for key in small:
+            merged += self.strata.pop(key)
+            reservoir.extend(self.reservoirs.pop(key))
+        # The largest keys of the union are a weighted sample of the union
+        self.strata[self.MERGED] = merged
+        self.reservoirs[self.MERGED] = heapq.nlargest(self.sample_size, reservoir)
+
+    def _allocate(self) -> Dict[Tuple[str, str], int]:
+        """Proportional allocation of at most sample_size files, two per stratum first when available."""
+        floor = 2 if self.sample_size >= 2 * len(self.strata) else 1
+        allocation = {key: min(len(self.reservoirs[key]), floor) for key in self.strata}
+        budget = self.sample_size - sum(allocation.values())
+        population = sum(self.strata.values())
+        # Largest remainder: whole shares first, then the biggest fractions, never beyond a stratum's files
+        shares = {key: budget * count / population for key, count in self.strata.items()}
+        for key, share in shares.items():
+            extra = min(int(share), len(self.reservoirs[key]) - allocation[key])
+            allocation[key] += extra
+            budget -= extra
+        for key in sorted(shares, key=lambda key: (int(shares[key]) - shares[key], key)):
+            if budget <= 0:
+                break
+            if allocation[key] < len(self.reservoirs[key]):
+                allocation[key] += 1
+                budget -= 1
+        return allocation
+
+    def _measure(self, path: str) -> Tuple[float, ...]:
+        """Read, decode and scan one file as a run would; returns one value per METRICS entry."""
+        handler = self.substitution_handler
+        started = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            content = data.decode("utf-8")
+        except (OSError, UnicodeDecodeError):
+            return (0, 0, 0, 0, time.perf_counter() - started)
+        if handler.plain_removal:
+            remove_emojis_fast(content, handler.rules.tables)
+            seconds = time.perf_counter() - started
+            spans = handler._find_emoji_spans(content)
+        else:
+            spans = handler._find_emoji_spans(content)
+            seconds = time.perf_counter() - started
+        # A span is a run of adjacent emojis; count every character, as RunMetrics.record_emojis does
+        emojis = sum(end - start for start, end in spans)
+        changed = 1 if emojis else 0
+        return (changed, len(data) * changed, emojis, len(data), seconds)
+
+    def run(self):
+        """List the tree, then draw and measure the sample."""
+        self._list()
+        if not self.strata:
+            return
+        self._merge_small_strata()
+        # The scanner's tables are built on first use, which a run pays for once, not per file
+        remove_emojis_fast("\u2705", self.substitution_handler.rules.tables)
+        self.substitution_handler._find_emoji_spans("\u2705")
+        for key, size in self._allocate().items():
+            if size:
+                self.samples[key] = [self._measure(path) for _, path in heapq.nlargest(size, self.reservoirs[key])]
+
+    def estimate(self, metric: str) -> Tuple[float, float]:
+        """Return (estimated total, 95% confidence half-width) for one metric over the whole tree."""
+        column = self.METRICS.index(metric)
+        all_values = [values[column] for samples in self.samples.values() for values in samples]
+        pooled = _variance(all_values)
+        total = 0.0
+        variance = 0.0
+        for key, samples in self.samples.items():
+            population = self.strata[key]
+            values = [entry[column] for entry in samples]
+            n = len(values)
+            total += population * sum(values) / n
+            if n < population:
+                # Strata with a single sample borrow the pooled variance
+                stratum_variance = _variance(values) if n > 1 else pooled
+                variance += population * population * (1 - n / population) * stratum_variance / n
+        return total, self.Z_95 * variance ** 0.5
+
+    def show(self):
+        """Print the estimates with their confidence intervals."""
+        population = self.population
+        print(f"\nEstimate for {self.root}:")
+        print(f"   Files: {population} in {len(self.strata)} strata (listed in {_format_seconds(self.list_seconds)})")
+        if self.thinned:
+            print(f"   Listing: {self.listed} files listed, the rest of the tree estimated from a sample of its "
+                  f"directories (not included in the intervals)")
+        if not population:
+            print("\033[34mℹ No supported files found.\033[0m")
+            return
+        print(f"   Sampled: {self.sampled} files")
+
+        changed, changed_margin = self.estimate("changed")
+        changed_bytes, changed_bytes_margin = self.estimate("changed_bytes")
+        emojis, emojis_margin = self.estimate("emojis")
+        total_bytes, total_bytes_margin = self.estimate("bytes")
+        seconds, seconds_margin = self.estimate("seconds")
+        print(f"   Files that would change: {changed:.0f} ± {changed_margin:.0f} "
+              f"({100 * changed / population:.1f}% ± {100 * changed_margin / population:.1f}%)")
+        print(f"   Bytes in those files: {_format_bytes(changed_bytes)} ± {_format_bytes(changed_bytes_margin)}")
+        print(f"   Emojis: {emojis:.0f} ± {emojis_margin:.0f}")
+        print(f"   Total size: {_format_bytes(total_bytes)} ± {_format_bytes(total_bytes_margin)}")
+        print(f"   Projected runtime: {_format_seconds(self.list_seconds + seconds)} ± {_format_seconds(seconds_margin)} "
+              f"(sequential, excluding writes)")
+        print("   Intervals are 95% confidence.")
+
+
+def _variance(values: List[float]) -> float:
+    """Unbiased sample variance (0 for fewer than two values)."""
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean = sum(values) / n
+    return sum((value - mean) ** 2 for value in values) / (n - 1)
+
+
+class EmojiHistogram:
+    """
+    Count emoji codepoints by EmojiLUT.categorize_emoji category, in total and per file.
+    
+    Counts cover the same codepoints the scanner replaces (everything
+    is_emoji_for_replacement accepts). When NumPy is installed, decoded text is
+    turned into a uint32 codepoint array and classified in bulk through a
+    category lookup table indexed by codepoint; otherwise runs of counted
+    characters are found with one regex and only their distinct characters are
+    looked up. Both paths give identical counts. Files without a possible
+    emoji lead byte are never decoded.
+    """
+    
+    def __init__(self, use_numpy: Optional[bool] = None):
+        """
+        Args:
+            use_numpy: True to require NumPy, False to never use it, None to use it when installed
+        """
+        self.char_categories = replacement_char_categories()
+        self.categories = emoji_categories()
+        self.pattern = re.compile(f"[{char_class(self.char_categories)}]+")
+        self.totals: Counter = Counter()
+        self.files: Dict[str, Counter] = {}
+        self.files_scanned = 0
+        self.bytes_scanned = 0
+        self.seconds = 0.0
+        
+        self.numpy = None
+        self.table = None
+        if use_numpy is not False:
+            try:
+                import numpy
+            except ImportError:
+                if use_numpy:
+                    raise
+            else:
+                # Category index + 1 per codepoint, 0 for everything that is not counted
+                index = {category: i + 1 for i, category in enumerate(self.categories)}
+                codepoints = numpy.array([ord(char) for char in self.char_categories], dtype=numpy.uint32)
+                ids = numpy.array([index[category] for category in self.char_categories.values()], dtype=numpy.uint8)
+                self.table = numpy.zeros(sys.maxunicode + 1, dtype=numpy.uint8)
+                self.table[codepoints] = ids
+                self.numpy = numpy
+    
+    @property
+    def engine(self) -> str:
+        """Name of the classification path in use."""
+        return "numpy" if self.numpy is not None else "python"
+    
+    def count(self, text: str) -> Counter:
+        """Return emoji codepoint counts by category for one text."""
+        if self.numpy is not None:
+            return self._count_numpy(text)
+        return self._count_python(text)
+    
+    def _count_numpy(self, text: str) -> Counter:
+        numpy = self.numpy
+        codepoints = numpy.frombuffer(text.encode("utf-32-le", "surrogatepass"), dtype="<u4")
+        ids = self.table[codepoints]
+        ids = ids[ids != 0]
+        counts = Counter()
+        if ids.size:
+            for i, count in enumerate(numpy.bincount(ids, minlength=len(self.categories) + 1)[1:].tolist()):
+                if count:
+                    counts[self.categories[i]] = count
+        return counts
+    
+    def _count_python(self, text: str) -> Counter:
+        counts = Counter()
+        for char, count in Counter("".join(self.pattern.findall(text))).items():
+            counts[self.char_categories[char]] += count
+        return counts
+    
+    def add_file(self, path: Path, label: Optional[str] = None):
+        """Read one file and add its counts; files that are not UTF-8 text are skipped."""
+        started = time.perf_counter()
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return
+        self.files_scanned += 1
+        self.bytes_scanned += len(data)
+        if EMOJI_LEAD_BYTES.search(data) is not None:
+            try:
+                counts = self.count(data.decode("utf-8"))
+            except UnicodeDecodeError:
+                counts = Counter()
+            if counts:
+                self.files[label or str(path)] = counts
+                self.totals.update(counts)
+        self.seconds += time.perf_counter() - started
+    
+    def run(self, root: Path):
+        """Count every code file under root (or a single file)."""
+        paths = [root] if root.is_file() else iter_code_files(root)
+        for path in paths:
+            self.add_file(path)
+    
+    def show(self, top: Optional[int] = None):
+        """Print the histogram by category and the files with the most emojis."""
+        rate = self.bytes_scanned / self.seconds if self.seconds else 0.0
+        print(f"\nEmoji statistics ({self.engine} engine):")
+        print(f"   Files scanned: {self.files_scanned} ({_format_bytes(self.bytes_scanned)}, "
+              f"{_format_bytes(rate)}/s)")
+        total = sum(self.totals.values())
+        print(f"   Emoji codepoints: {total} in {len(self.files)} files")
+        if not total:
+            return
+        print("   By category:")
+        for category, count in self.totals.most_common():
+            print(f"      {category}: {count} ({100 * count / total:.1f}%)")
+        ranked = sorted(self.files.items(), key=lambda item: (-sum(item[1].values()), item[0]))
+        if top is not None:
+            ranked = ranked[:top]
+        print("   By file:")
+        for path, counts in ranked:
+            breakdown = ", ".join(f"{category} {count}" for category, count in counts.most_common())
+            print(f"      {path}: {sum(counts.values())} ({breakdown})")
+
+
+def run_mode(substitution_handler: EmojiSubstitution) -> str:
+    """Name of the processing mode a handler runs in, as recorded in reports."""
+    if substitution_handler.diff:
+        return "diff"
+    if substitution_handler.substitute:
+        return "substitute"
+    if substitution_handler.interactive:
+        return "interactive"
+    return "remove"
+
+
+def show_run_summary(files_processed: int, files_modified: int, substitution_handler: EmojiSubstitution,
+                     top: Optional[int] = None):
+    """Print the end-of-run summary for the handler's mode."""
+    print(f"\nSummary:")
+    print(f"   Files processed: {files_processed}")
+    if substitution_handler.diff:
+        print(f"   Files that would be modified: {files_modified}")
+    else:
+        print(f"   Files modified: {files_modified}")
+    if substitution_handler.dedup is not None:
+        substitution_handler.dedup.show_summary()
+    if substitution_handler.throttle is not None:
+        substitution_handler.throttle.show_summary()
+    
+    # Show appropriate summary based on mode
+    if substitution_handler.diff:
+        pass
+    elif substitution_handler.substitute:
+        substitution_handler.show_substitution_summary(top)
+    elif substitution_handler.interactive:
+        substitution_handler.show_emoji_suggestions()
+    else:
+        if files_modified > 0:
+            print(f"\033[32m✓ Successfully removed emojis from {files_modified} files!\033[0m")
+        else:
+            print("\033[34mℹ No files were modified.\033[0m")
+
+
+def run_report(files_processed: int, files_modified: int, substitution_handler: EmojiSubstitution,
+               shard: Optional[ShardSelector] = None) -> dict:
+    """JSON-serializable summary of a run (or one shard of it) that merge_reports can combine."""
+    report = {
+        "version": 1,
+        "mode": run_mode(substitution_handler),
+        "label": substitution_handler.label,
+        "shard": str(shard) if shard else None,
+        "files_processed": files_processed,
+        "files_modified": files_modified,
+        "substitutions": substitution_handler.summary.to_dict(),
+        "emojis_found": substitution_handler.emojis_found,
+    }
+    dedup = substitution_handler.dedup
+    if dedup is not None:
+        report["duplicates"] = {
+            "hard_links": dedup.hard_links_skipped,
+            "identical_contents": dedup.content_duplicates,
+        }
+    throttle = substitution_handler.throttle
+    if throttle is not None:
+        report["throttle"] = {"waited": throttle.waited, "min_scale": throttle.min_scale}
+    return report
+
+
+def write_run_report(path: Path, files_processed: int, files_modified: int,
+                     substitution_handler: EmojiSubstitution, shard: Optional[ShardSelector] = None):
+    """Write a JSON summary of a run (or one shard of it) that merge_run_reports can combine."""
+    report = run_report(files_processed, files_modified, substitution_handler, shard)
+    write_file_atomic(path, json.dumps(report, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+def merge_run_reports(paths: List[Path]) -> Tuple[int, int, EmojiSubstitution]:
+    """
+    Combine shard report files into the totals a single run would have produced.
+    
+    Returns:
+        Tuple of (files_processed, files_modified, handler holding the merged summaries)
+    """
+    reports = []
+    for path in paths:
+        with path.open("r", encoding="utf-8") as f:
+            reports.append(json.load(f))
+    return merge_reports(reports)
+
+
+def merge_reports(reports: List[dict]) -> Tuple[int, int, EmojiSubstitution]:
+    """Combine run_report dicts; see merge_run_reports."""
+    modes = {report["mode"] for report in reports}
+    if len(modes) != 1:
+        raise ValueError(f"Cannot merge reports from different modes: {', '.join(sorted(modes))}")
+    mode = modes.pop()
+    
+    substitution_handler = EmojiSubstitution(
+        substitute=mode == "substitute",
+        interactive=mode == "interactive",
+        label=any(report.get("label") for report in reports),
+        diff=mode == "diff",
+    )
+    files_processed = 0
+    files_modified = 0
+    for report in reports:
+        files_processed += report["files_processed"]
+        files_modified += report["files_modified"]
+        substitution_handler.summary.merge_dict(report.get("substitutions", {}))
+        for emoji, files in report.get("emojis_found", {}).items():
+            for file_path in files:
+                substitution_handler.record_found([emoji], file_path)
+        if "duplicates" in report:
+            if substitution_handler.dedup is None:
+                substitution_handler.dedup = FileDeduplicator()
+            substitution_handler.dedup.hard_links_skipped += report["duplicates"]["hard_links"]
+            substitution_handler.dedup.content_duplicates += report["duplicates"]["identical_contents"]
+        if "throttle" in report:
+            if substitution_handler.throttle is None:
+                substitution_handler.throttle = Throttle()
+            substitution_handler.throttle.waited += report["throttle"]["waited"]
+            substitution_handler.throttle.min_scale = min(substitution_handler.throttle.min_scale,
+                                                          report["throttle"]["min_scale"])
+    
+    return files_processed, files_modified, substitution_handler
+
+
+def _clean_shard(job: tuple) -> dict:
+    """Worker of clean_directory_processes: clean one shard and return its run report."""
+    root, shard, rules, options = job
+    substitution_handler = EmojiSubstitution(
+        interactive=options["interactive"],
+        writer=FileWriter(*options["writer"]),
+        dedup=FileDeduplicator() if options["dedup"] else None,
+        line_ranges=options["line_ranges"],
+        rules=rules,
+        quiet=options["quiet"],
+        throttle=Throttle(*options["throttle"]) if options["throttle"] else None
+    )
+    files_processed, files_modified = clean_directory(root, False, substitution_handler, shard=shard)
+    return run_report(files_processed, files_modified, substitution_handler, shard)
+
+
+def clean_directory_processes(root: Path, processes: int, rules: SubstitutionRules, interactive: bool = False,
+                              writer: tuple = ("overwrite", 0.25, "none", 64), dedup: bool = False,
+                              line_ranges: Optional[LineRangeSelector] = None, by_size: bool = False,
+                              throttle: Optional[Throttle] = None, quiet: bool = False) -> Tuple[int, int, EmojiSubstitution]:
+    """
+    Clean a directory with worker processes, one shard each.
+    
+    Scanning is CPU-bound Python, so threads share one core; processes do not.
+    The tables are published once to the cache directory and mapped by every
+    worker instead of being rebuilt per process. Workers are spawned rather
+    than forked, so they start the same way on every platform, and report
+    back as --report does, merged into a single summary.
+    
+    Args:
+        root: Root directory to scan
+        processes: Number of worker processes (and shards)
+        rules: Substitution settings, passed to the workers
+        interactive: Only collect emojis instead of modifying files
+        writer: FileWriter arguments (strategy, max_tail_fraction, durability, batch_size)
+        dedup: Skip hard links and identical contents within each worker's shard
+        line_ranges: Only clean these lines of each file
+        by_size: Balance shards by file size instead of hashing paths
+        throttle: Limits for the whole run, split evenly between the workers
+        quiet: Suppress per-emoji and "no emojis" messages in the workers
+        
+    Returns:
+        Tuple of (files_processed, files_modified, handler holding the merged summaries)
+    """
+    if rules.tables is None:
+        try:
+            tables = SharedTables(SharedTables.publish(user_cache_dir(), rules.color))
+            rules = SubstitutionRules(rules.substitute, rules.label, rules.color, rules.mapping, rules.matcher,
+                                      tables)
+        except (OSError, ValueError):
+            pass  # workers build their own tables; only startup and memory are affected
+    options = {"interactive": interactive, "writer": writer, "dedup": dedup, "line_ranges": line_ranges,
+               "throttle": throttle.split(processes) if throttle is not None else None, "quiet": quiet}
+    jobs = [(root, ShardSelector(index, processes, by_size), rules, options) for index in range(1, processes + 1)]
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        reports = pool.map(_clean_shard, jobs, chunksize=1)
+    return merge_reports(reports)
+
+
+def validate_no_emoji_in_substitutions():
+    """Validate that no emoji characters are used in any substitutions."""
+    violations = []
+    
+    # Check BASE_SUBSTITUTIONS
+    for emoji, substitution in BASE_SUBSTITUTIONS.items():
+        # Check each character in the substitution
+        for char in substitution:
+            if is_emoji_for_replacement(char):
+                violations.append(f"BASE_SUBSTITUTIONS['{emoji}'] = '{substitution}' contains emoji character '{char}'")
+                break
+    
+    # Check EMOTICON_MAPPING
+    for emoji, substitution in EMOTICON_MAPPING.items():
+        # Check each character in the substitution
+        for char in substitution:
+            if is_emoji_for_replacement(char):
+                violations.append(f"EMOTICON_MAPPING['{emoji}'] = '{substitution}' contains emoji character '{char}'")
+                break
+    
+    if violations:
+        print("VALIDATION FAILED: Emoji characters found in substitutions:")
+        for violation in violations:
+            print(f"  - {violation}")
+        return False
+    else:
+        print("VALIDATION PASSED: No emoji characters found in substitutions")
+        return True
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Remove emojis from code files in a project directory.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  emoji-nuker /path/to/project           # Remove all emojis from directory
+  emoji-nuker myfile.py                  # Remove emojis from single file
+  emoji-nuker .                          # Clean current directory
+  emoji-nuker --verbose /path            # Verbose output
+  emoji-nuker --substitute /path         # Replace emojis with smart Unicode alternatives
+  emoji-nuker --substitute --color /path # Replace with colored Unicode alternatives
+  emoji-nuker --interactive /path        # Show emoji suggestions without modifying files
+  emoji-nuker --label /path              # Replace emojis with a label like [emoji:U+XXXX] if no substitution exists
+  emoji-nuker --diff /path > emoji.patch # Preview changes as a unified diff without modifying files
+  emoji-nuker release.tar.gz             # Write a cleaned copy to release.cleaned.tar.gz
+  emoji-nuker --history /path/to/repo    # Audit emojis across the full git history
+  emoji-nuker --estimate /data/archive   # Estimate the changes from a sample of files
+  emoji-nuker --changed-since HEAD .     # Only clean lines changed since the last commit
+  git ls-files -z | emoji-nuker --files-from -  # Clean exactly the tracked files in one process
+  emoji-nuker --watch .                  # Keep a workspace clean as files change
+  emoji-nuker --processes 8 /path        # Clean a large tree on 8 cores
+  emoji-nuker --max-bytes-per-second 20M --cpu-limit 0.25 --backoff /srv  # Go easy on a busy host
+  emoji-nuker --index .emoji.db .        # Build or refresh a persistent emoji index
+  emoji-nuker --index .emoji.db --count --under docs  # Query it without rescanning
+        """
+    )
     
     parser.add_argument(
         "path",
         type=str,
-        help="Path to a file or directory to process"
+        nargs="?",
+        help="Path to a file, directory or archive (.tar, .tar.gz, .tgz, .zip) to process"
+    )
+    
+    parser.add_argument(
+        "--files-from",
+        type=str,
+        metavar="FILE",
+        help="Process the paths listed in FILE (- for stdin), NUL- or newline-delimited, instead of a path"
     )
     
     parser.add_argument(
@@ -792,6 +4434,12 @@ Examples:
         help="Enable verbose output"
     )
     
+    parser.add_argument(
+        "--quiet", "-q",
+        action="store_true",
+        help="Only report files that change, errors and the summary"
+    )
+    
     parser.add_argument(
         "--substitute", "-s",
         action="store_true",
@@ -816,6 +4464,279 @@ Examples:
         help="Use colored Unicode substitutions (ANSI color codes)"
     )
     
+    parser.add_argument(
+        "--mapping",
+        action="append",
+        metavar="FILE",
+        help="JSON or TOML file of emoji to replacement, merged over the built-in tables; "
+             "repeatable, later files win; implies --substitute"
+    )
+    
+    category_group = parser.add_mutually_exclusive_group()
+    category_group.add_argument(
+        "--only",
+        metavar="CATEGORIES",
+        help="Only strip emojis in these comma-separated EmojiLUT categories (e.g. emoticons,transport_map_symbols)"
+    )
+    category_group.add_argument(
+        "--keep",
+        metavar="CATEGORIES",
+        help="Strip every emoji except those in these comma-separated categories (e.g. regional_indicator)"
+    )
+    
+    parser.add_argument(
+        "--diff", "-d",
+        action="store_true",
+        help="Print a unified diff of the changes to stdout without modifying any files"
+    )
+    
+    parser.add_argument(
+        "--top",
+        type=int,
+        metavar="K",
+        help="Show only the K most frequent entries in each section of the substitution summary"
+    )
+    
+    parser.add_argument(
+        "--substitution-log",
+        type=str,
+        metavar="FILE",
+        help="Stream every individual substitution to FILE as NDJSON"
+    )
+    
+    parser.add_argument(
+        "--read-threads",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Prefetch files with N reader threads and write back in the background (default: 0, sequential)"
+    )
+    
+    parser.add_argument(
+        "--write-threads",
+        type=int,
+        default=2,
+        metavar="N",
+        help="Number of write-back threads used with --read-threads (default: 2)"
+    )
+    
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=64,
+        metavar="N",
+        help="Maximum files buffered between pipeline stages with --read-threads (default: 64)"
+    )
+    
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Clean a directory with N worker processes sharing memory-mapped tables (default: 0, in-process)"
+    )
+    
+    parser.add_argument(
+        "--write-strategy",
+        choices=FileWriter.STRATEGIES,
+        default="overwrite",
+        help="How cleaned files are written: overwrite the whole file, or rewrite only the tail from the first change (default: overwrite)"
+    )
+    
+    parser.add_argument(
+        "--max-tail-fraction",
+        type=float,
+        default=0.25,
+        metavar="F",
+        help="With --write-strategy tail, use an atomic temp file and rename when the tail exceeds F of the file size (default: 0.25)"
+    )
+    
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Clean the path, then keep watching it and re-clean files as they change (inotify, or polling elsewhere)"
+    )
+    
+    parser.add_argument(
+        "--watch-debounce",
+        type=float,
+        default=0.2,
+        metavar="S",
+        help="With --watch, wait until no change arrived for S seconds before cleaning a burst (default: 0.2)"
+    )
+    
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=2.0,
+        metavar="S",
+        help="With --watch, seconds between scans when inotify is unavailable (default: 2.0)"
+    )
+    
+    parser.add_argument(
+        "--durability",
+        choices=FileWriter.DURABILITY,
+        default="none",
+        help="Crash safety of writes: in place, atomic rename with fsync per file, or temp files committed in batches with grouped fsyncs (default: none)"
+    )
+    
+    parser.add_argument(
+        "--durability-batch",
+        type=int,
+        default=64,
+        metavar="N",
+        help="Files per commit with --durability batched (default: 64)"
+    )
+    
+    parser.add_argument(
+        "--max-bytes-per-second",
+        type=parse_rate,
+        metavar="RATE",
+        help="Limit bytes read and written per second, e.g. 20M (K, M and G suffixes)"
+    )
+    
+    parser.add_argument(
+        "--max-files-per-second",
+        type=float,
+        metavar="N",
+        help="Limit the number of files read per second"
+    )
+    
+    parser.add_argument(
+        "--cpu-limit",
+        type=float,
+        metavar="F",
+        help="Use at most fraction F of one CPU core, e.g. 0.25, pausing between files"
+    )
+    
+    parser.add_argument(
+        "--backoff",
+        action="store_true",
+        help="Slow down while read latency is well above its baseline, e.g. when the disk is busy"
+    )
+    
+    parser.add_argument(
+        "--metrics-file",
+        type=str,
+        metavar="FILE",
+        help="Write run metrics to FILE in Prometheus text format when the run finishes"
+    )
+    
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve run metrics at http://127.0.0.1:PORT/metrics while running"
+    )
+    
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Skip hard links to already processed files and scan identical file contents only once"
+    )
+    
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        metavar="I/N",
+        help="Only process shard I of N (1-based), split deterministically by a stable hash of each path"
+    )
+    
+    parser.add_argument(
+        "--shard-by-size",
+        action="store_true",
+        help="With --shard, balance shards by total file size instead of hashing paths"
+    )
+    
+    parser.add_argument(
+        "--report",
+        type=str,
+        metavar="FILE",
+        help="Write a JSON summary of the run to FILE (combine shard reports with --merge-reports)"
+    )
+    
+    parser.add_argument(
+        "--merge-reports",
+        nargs="+",
+        metavar="FILE",
+        help="Merge JSON reports written with --report and print the combined summary instead of processing a path"
+    )
+    
+    parser.add_argument(
+        "--lines",
+        type=parse_line_ranges,
+        metavar="RANGES",
+        help="Only clean these lines of each file, e.g. 10-20,35; the rest of the file is left untouched"
+    )
+    
+    parser.add_argument(
+        "--changed-since",
+        metavar="REV",
+        help="Only clean lines added or changed since git revision REV (e.g. HEAD or origin/main)"
+    )
+    
+    parser.add_argument(
+        "--history",
+        action="store_true",
+        help="Audit every commit of the git repository at path and report the first and last commit per emoji and file"
+    )
+    
+    parser.add_argument(
+        "--index",
+        metavar="DB",
+        help="Update the emoji index DB for path (only changed files are rescanned) and/or query it"
+    )
+    
+    parser.add_argument(
+        "--emoji",
+        metavar="EMOJI",
+        help="With --index, only list occurrences of EMOJI"
+    )
+    
+    parser.add_argument(
+        "--category",
+        metavar="NAME",
+        help="With --index, only list emojis in this category (e.g. emoticons, transport_map_symbols)"
+    )
+    
+    parser.add_argument(
+        "--under",
+        metavar="DIR",
+        help="With --index, only list occurrences in files under DIR"
+    )
+    
+    parser.add_argument(
+        "--count",
+        action="store_true",
+        help="With --index, print counts per emoji instead of each occurrence"
+    )
+    
+    parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="Estimate how many files, bytes and emojis a run would change from a stratified sample, without modifying files"
+    )
+    
+    parser.add_argument(
+        "--sample-size",
+        type=int,
+        default=400,
+        metavar="N",
+        help="Number of files to sample with --estimate (default: 400)"
+    )
+    
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Count emojis by Unicode category and per file without modifying files (uses NumPy when installed)"
+    )
+    
+    parser.add_argument(
+        "--output", "-o",
+        type=str,
+        help="Where to write the cleaned archive (default: NAME.cleaned.EXT next to the input)"
+    )
+    
     parser.add_argument(
         "--version",
         action="version",
@@ -824,49 +4745,234 @@ Examples:
     
     args = parser.parse_args()
     
-    # Validate path
-    target_path = Path(args.path)
+    if args.merge_reports:
+        try:
+            files_processed, files_modified, merged = merge_run_reports([Path(p) for p in args.merge_reports])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"\033[31m✗ Error: Could not merge reports: {e}\033[0m")
+            sys.exit(1)
+        show_run_summary(files_processed, files_modified, merged, args.top)
+        if args.report:
+            write_run_report(Path(args.report), files_processed, files_modified, merged)
+        return
+    
+    if args.index:
+        index = None
+        try:
+            index = EmojiIndex(Path(args.index))
+            if args.path is not None:
+                if not Path(args.path).exists():
+                    print(f"\033[31m✗ Error: Path does not exist: {args.path}\033[0m")
+                    sys.exit(1)
+                # Updating never modifies files, whatever mode flags are given
+                index.update(Path(args.path), EmojiSubstitution())
+                index.show_update()
+            if args.path is None or args.emoji or args.category or args.under or args.count:
+                index.show_query(args.emoji, args.category, Path(args.under) if args.under else None,
+                                 args.count, args.top)
+        except sqlite3.Error as e:
+            print(f"\033[31m✗ Error: Could not use index {args.index}: {e}\033[0m")
+            sys.exit(1)
+        finally:
+            if index is not None:
+                index.close()
+        return
+    
+    if args.files_from is not None:
+        if args.path is not None:
+            parser.error("--files-from cannot be combined with a path")
+        if args.history or args.estimate or args.stats:
+            parser.error("--files-from cannot be combined with --history, --estimate or --stats")
+    elif args.path is None:
+        parser.error("the following arguments are required: path")
+    
+    # Validate path; listed paths are relative to the working directory
+    target_path = Path(args.path) if args.path is not None else Path.cwd()
     if not target_path.exists():
         print(f"\033[31m✗ Error: Path does not exist: {target_path}\033[0m")
         sys.exit(1)
     
+    if args.sample_size < 1:
+        parser.error("--sample-size must be at least 1")
+    if args.lines and args.changed_since:
+        parser.error("--lines and --changed-since cannot be combined")
+    is_archive = target_path.is_file() and archive_suffix(target_path) is not None
+    if (args.lines or args.changed_since) and (args.history or is_archive):
+        parser.error("--lines and --changed-since only apply to files and directories")
+    if is_archive and (args.dedup or args.max_bytes_per_second or args.max_files_per_second
+                       or args.cpu_limit or args.backoff):
+        parser.error("--dedup, --max-bytes-per-second, --max-files-per-second, --cpu-limit and --backoff "
+                     "do not apply to archives")
+    if args.watch and (args.history or args.estimate or args.stats or args.files_from is not None
+                       or args.interactive or args.diff or is_archive):
+        parser.error("--watch only applies to cleaning files and directories in place")
+    if args.watch_debounce < 0 or args.watch_interval <= 0:
+        parser.error("--watch-debounce must not be negative and --watch-interval must be positive")
+    if args.durability != "none" and args.write_strategy == "tail":
+        parser.error("--durability cannot be combined with --write-strategy tail, which rewrites files in place")
+    if args.durability_batch < 1:
+        parser.error("--durability-batch must be at least 1")
+    for name, value in (("--max-bytes-per-second", args.max_bytes_per_second),
+                        ("--max-files-per-second", args.max_files_per_second)):
+        if value is not None and value <= 0:
+            parser.error(f"{name} must be positive")
+    if args.cpu_limit is not None and not 0 < args.cpu_limit <= 1:
+        parser.error("--cpu-limit must be between 0 and 1")
+    if args.processes < 0:
+        parser.error("--processes must not be negative")
+    if args.processes and (not target_path.is_dir() or args.files_from is not None or args.history or args.estimate
+                           or args.stats or args.watch or args.shard or args.diff or args.substitution_log
+                           or args.metrics_file or args.metrics_port or args.read_threads):
+        parser.error("--processes only applies to cleaning a directory and cannot be combined with --shard, "
+                     "--diff, --substitution-log, --read-threads or metrics")
+    
+    line_ranges = LineRangeSelector(args.lines) if args.lines else None
+    if args.changed_since:
+        try:
+            line_ranges = LineRangeSelector.from_git(target_path, args.changed_since)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"\033[31m✗ Error: Could not diff against {args.changed_since}: {e}\033[0m")
+            sys.exit(1)
+    
+    # User mappings are compiled once into a longest-match trie, cached on disk by content hash
+    mapping = None
+    if args.mapping:
+        try:
+            mapping = SubstitutionTrie.load([Path(p) for p in args.mapping], user_cache_dir())
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            print(f"\033[31m✗ Error: Could not load mapping: {e}\033[0m")
+            sys.exit(1)
+    
+    # Category selections are compiled into one matcher, cached in memory and on disk
+    matcher = None
+    if args.only or args.keep:
+        if mapping is not None:
+            parser.error("--only and --keep cannot be combined with --mapping")
+        try:
+            selection = CategoryMatcher.select(args.only.split(",") if args.only else None,
+                                               args.keep.split(",") if args.keep else None)
+        except ValueError as e:
+            parser.error(str(e))
+        matcher = CategoryMatcher.compile(selection, user_cache_dir())
+    rules = SubstitutionRules(args.substitute or mapping is not None, args.label, args.color, mapping, matcher)
+    
+    # Stream individual substitutions to a file instead of keeping them in memory
+    occurrence_sink = open(args.substitution_log, "w", encoding="utf-8") if args.substitution_log else None
+    
+    # Collect metrics only when they will be exported
+    metrics = RunMetrics() if (args.metrics_file or args.metrics_port) else None
+    if metrics is not None and args.metrics_port:
+        metrics.serve(args.metrics_port)
+    
+    throttle = None
+    if args.max_bytes_per_second or args.max_files_per_second or args.cpu_limit or args.backoff:
+        throttle = Throttle(args.max_bytes_per_second, args.max_files_per_second, args.cpu_limit, args.backoff)
+    
     # Create substitution handler
     substitution_handler = EmojiSubstitution(
-        substitute=args.substitute,
         interactive=args.interactive,
-        label=args.label,
-        color=args.color
+        diff=args.diff,
+        occurrence_sink=occurrence_sink,
+        writer=FileWriter(args.write_strategy, args.max_tail_fraction, args.durability, args.durability_batch),
+        metrics=metrics,
+        dedup=FileDeduplicator() if args.dedup else None,
+        line_ranges=line_ranges,
+        rules=rules,
+        quiet=args.quiet,
+        throttle=throttle
     )
     
+    # In diff mode stdout carries only the patch; progress messages go to stderr
+    if args.diff:
+        sys.stdout = sys.stderr
+    
     # Process files
     try:
-        if target_path.is_file():
-            # Process single file
-            if target_path.suffix in CODE_EXTENSIONS:
-                files_processed = 1
-                files_modified = 1 if remove_emojis_from_file(target_path, substitution_handler) else 0
+        if args.history:
+            # Scan committed blobs instead of the working tree; nothing is modified
+            if target_path.is_dir():
+                audit = GitHistoryAudit(target_path, substitution_handler)
             else:
-                print(f"\033[33m⚠ Skipping unsupported file type: {target_path}\033[0m")
-                files_processed = 0
-                files_modified = 0
+                audit = GitHistoryAudit(target_path.parent, substitution_handler, target_path.name)
+            try:
+                audit.run()
+            except (OSError, subprocess.CalledProcessError) as e:
+                print(f"\033[31m✗ Error: Could not read git history: {e}\033[0m")
+                sys.exit(1)
+            audit.show(args.top)
+            return
+        elif args.estimate:
+            # Sample the tree instead of processing it; nothing is modified
+            estimator = TreeEstimator(target_path, substitution_handler, args.sample_size)
+            estimator.run()
+            estimator.show()
+            return
+        elif args.stats:
+            # Histogram only; nothing is modified
+            histogram = EmojiHistogram()
+            histogram.run(target_path)
+            histogram.show(args.top)
+            return
+        elif args.watch:
+            # Full pass, then incremental re-cleaning until Ctrl-C
+            watcher = TreeWatcher(target_path, substitution_handler, args.watch_debounce, args.watch_interval)
+            signal.signal(signal.SIGTERM, signal.default_int_handler)  # stop like Ctrl-C under a service manager
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                print("\n\033[34mℹ Stopped watching\033[0m")
+            files_processed, files_modified = watcher.files_processed, watcher.files_modified
+        elif args.files_from is not None:
+            # Stream the listed paths through one pipeline; unsupported files are skipped quietly
+            engine = None
+            if args.read_threads > 0:
+                engine = PipelinedCleaner(substitution_handler, args.read_threads, args.write_threads, args.queue_size)
+            shard = ShardSelector(*args.shard, by_size=args.shard_by_size) if args.shard else None
+            pipeline = build_clean_pipeline(target_path, substitution_handler, engine, shard)
+            pipeline.replace("walk", WalkStage(metrics, warn_unsupported=False))
+            listing = sys.stdin.buffer
+            if args.files_from != "-":
+                try:
+                    listing = open(args.files_from, "rb")
+                except OSError as e:
+                    print(f"\033[31m✗ Error: Could not read path list {args.files_from}: {e}\033[0m")
+                    sys.exit(1)
+            try:
+                files_processed, files_modified = pipeline.run(read_path_list(listing))
+            finally:
+                if listing is not sys.stdin.buffer:
+                    listing.close()
+        elif target_path.is_file() and archive_suffix(target_path):
+            # Process archive members without extracting; interactive mode only scans
+            output_path = None
+            if not (args.interactive or args.diff):
+                output_path = Path(args.output) if args.output else default_archive_output(target_path)
+            files_processed, files_modified = clean_archive(target_path, output_path, substitution_handler)
+            if output_path:
+                print(f"\033[32m✓ Wrote cleaned archive: {output_path}\033[0m")
+        elif target_path.is_file():
+            # Process single file: walk (extension check) -> read -> scan -> write
+            pipeline = Pipeline([("walk", WalkStage(metrics))] + cleaning_stages(substitution_handler))
+            files_processed, files_modified = pipeline.run([target_path])
+        elif args.processes:
+            # Process directory in worker processes, one shard each
+            files_processed, files_modified, substitution_handler = clean_directory_processes(
+                target_path, args.processes, rules, args.interactive,
+                (args.write_strategy, args.max_tail_fraction, args.durability, args.durability_batch),
+                args.dedup, line_ranges, args.shard_by_size, throttle, args.quiet)
         else:
             # Process directory
-            files_processed, files_modified = clean_directory(target_path, args.verbose, substitution_handler)
+            engine = None
+            if args.read_threads > 0:
+                engine = PipelinedCleaner(substitution_handler, args.read_threads, args.write_threads, args.queue_size)
+            shard = ShardSelector(*args.shard, by_size=args.shard_by_size) if args.shard else None
+            files_processed, files_modified = clean_directory(target_path, args.verbose, substitution_handler,
+                                                              engine, shard)
         
-        print(f"\nSummary:")
-        print(f"   Files processed: {files_processed}")
-        print(f"   Files modified: {files_modified}")
-        
-        # Show appropriate summary based on mode
-        if args.substitute:
-            substitution_handler.show_substitution_summary()
-        elif args.interactive:
-            substitution_handler.show_emoji_suggestions()
-        else:
-            if files_modified > 0:
-                print(f"\033[32m✓ Successfully removed emojis from {files_modified} files!\033[0m")
-            else:
-                print("\033[34mℹ No files were modified.\033[0m")
+        show_run_summary(files_processed, files_modified, substitution_handler, args.top)
+        if args.report:
+            write_run_report(Path(args.report), files_processed, files_modified, substitution_handler,
+                             ShardSelector(*args.shard) if args.shard else None)
             
     except KeyboardInterrupt:
         print("\n\033[33m⚠ Operation cancelled by user\033[0m")
@@ -874,6 +4980,11 @@ Examples:
     except Exception as e:
         print(f"\033[31m✗ Unexpected error: {e}\033[0m")
         sys.exit(1)
+    finally:
+        if occurrence_sink:
+            occurrence_sink.close()
+        if metrics is not None and args.metrics_file:
+            metrics.write(Path(args.metrics_file))
 
 
 if __name__ == "__main__":